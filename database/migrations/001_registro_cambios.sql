@@ -0,0 +1,50 @@
+-- ============================================
+-- MIGRACIÓN 001: REGISTRO DE CAMBIOS (CHANGE FEED)
+-- ============================================
+-- Cada INSERT/UPDATE/DELETE sobre equipos, mantenimientos y notificaciones
+-- deja una fila en registro_cambios. El id (BIGSERIAL) es el token
+-- monótono que usan los endpoints /changes para la sincronización incremental.
+
+CREATE TABLE IF NOT EXISTS registro_cambios (
+    id BIGSERIAL PRIMARY KEY,
+    tabla VARCHAR(50) NOT NULL,
+    registro_id INTEGER NOT NULL,
+    operacion VARCHAR(10) NOT NULL,
+    fecha_cambio TIMESTAMP DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_registro_cambios_tabla ON registro_cambios(tabla, id);
+
+-- Función genérica para registrar cambios
+CREATE OR REPLACE FUNCTION registrar_cambio()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO registro_cambios (tabla, registro_id, operacion)
+        VALUES (TG_TABLE_NAME, OLD.id, TG_OP);
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO registro_cambios (tabla, registro_id, operacion)
+    VALUES (TG_TABLE_NAME, NEW.id, TG_OP);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_cambios_equipos ON equipos;
+CREATE TRIGGER trigger_cambios_equipos
+AFTER INSERT OR UPDATE OR DELETE ON equipos
+FOR EACH ROW
+EXECUTE FUNCTION registrar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_cambios_mantenimientos ON mantenimientos;
+CREATE TRIGGER trigger_cambios_mantenimientos
+AFTER INSERT OR UPDATE OR DELETE ON mantenimientos
+FOR EACH ROW
+EXECUTE FUNCTION registrar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_cambios_notificaciones ON notificaciones;
+CREATE TRIGGER trigger_cambios_notificaciones
+AFTER INSERT OR UPDATE OR DELETE ON notificaciones
+FOR EACH ROW
+EXECUTE FUNCTION registrar_cambio();
@@ -0,0 +1,88 @@
+-- ============================================
+-- MIGRACIÓN 002: BÚSQUEDA DE TEXTO Y DIFUSA SOBRE EQUIPOS
+-- ============================================
+-- Índices trigram (pg_trgm) y de texto completo (tsvector) sobre nombre,
+-- marca, modelo, número de serie, código de inventario y los valores de
+-- especificaciones. La función buscar_equipos se expone vía RPC.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Valores de especificaciones como texto plano.
+-- Algunos registros guardan el JSON como string (json.dumps desde el servicio).
+CREATE OR REPLACE FUNCTION especificaciones_texto(especificaciones JSONB)
+RETURNS TEXT AS $$
+    SELECT CASE jsonb_typeof(especificaciones)
+        WHEN 'object' THEN (
+            SELECT COALESCE(string_agg(valor, ' '), '')
+            FROM jsonb_each_text(especificaciones) AS t(clave, valor)
+        )
+        WHEN 'string' THEN especificaciones #>> '{}'
+        ELSE ''
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Texto normalizado que alimenta ambos índices
+-- (una columna generada no puede referenciar a otra, por eso se usa una función)
+CREATE OR REPLACE FUNCTION equipos_texto_busqueda(
+    nombre TEXT, marca TEXT, modelo TEXT, numero_serie TEXT,
+    codigo_inventario TEXT, especificaciones JSONB
+)
+RETURNS TEXT AS $$
+    SELECT lower(concat_ws(' ', nombre, marca, modelo, numero_serie, codigo_inventario,
+                           especificaciones_texto(especificaciones)));
+$$ LANGUAGE sql IMMUTABLE;
+
+ALTER TABLE equipos ADD COLUMN IF NOT EXISTS texto_busqueda TEXT
+GENERATED ALWAYS AS (
+    equipos_texto_busqueda(nombre, marca, modelo, numero_serie, codigo_inventario, especificaciones)
+) STORED;
+
+ALTER TABLE equipos ADD COLUMN IF NOT EXISTS documento_busqueda TSVECTOR
+GENERATED ALWAYS AS (
+    to_tsvector('simple', equipos_texto_busqueda(nombre, marca, modelo, numero_serie, codigo_inventario, especificaciones))
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_equipos_busqueda_trgm ON equipos USING GIN (texto_busqueda gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_equipos_busqueda_fts ON equipos USING GIN (documento_busqueda);
+
+-- Búsqueda paginada con ranking y resaltado
+CREATE OR REPLACE FUNCTION buscar_equipos(termino TEXT, limite INTEGER DEFAULT 20, desplazamiento INTEGER DEFAULT 0)
+RETURNS TABLE (
+    id INTEGER,
+    codigo_inventario VARCHAR,
+    nombre VARCHAR,
+    marca VARCHAR,
+    modelo VARCHAR,
+    numero_serie VARCHAR,
+    estado_operativo VARCHAR,
+    puntaje REAL,
+    resaltado TEXT,
+    total BIGINT
+) AS $$
+    WITH consulta AS (
+        SELECT lower(termino) AS texto, plainto_tsquery('simple', termino) AS tsq
+    ),
+    candidatos AS (
+        SELECT e.*,
+               GREATEST(
+                   word_similarity(c.texto, e.texto_busqueda),
+                   ts_rank(e.documento_busqueda, c.tsq)
+               ) AS puntaje
+        FROM equipos e, consulta c
+        WHERE c.texto <% e.texto_busqueda
+           OR e.documento_busqueda @@ c.tsq
+    )
+    SELECT ca.id, ca.codigo_inventario, ca.nombre, ca.marca, ca.modelo,
+           ca.numero_serie, ca.estado_operativo, ca.puntaje::REAL,
+           ts_headline(
+               'simple',
+               concat_ws(' · ', ca.nombre, ca.marca, ca.modelo, ca.numero_serie, ca.codigo_inventario),
+               (SELECT tsq FROM consulta),
+               'StartSel=<mark>, StopSel=</mark>, HighlightAll=true'
+           ) AS resaltado,
+           COUNT(*) OVER () AS total
+    FROM candidatos ca
+    ORDER BY ca.puntaje DESC, ca.id
+    LIMIT limite OFFSET desplazamiento;
+$$ LANGUAGE sql STABLE
+SET pg_trgm.word_similarity_threshold = 0.4;
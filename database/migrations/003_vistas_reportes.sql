@@ -0,0 +1,10 @@
+-- ============================================
+-- MIGRACIÓN 003: ÍNDICE PARA AGREGACIONES DE MANTENIMIENTOS
+-- ============================================
+-- Los reportes de equipos se agrupan en el snapshot en memoria del servicio
+-- de reportes y el dashboard lee los agregados mantenidos por triggers
+-- (migraciones 004 y 013), así que esta migración no crea vistas de reporte.
+-- Queda el índice que cubre las agrupaciones por fecha de los mantenimientos
+-- (recálculos y reconciliación de los agregados diarios).
+
+CREATE INDEX IF NOT EXISTS idx_mantenimientos_fecha_costo ON mantenimientos(fecha_programada) INCLUDE (costo_total);
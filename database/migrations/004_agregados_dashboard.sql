@@ -0,0 +1,222 @@
+-- ============================================
+-- MIGRACIÓN 004: AGREGADOS MATERIALIZADOS DEL DASHBOARD
+-- ============================================
+-- Contadores mantenidos por triggers (a nivel de sentencia, con tablas de
+-- transición) para servir /dashboard en tiempo constante. La función
+-- reconciliar_agregados_dashboard compara contra un recálculo completo.
+
+-- Totales de inventario (una sola fila)
+CREATE TABLE IF NOT EXISTS agregados_equipos (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    total_equipos BIGINT NOT NULL DEFAULT 0,
+    equipos_operativos BIGINT NOT NULL DEFAULT 0,
+    equipos_reparacion BIGINT NOT NULL DEFAULT 0,
+    valor_inventario DECIMAL(14,2) NOT NULL DEFAULT 0,
+    fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Mantenimientos por día programado (el dashboard suma como máximo 31 filas)
+CREATE TABLE IF NOT EXISTS agregados_mantenimientos_diarios (
+    dia DATE PRIMARY KEY,
+    cantidad BIGINT NOT NULL DEFAULT 0,
+    costo_total DECIMAL(14,2) NOT NULL DEFAULT 0
+);
+
+-- ============================================
+-- TRIGGERS: EQUIPOS
+-- ============================================
+
+CREATE OR REPLACE FUNCTION aplicar_delta_agregados_equipos(
+    signo INTEGER, total BIGINT, operativos BIGINT, reparacion BIGINT, valor DECIMAL
+)
+RETURNS VOID AS $$
+    UPDATE agregados_equipos SET
+        total_equipos = total_equipos + signo * total,
+        equipos_operativos = equipos_operativos + signo * operativos,
+        equipos_reparacion = equipos_reparacion + signo * reparacion,
+        valor_inventario = valor_inventario + signo * valor,
+        fecha_actualizacion = CURRENT_TIMESTAMP
+    WHERE id = 1;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION actualizar_agregados_equipos()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM aplicar_delta_agregados_equipos(
+            -1,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE estado_operativo = 'operativo'),
+            COUNT(*) FILTER (WHERE estado_operativo = 'en_reparacion'),
+            COALESCE(SUM(costo_compra), 0)
+        ) FROM anteriores;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM aplicar_delta_agregados_equipos(
+            1,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE estado_operativo = 'operativo'),
+            COUNT(*) FILTER (WHERE estado_operativo = 'en_reparacion'),
+            COALESCE(SUM(costo_compra), 0)
+        ) FROM nuevos;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_agregados_equipos_insert ON equipos;
+CREATE TRIGGER trigger_agregados_equipos_insert
+AFTER INSERT ON equipos
+REFERENCING NEW TABLE AS nuevos
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_agregados_equipos();
+
+DROP TRIGGER IF EXISTS trigger_agregados_equipos_update ON equipos;
+CREATE TRIGGER trigger_agregados_equipos_update
+AFTER UPDATE ON equipos
+REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_agregados_equipos();
+
+DROP TRIGGER IF EXISTS trigger_agregados_equipos_delete ON equipos;
+CREATE TRIGGER trigger_agregados_equipos_delete
+AFTER DELETE ON equipos
+REFERENCING OLD TABLE AS anteriores
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_agregados_equipos();
+
+-- ============================================
+-- TRIGGERS: MANTENIMIENTOS
+-- ============================================
+
+CREATE OR REPLACE FUNCTION actualizar_agregados_mantenimientos()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO agregados_mantenimientos_diarios AS a (dia, cantidad, costo_total)
+        SELECT fecha_programada, -COUNT(*), -COALESCE(SUM(costo_total), 0)
+        FROM anteriores
+        WHERE fecha_programada IS NOT NULL
+        GROUP BY fecha_programada
+        ON CONFLICT (dia) DO UPDATE SET
+            cantidad = a.cantidad + EXCLUDED.cantidad,
+            costo_total = a.costo_total + EXCLUDED.costo_total;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO agregados_mantenimientos_diarios AS a (dia, cantidad, costo_total)
+        SELECT fecha_programada, COUNT(*), COALESCE(SUM(costo_total), 0)
+        FROM nuevos
+        WHERE fecha_programada IS NOT NULL
+        GROUP BY fecha_programada
+        ON CONFLICT (dia) DO UPDATE SET
+            cantidad = a.cantidad + EXCLUDED.cantidad,
+            costo_total = a.costo_total + EXCLUDED.costo_total;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_agregados_mantenimientos_insert ON mantenimientos;
+CREATE TRIGGER trigger_agregados_mantenimientos_insert
+AFTER INSERT ON mantenimientos
+REFERENCING NEW TABLE AS nuevos
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_agregados_mantenimientos();
+
+DROP TRIGGER IF EXISTS trigger_agregados_mantenimientos_update ON mantenimientos;
+CREATE TRIGGER trigger_agregados_mantenimientos_update
+AFTER UPDATE ON mantenimientos
+REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_agregados_mantenimientos();
+
+DROP TRIGGER IF EXISTS trigger_agregados_mantenimientos_delete ON mantenimientos;
+CREATE TRIGGER trigger_agregados_mantenimientos_delete
+AFTER DELETE ON mantenimientos
+REFERENCING OLD TABLE AS anteriores
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_agregados_mantenimientos();
+
+-- ============================================
+-- RECONCILIACIÓN
+-- ============================================
+
+-- Compara los agregados contra un recálculo completo y, si corregir = TRUE,
+-- los reescribe. Bloquea escrituras en equipos/mantenimientos mientras corrige.
+CREATE OR REPLACE FUNCTION reconciliar_agregados_dashboard(corregir BOOLEAN DEFAULT TRUE)
+RETURNS JSONB AS $$
+DECLARE
+    esperado RECORD;
+    almacenado RECORD;
+    dias_diferentes INTEGER;
+    equipos_consistente BOOLEAN;
+BEGIN
+    IF corregir THEN
+        LOCK TABLE equipos, mantenimientos IN SHARE MODE;
+    END IF;
+
+    SELECT
+        COUNT(*) AS total_equipos,
+        COUNT(*) FILTER (WHERE estado_operativo = 'operativo') AS equipos_operativos,
+        COUNT(*) FILTER (WHERE estado_operativo = 'en_reparacion') AS equipos_reparacion,
+        COALESCE(SUM(costo_compra), 0) AS valor_inventario
+    INTO esperado
+    FROM equipos;
+
+    SELECT total_equipos, equipos_operativos, equipos_reparacion, valor_inventario
+    INTO almacenado
+    FROM agregados_equipos
+    WHERE id = 1;
+
+    equipos_consistente := almacenado IS NOT NULL
+        AND almacenado.total_equipos = esperado.total_equipos
+        AND almacenado.equipos_operativos = esperado.equipos_operativos
+        AND almacenado.equipos_reparacion = esperado.equipos_reparacion
+        AND almacenado.valor_inventario = esperado.valor_inventario;
+
+    SELECT COUNT(*) INTO dias_diferentes
+    FROM (
+        SELECT fecha_programada AS dia, COUNT(*) AS cantidad, COALESCE(SUM(costo_total), 0) AS costo_total
+        FROM mantenimientos
+        WHERE fecha_programada IS NOT NULL
+        GROUP BY fecha_programada
+    ) r
+    FULL OUTER JOIN agregados_mantenimientos_diarios a ON a.dia = r.dia
+    WHERE COALESCE(r.cantidad, 0) <> COALESCE(a.cantidad, 0)
+       OR COALESCE(r.costo_total, 0) <> COALESCE(a.costo_total, 0);
+
+    IF corregir AND NOT equipos_consistente THEN
+        INSERT INTO agregados_equipos AS a (id, total_equipos, equipos_operativos, equipos_reparacion, valor_inventario)
+        VALUES (1, esperado.total_equipos, esperado.equipos_operativos, esperado.equipos_reparacion, esperado.valor_inventario)
+        ON CONFLICT (id) DO UPDATE SET
+            total_equipos = EXCLUDED.total_equipos,
+            equipos_operativos = EXCLUDED.equipos_operativos,
+            equipos_reparacion = EXCLUDED.equipos_reparacion,
+            valor_inventario = EXCLUDED.valor_inventario,
+            fecha_actualizacion = CURRENT_TIMESTAMP;
+    END IF;
+
+    IF corregir AND dias_diferentes > 0 THEN
+        DELETE FROM agregados_mantenimientos_diarios;
+        INSERT INTO agregados_mantenimientos_diarios (dia, cantidad, costo_total)
+        SELECT fecha_programada, COUNT(*), COALESCE(SUM(costo_total), 0)
+        FROM mantenimientos
+        WHERE fecha_programada IS NOT NULL
+        GROUP BY fecha_programada;
+    END IF;
+
+    RETURN jsonb_build_object(
+        'equipos_consistente', equipos_consistente,
+        'dias_con_diferencias', dias_diferentes,
+        'corregido', corregir AND (NOT equipos_consistente OR dias_diferentes > 0),
+        'fecha', CURRENT_TIMESTAMP
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Carga inicial de los agregados
+SELECT reconciliar_agregados_dashboard(TRUE);
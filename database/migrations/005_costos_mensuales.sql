@@ -0,0 +1,151 @@
+-- ============================================
+-- MIGRACIÓN 005: ROLLUP MENSUAL DE COSTOS DE MANTENIMIENTO
+-- ============================================
+-- Costos por mes (según fecha_programada), tipo de mantenimiento y categoría
+-- del equipo. Los triggers recalculan solo los meses afectados por cada
+-- sentencia, así que el rollup sigue siendo exacto aunque cambie la categoría
+-- de un equipo o se borren mantenimientos en cascada.
+
+CREATE TABLE IF NOT EXISTS costos_mantenimiento_mensuales (
+    mes DATE NOT NULL,
+    tipo VARCHAR(50) NOT NULL,
+    categoria_id INTEGER NOT NULL DEFAULT 0, -- 0 = equipo sin categoría
+    cantidad BIGINT NOT NULL DEFAULT 0,
+    costo_total DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (mes, tipo, categoria_id)
+);
+
+-- ============================================
+-- RECÁLCULO POR MES
+-- ============================================
+
+CREATE OR REPLACE FUNCTION recalcular_costos_mensuales(meses DATE[] DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    filas INTEGER;
+BEGIN
+    -- meses NULL = recálculo completo
+    DELETE FROM costos_mantenimiento_mensuales
+    WHERE meses IS NULL OR mes = ANY(meses);
+
+    INSERT INTO costos_mantenimiento_mensuales AS c (mes, tipo, categoria_id, cantidad, costo_total)
+    SELECT
+        date_trunc('month', m.fecha_programada)::DATE,
+        COALESCE(m.tipo, 'sin_tipo'),
+        COALESCE(e.categoria_id, 0),
+        COUNT(*),
+        SUM(m.costo_total)
+    FROM mantenimientos m
+    LEFT JOIN equipos e ON e.id = m.equipo_id
+    WHERE m.fecha_programada IS NOT NULL
+      AND m.costo_total IS NOT NULL
+      AND (
+          meses IS NULL
+          OR (m.fecha_programada >= (SELECT MIN(x) FROM unnest(meses) x)
+              AND m.fecha_programada < (SELECT MAX(x) FROM unnest(meses) x) + INTERVAL '1 month'
+              AND date_trunc('month', m.fecha_programada)::DATE = ANY(meses))
+      )
+    GROUP BY 1, 2, 3
+    ON CONFLICT (mes, tipo, categoria_id) DO UPDATE SET
+        cantidad = EXCLUDED.cantidad,
+        costo_total = EXCLUDED.costo_total;
+
+    GET DIAGNOSTICS filas = ROW_COUNT;
+    RETURN filas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- TRIGGERS: MANTENIMIENTOS
+-- ============================================
+
+CREATE OR REPLACE FUNCTION actualizar_costos_mensuales_mantenimientos()
+RETURNS TRIGGER AS $$
+DECLARE
+    meses DATE[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT date_trunc('month', fecha_programada)::DATE) INTO meses
+        FROM nuevos WHERE fecha_programada IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT date_trunc('month', fecha_programada)::DATE) INTO meses
+        FROM anteriores WHERE fecha_programada IS NOT NULL;
+    ELSE
+        -- Solo los meses de filas cuyo costo, tipo, fecha, estado o equipo cambió
+        SELECT array_agg(DISTINCT x.mes) INTO meses
+        FROM nuevos n
+        JOIN anteriores a ON a.id = n.id
+        CROSS JOIN LATERAL (VALUES
+            (date_trunc('month', a.fecha_programada)::DATE),
+            (date_trunc('month', n.fecha_programada)::DATE)
+        ) AS x(mes)
+        WHERE x.mes IS NOT NULL
+          AND (a.costo_total, a.tipo, a.fecha_programada, a.estado, a.equipo_id)
+              IS DISTINCT FROM (n.costo_total, n.tipo, n.fecha_programada, n.estado, n.equipo_id);
+    END IF;
+
+    IF meses IS NOT NULL THEN
+        PERFORM recalcular_costos_mensuales(meses);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_costos_mensuales_insert ON mantenimientos;
+CREATE TRIGGER trigger_costos_mensuales_insert
+AFTER INSERT ON mantenimientos
+REFERENCING NEW TABLE AS nuevos
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_costos_mensuales_mantenimientos();
+
+DROP TRIGGER IF EXISTS trigger_costos_mensuales_update ON mantenimientos;
+CREATE TRIGGER trigger_costos_mensuales_update
+AFTER UPDATE ON mantenimientos
+REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_costos_mensuales_mantenimientos();
+
+DROP TRIGGER IF EXISTS trigger_costos_mensuales_delete ON mantenimientos;
+CREATE TRIGGER trigger_costos_mensuales_delete
+AFTER DELETE ON mantenimientos
+REFERENCING OLD TABLE AS anteriores
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_costos_mensuales_mantenimientos();
+
+-- ============================================
+-- TRIGGER: CAMBIO DE CATEGORÍA DE EQUIPOS
+-- ============================================
+
+CREATE OR REPLACE FUNCTION actualizar_costos_mensuales_categoria()
+RETURNS TRIGGER AS $$
+DECLARE
+    meses DATE[];
+BEGIN
+    SELECT array_agg(DISTINCT date_trunc('month', m.fecha_programada)::DATE) INTO meses
+    FROM nuevos n
+    JOIN anteriores a ON a.id = n.id
+    JOIN mantenimientos m ON m.equipo_id = n.id
+    WHERE a.categoria_id IS DISTINCT FROM n.categoria_id
+      AND m.fecha_programada IS NOT NULL
+      AND m.costo_total IS NOT NULL;
+
+    IF meses IS NOT NULL THEN
+        PERFORM recalcular_costos_mensuales(meses);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_costos_mensuales_categoria ON equipos;
+CREATE TRIGGER trigger_costos_mensuales_categoria
+AFTER UPDATE ON equipos
+REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_costos_mensuales_categoria();
+
+CREATE INDEX IF NOT EXISTS idx_mantenimientos_equipo_fecha ON mantenimientos(equipo_id, fecha_programada);
+
+-- Carga inicial
+SELECT recalcular_costos_mensuales();
@@ -0,0 +1,21 @@
+-- ============================================
+-- MIGRACIÓN 006: HISTORIAL DE EJECUCIONES DE AGENTES
+-- ============================================
+-- Cada ejecución (programada o manual) queda registrada con su resultado.
+-- El planificador del agent-service usa la última ejecución programada para
+-- calcular la siguiente y para recuperar ejecuciones perdidas tras un reinicio.
+
+CREATE TABLE IF NOT EXISTS ejecuciones_agentes (
+    id BIGSERIAL PRIMARY KEY,
+    origen VARCHAR(20) NOT NULL,                      -- programada | manual
+    estado VARCHAR(20) NOT NULL DEFAULT 'en_proceso', -- en_proceso | completada | error
+    fecha_inicio TIMESTAMPTZ NOT NULL DEFAULT now(),
+    fecha_fin TIMESTAMPTZ,
+    duracion_ms NUMERIC(12,1),
+    total_notificaciones INTEGER,
+    resultados JSONB,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_ejecuciones_agentes_origen_fecha
+    ON ejecuciones_agentes(origen, fecha_inicio DESC);
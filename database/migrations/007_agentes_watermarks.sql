@@ -0,0 +1,14 @@
+-- ============================================
+-- MIGRACIÓN 007: WATERMARKS DE LOS AGENTES
+-- ============================================
+-- Cada agente guarda hasta qué token de registro_cambios y hasta qué umbral
+-- de fecha ya evaluó. La siguiente ejecución solo revisa las filas cambiadas
+-- después del token y las que cruzaron el umbral desde entonces.
+
+CREATE TABLE IF NOT EXISTS agentes_watermarks (
+    agente VARCHAR(100) PRIMARY KEY,
+    token_cambios BIGINT NOT NULL DEFAULT 0,  -- último id de registro_cambios evaluado
+    umbral DATE NOT NULL,                     -- límite de fecha (inclusive) ya evaluado
+    fecha_escaneo_completo TIMESTAMPTZ NOT NULL DEFAULT now(),
+    actualizado TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,120 @@
+-- ============================================
+-- MIGRACIÓN 008: LOCK DISTRIBUIDO DE AGENTES Y DEDUPLICACIÓN DE NOTIFICACIONES
+-- ============================================
+-- Con varias réplicas del agent-service solo una ejecuta los agentes a la vez:
+-- la réplica toma un lease con vencimiento y recibe un token de fencing
+-- creciente. Las escrituras de notificaciones verifican ese token, así una
+-- réplica que perdió el lease no puede insertar. Además, un índice único
+-- parcial impide dos notificaciones sin leer con la misma clave.
+-- Las ejecuciones que no obtienen el lease quedan con estado 'omitida'.
+
+CREATE TABLE IF NOT EXISTS locks_agentes (
+    nombre VARCHAR(100) PRIMARY KEY,
+    propietario VARCHAR(200),
+    token_fencing BIGINT NOT NULL DEFAULT 0,
+    expira TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- ============================================
+-- LEASE CON FENCING
+-- ============================================
+
+-- Devuelve el nuevo token de fencing, o NULL si otro propietario tiene el lease vigente
+CREATE OR REPLACE FUNCTION adquirir_lock(p_nombre VARCHAR, p_propietario VARCHAR, p_ttl_segundos INTEGER)
+RETURNS BIGINT AS $$
+    INSERT INTO locks_agentes AS l (nombre, propietario, token_fencing, expira)
+    VALUES (p_nombre, p_propietario, 1, now() + make_interval(secs => p_ttl_segundos))
+    ON CONFLICT (nombre) DO UPDATE SET
+        propietario = EXCLUDED.propietario,
+        token_fencing = l.token_fencing + 1,
+        expira = EXCLUDED.expira
+    WHERE l.expira <= now()
+    RETURNING token_fencing;
+$$ LANGUAGE sql;
+
+-- Extiende el lease mientras nadie haya tomado un token más nuevo
+CREATE OR REPLACE FUNCTION renovar_lock(p_nombre VARCHAR, p_token BIGINT, p_ttl_segundos INTEGER)
+RETURNS BOOLEAN AS $$
+    WITH renovado AS (
+        UPDATE locks_agentes
+        SET expira = now() + make_interval(secs => p_ttl_segundos)
+        WHERE nombre = p_nombre AND token_fencing = p_token
+        RETURNING 1
+    )
+    SELECT EXISTS (SELECT 1 FROM renovado);
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION liberar_lock(p_nombre VARCHAR, p_token BIGINT)
+RETURNS BOOLEAN AS $$
+    WITH liberado AS (
+        UPDATE locks_agentes
+        SET expira = now(), propietario = NULL
+        WHERE nombre = p_nombre AND token_fencing = p_token
+        RETURNING 1
+    )
+    SELECT EXISTS (SELECT 1 FROM liberado);
+$$ LANGUAGE sql;
+
+-- ============================================
+-- DEDUPLICACIÓN DE NOTIFICACIONES
+-- ============================================
+
+-- Clave: tipo + mantenimiento (m<id>) o equipo (e<id>) relacionado
+ALTER TABLE notificaciones ADD COLUMN IF NOT EXISTS clave_dedup VARCHAR(100);
+
+-- Notificaciones sin leer ya existentes: si hay duplicados solo la más reciente recibe la clave
+UPDATE notificaciones n SET clave_dedup = d.clave
+FROM (
+    SELECT id, clave,
+           ROW_NUMBER() OVER (PARTITION BY clave ORDER BY fecha_creacion DESC, id DESC) AS orden
+    FROM (
+        SELECT id, fecha_creacion,
+               tipo || ':' || COALESCE('m' || mantenimiento_relacionado_id, 'e' || equipo_relacionado_id) AS clave
+        FROM notificaciones
+        WHERE NOT leida
+          AND (mantenimiento_relacionado_id IS NOT NULL OR equipo_relacionado_id IS NOT NULL)
+    ) c
+) d
+WHERE n.id = d.id AND d.orden = 1 AND n.clave_dedup IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notificaciones_clave_dedup
+    ON notificaciones(clave_dedup) WHERE NOT leida;
+
+-- Inserción en lote: verifica el token de fencing e ignora las duplicadas
+CREATE OR REPLACE FUNCTION insertar_notificaciones(
+    p_notificaciones JSONB,
+    p_lock VARCHAR DEFAULT NULL,
+    p_token BIGINT DEFAULT NULL
+)
+RETURNS INTEGER AS $$
+DECLARE
+    insertadas INTEGER;
+BEGIN
+    IF p_lock IS NOT NULL THEN
+        -- FOR SHARE: nadie puede tomar el lease hasta que termine esta inserción
+        PERFORM 1 FROM locks_agentes
+        WHERE nombre = p_lock AND token_fencing = p_token
+        FOR SHARE;
+
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Lock % perdido: token de fencing % obsoleto', p_lock, p_token;
+        END IF;
+    END IF;
+
+    INSERT INTO notificaciones (
+        tipo, titulo, mensaje, prioridad,
+        equipo_relacionado_id, mantenimiento_relacionado_id, clave_dedup
+    )
+    SELECT
+        n.tipo, n.titulo, n.mensaje, COALESCE(n.prioridad, 'media'),
+        n.equipo_relacionado_id, n.mantenimiento_relacionado_id, n.clave_dedup
+    FROM jsonb_to_recordset(p_notificaciones) AS n(
+        tipo VARCHAR, titulo VARCHAR, mensaje TEXT, prioridad VARCHAR,
+        equipo_relacionado_id INTEGER, mantenimiento_relacionado_id INTEGER, clave_dedup VARCHAR
+    )
+    ON CONFLICT (clave_dedup) WHERE NOT leida DO NOTHING;
+
+    GET DIAGNOSTICS insertadas = ROW_COUNT;
+    RETURN insertadas;
+END;
+$$ LANGUAGE plpgsql;
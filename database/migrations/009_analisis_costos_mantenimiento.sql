@@ -0,0 +1,37 @@
+-- ============================================
+-- MIGRACIÓN 009: ANÁLISIS DE COSTOS DE MANTENIMIENTO
+-- ============================================
+-- Equipos cuyo costo de mantenimiento realizado desde una fecha supera una
+-- fracción de su costo de compra. Primero se agrega mantenimientos por equipo
+-- (recorrido solo del índice de cobertura) y después se une con equipos por
+-- su clave primaria.
+
+CREATE INDEX IF NOT EXISTS idx_mantenimientos_realizada_equipo_costo
+    ON mantenimientos(fecha_realizada, equipo_id) INCLUDE (costo_total)
+    WHERE costo_total IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION analizar_costos_mantenimiento(p_desde DATE, p_umbral NUMERIC DEFAULT 0.5)
+RETURNS TABLE (
+    equipo_id INTEGER,
+    codigo_inventario VARCHAR,
+    nombre VARCHAR,
+    costo_compra DECIMAL(12,2),
+    num_mantenimientos BIGINT,
+    costo_mantenimiento DECIMAL(14,2)
+) AS $$
+    SELECT e.id, e.codigo_inventario, e.nombre, e.costo_compra,
+           a.num_mantenimientos, a.costo_mantenimiento
+    FROM (
+        SELECT m.equipo_id,
+               COUNT(*) AS num_mantenimientos,
+               SUM(m.costo_total) AS costo_mantenimiento
+        FROM mantenimientos m
+        WHERE m.fecha_realizada >= p_desde
+          AND m.costo_total IS NOT NULL
+        GROUP BY m.equipo_id
+    ) a
+    JOIN equipos e ON e.id = a.equipo_id
+    WHERE e.costo_compra > 0
+      AND a.costo_mantenimiento > e.costo_compra * p_umbral
+    ORDER BY a.costo_mantenimiento DESC;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,112 @@
+-- ============================================
+-- MIGRACIÓN 010: CONTADORES DE NOTIFICACIONES Y PAGINACIÓN POR CURSOR
+-- ============================================
+-- Totales y no leídas por tipo y prioridad, mantenidos por triggers a nivel
+-- de sentencia (un UPSERT por sentencia, no por fila). El contador de la
+-- barra lateral se lee de aquí sin tocar notificaciones.
+
+CREATE TABLE IF NOT EXISTS notificaciones_contadores (
+    tipo VARCHAR(50) NOT NULL,
+    prioridad VARCHAR(20) NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    no_leidas BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (tipo, prioridad)
+);
+
+-- ============================================
+-- RECÁLCULO COMPLETO
+-- ============================================
+
+CREATE OR REPLACE FUNCTION recalcular_contadores_notificaciones()
+RETURNS INTEGER AS $$
+DECLARE
+    filas INTEGER;
+BEGIN
+    -- Bloquea escrituras concurrentes para que el recálculo sea consistente
+    LOCK TABLE notificaciones IN SHARE MODE;
+    DELETE FROM notificaciones_contadores;
+
+    INSERT INTO notificaciones_contadores (tipo, prioridad, total, no_leidas)
+    SELECT tipo, COALESCE(prioridad, 'media'), COUNT(*),
+           COUNT(*) FILTER (WHERE NOT COALESCE(leida, FALSE))
+    FROM notificaciones
+    GROUP BY 1, 2;
+
+    GET DIAGNOSTICS filas = ROW_COUNT;
+    RETURN filas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- TRIGGERS
+-- ============================================
+
+CREATE OR REPLACE FUNCTION actualizar_contadores_notificaciones()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO notificaciones_contadores AS c (tipo, prioridad, total, no_leidas)
+        SELECT tipo, COALESCE(prioridad, 'media'), COUNT(*),
+               COUNT(*) FILTER (WHERE NOT COALESCE(leida, FALSE))
+        FROM nuevos
+        GROUP BY 1, 2
+        ON CONFLICT (tipo, prioridad) DO UPDATE SET
+            total = c.total + EXCLUDED.total,
+            no_leidas = c.no_leidas + EXCLUDED.no_leidas;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO notificaciones_contadores AS c (tipo, prioridad, total, no_leidas)
+        SELECT tipo, COALESCE(prioridad, 'media'), -COUNT(*),
+               -COUNT(*) FILTER (WHERE NOT COALESCE(leida, FALSE))
+        FROM anteriores
+        GROUP BY 1, 2
+        ON CONFLICT (tipo, prioridad) DO UPDATE SET
+            total = c.total + EXCLUDED.total,
+            no_leidas = c.no_leidas + EXCLUDED.no_leidas;
+    ELSE
+        -- Solo las filas cuyo tipo, prioridad o estado de lectura cambió
+        INSERT INTO notificaciones_contadores AS c (tipo, prioridad, total, no_leidas)
+        SELECT d.tipo, d.prioridad, SUM(d.total), SUM(d.no_leidas)
+        FROM nuevos n
+        JOIN anteriores a ON a.id = n.id
+        CROSS JOIN LATERAL (VALUES
+            (a.tipo, COALESCE(a.prioridad, 'media'), -1, CASE WHEN COALESCE(a.leida, FALSE) THEN 0 ELSE -1 END),
+            (n.tipo, COALESCE(n.prioridad, 'media'), 1, CASE WHEN COALESCE(n.leida, FALSE) THEN 0 ELSE 1 END)
+        ) AS d(tipo, prioridad, total, no_leidas)
+        WHERE (a.tipo, a.prioridad, a.leida) IS DISTINCT FROM (n.tipo, n.prioridad, n.leida)
+        GROUP BY d.tipo, d.prioridad
+        ON CONFLICT (tipo, prioridad) DO UPDATE SET
+            total = c.total + EXCLUDED.total,
+            no_leidas = c.no_leidas + EXCLUDED.no_leidas;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_contadores_notificaciones_insert ON notificaciones;
+CREATE TRIGGER trigger_contadores_notificaciones_insert
+AFTER INSERT ON notificaciones
+REFERENCING NEW TABLE AS nuevos
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_contadores_notificaciones();
+
+DROP TRIGGER IF EXISTS trigger_contadores_notificaciones_update ON notificaciones;
+CREATE TRIGGER trigger_contadores_notificaciones_update
+AFTER UPDATE ON notificaciones
+REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_contadores_notificaciones();
+
+DROP TRIGGER IF EXISTS trigger_contadores_notificaciones_delete ON notificaciones;
+CREATE TRIGGER trigger_contadores_notificaciones_delete
+AFTER DELETE ON notificaciones
+REFERENCING OLD TABLE AS anteriores
+FOR EACH STATEMENT
+EXECUTE FUNCTION actualizar_contadores_notificaciones();
+
+-- Paginación keyset por (fecha_creacion, id) dentro de leídas / no leídas
+CREATE INDEX IF NOT EXISTS idx_notificaciones_leida_fecha_id
+    ON notificaciones(leida, fecha_creacion DESC, id DESC);
+
+-- Carga inicial
+SELECT recalcular_contadores_notificaciones();
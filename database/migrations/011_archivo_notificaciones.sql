@@ -0,0 +1,133 @@
+-- ============================================
+-- MIGRACIÓN 011: RETENCIÓN Y ARCHIVO DE NOTIFICACIONES
+-- ============================================
+-- Las notificaciones leídas hace más de N días se mueven a
+-- notificaciones_archivo, particionada por mes de creación. La tabla viva
+-- queda con el conjunto de trabajo (no leídas y leídas recientes) y los
+-- índices parciales separan las no leídas, que son las del camino caliente.
+-- El archivado borra de notificaciones: registro_cambios lo informa como
+-- DELETE y los contadores de la migración 010 pasan a contar la tabla viva.
+
+CREATE TABLE IF NOT EXISTS notificaciones_archivo (
+    id INTEGER NOT NULL,
+    tipo VARCHAR(50) NOT NULL,
+    titulo VARCHAR(200) NOT NULL,
+    mensaje TEXT NOT NULL,
+    prioridad VARCHAR(20),
+    usuario_destino_id INTEGER,
+    equipo_relacionado_id INTEGER,
+    mantenimiento_relacionado_id INTEGER,
+    leida BOOLEAN,
+    fecha_leida TIMESTAMP,
+    fecha_creacion TIMESTAMP NOT NULL,
+    clave_dedup VARCHAR(100),
+    fecha_archivado TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, fecha_creacion)
+) PARTITION BY RANGE (fecha_creacion);
+
+-- Solo recibe filas si falta la partición del mes (no debería ocurrir)
+CREATE TABLE IF NOT EXISTS notificaciones_archivo_otros
+    PARTITION OF notificaciones_archivo DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_notificaciones_archivo_equipo
+    ON notificaciones_archivo(equipo_relacionado_id);
+
+-- ============================================
+-- PARTICIONES MENSUALES
+-- ============================================
+
+CREATE OR REPLACE FUNCTION crear_particion_archivo_notificaciones(p_mes DATE)
+RETURNS VOID AS $$
+DECLARE
+    inicio DATE := date_trunc('month', p_mes)::DATE;
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF notificaciones_archivo FOR VALUES FROM (%L) TO (%L)',
+        'notificaciones_archivo_' || to_char(inicio, 'YYYY_MM'),
+        inicio,
+        (inicio + INTERVAL '1 month')::DATE
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- ARCHIVADO POR LOTES
+-- ============================================
+
+-- Mueve hasta p_lote notificaciones leídas hace más de p_dias días; devuelve cuántas movió.
+-- Se llama en bucle desde el agent-service: cada lote es una transacción corta.
+CREATE OR REPLACE FUNCTION archivar_notificaciones(p_dias INTEGER, p_lote INTEGER DEFAULT 5000)
+RETURNS INTEGER AS $$
+DECLARE
+    limite TIMESTAMP := LOCALTIMESTAMP - make_interval(days => p_dias);
+    ids INTEGER[];
+    mes DATE;
+    movidas INTEGER;
+BEGIN
+    SELECT array_agg(id) INTO ids
+    FROM (
+        SELECT id FROM notificaciones
+        WHERE leida AND COALESCE(fecha_leida, fecha_creacion) < limite
+        ORDER BY id
+        LIMIT p_lote
+        FOR UPDATE SKIP LOCKED
+    ) candidatas;
+
+    IF ids IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    FOR mes IN
+        SELECT DISTINCT date_trunc('month', fecha_creacion)::DATE
+        FROM notificaciones
+        WHERE id = ANY(ids) AND fecha_creacion IS NOT NULL
+    LOOP
+        PERFORM crear_particion_archivo_notificaciones(mes);
+    END LOOP;
+
+    WITH borradas AS (
+        DELETE FROM notificaciones
+        WHERE id = ANY(ids)
+        RETURNING *
+    )
+    INSERT INTO notificaciones_archivo (
+        id, tipo, titulo, mensaje, prioridad, usuario_destino_id,
+        equipo_relacionado_id, mantenimiento_relacionado_id,
+        leida, fecha_leida, fecha_creacion, clave_dedup
+    )
+    SELECT id, tipo, titulo, mensaje, prioridad, usuario_destino_id,
+           equipo_relacionado_id, mantenimiento_relacionado_id,
+           leida, fecha_leida, COALESCE(fecha_creacion, LOCALTIMESTAMP), clave_dedup
+    FROM borradas;
+
+    GET DIAGNOSTICS movidas = ROW_COUNT;
+    RETURN movidas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- ÍNDICES PARCIALES Y AUTOVACUUM
+-- ============================================
+
+-- El índice booleano del esquema base y el completo de la migración 010 se
+-- reemplazan por índices parciales: el de no leídas solo contiene el
+-- conjunto de trabajo.
+DROP INDEX IF EXISTS idx_notificaciones_leida;
+DROP INDEX IF EXISTS idx_notificaciones_leida_fecha_id;
+
+CREATE INDEX IF NOT EXISTS idx_notificaciones_no_leidas_fecha_id
+    ON notificaciones(fecha_creacion DESC, id DESC) WHERE NOT leida;
+
+CREATE INDEX IF NOT EXISTS idx_notificaciones_leidas_fecha_id
+    ON notificaciones(fecha_creacion DESC, id DESC) WHERE leida;
+
+-- Candidatas al archivado
+CREATE INDEX IF NOT EXISTS idx_notificaciones_leidas_fecha_leida
+    ON notificaciones((COALESCE(fecha_leida, fecha_creacion))) WHERE leida;
+
+-- El archivado borra de forma continua: vacuum y analyze más frecuentes
+-- devuelven el espacio a la tabla viva sin esperar al 20% por defecto.
+ALTER TABLE notificaciones SET (
+    autovacuum_vacuum_scale_factor = 0.05,
+    autovacuum_analyze_scale_factor = 0.02
+);
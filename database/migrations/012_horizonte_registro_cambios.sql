@@ -0,0 +1,76 @@
+-- ============================================
+-- MIGRACIÓN 012: HORIZONTE DE VISIBILIDAD DEL REGISTRO DE CAMBIOS
+-- ============================================
+-- Los ids de registro_cambios se asignan al insertar, pero la fila solo es
+-- visible cuando su transacción confirma. Una transacción larga puede dejar
+-- un id menor todavía invisible mientras ya se leen ids mayores; si el token
+-- avanza por encima, ese cambio se pierde. Un margen fijo de tiempo no cubre
+-- transacciones más largas que el margen.
+--
+-- El horizonte es el inicio de la transacción de escritura más antigua que
+-- sigue abierta (pg_stat_activity con backend_xid), o el instante actual si no
+-- hay ninguna, menos un segundo de margen para el orden en que se evalúan los
+-- valores por defecto de cada fila. Una fila pendiente tiene fecha_cambio
+-- posterior al horizonte, y también toda fila con un id mayor que el suyo; por
+-- eso se entrega solo el prefijo (ordenado por id) de filas anteriores al
+-- horizonte, y nunca se adelanta un cambio en curso.
+-- Las funciones son SECURITY DEFINER porque pg_stat_activity oculta el estado
+-- de las sesiones de otros roles.
+
+CREATE INDEX IF NOT EXISTS idx_registro_cambios_fecha ON registro_cambios(fecha_cambio);
+
+CREATE OR REPLACE FUNCTION horizonte_registro_cambios()
+RETURNS TIMESTAMP AS $$
+DECLARE
+    -- El reloj se toma antes de leer las sesiones abiertas
+    v_ahora TIMESTAMPTZ := clock_timestamp();
+    v_horizonte TIMESTAMPTZ;
+BEGIN
+    SELECT LEAST(v_ahora, MIN(xact_start)) INTO v_horizonte
+    FROM pg_stat_activity
+    WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid();
+
+    RETURN (v_horizonte - INTERVAL '1 second')::TIMESTAMP;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Cambios de una tabla posteriores a un token, sin pasar de ningún cambio en curso.
+-- El horizonte se calcula antes de la consulta, así la foto de datos es posterior.
+CREATE OR REPLACE FUNCTION leer_registro_cambios(p_tabla VARCHAR, p_desde BIGINT, p_limite INTEGER)
+RETURNS TABLE (id BIGINT, registro_id INTEGER, operacion VARCHAR) AS $$
+DECLARE
+    v_horizonte TIMESTAMP := horizonte_registro_cambios();
+BEGIN
+    RETURN QUERY
+    WITH limite AS (
+        SELECT MIN(rc.id) AS id
+        FROM registro_cambios rc
+        WHERE rc.id > p_desde AND rc.fecha_cambio >= v_horizonte
+    )
+    SELECT rc.id, rc.registro_id, rc.operacion
+    FROM registro_cambios rc, limite
+    WHERE rc.tabla = p_tabla
+      AND rc.id > p_desde
+      AND (limite.id IS NULL OR rc.id < limite.id)
+    ORDER BY rc.id
+    LIMIT p_limite;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Último token hasta el que todos los cambios ya son visibles
+CREATE OR REPLACE FUNCTION token_registro_cambios()
+RETURNS BIGINT AS $$
+DECLARE
+    v_horizonte TIMESTAMP := horizonte_registro_cambios();
+    v_token BIGINT;
+BEGIN
+    WITH limite AS (
+        SELECT MIN(rc.id) AS id FROM registro_cambios rc WHERE rc.fecha_cambio >= v_horizonte
+    )
+    SELECT COALESCE(MAX(rc.id), 0) INTO v_token
+    FROM registro_cambios rc, limite
+    WHERE limite.id IS NULL OR rc.id < limite.id;
+
+    RETURN v_token;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
@@ -0,0 +1,153 @@
+-- ============================================
+-- MIGRACIÓN 013: AGREGADOS DEL DASHBOARD SIN BLOQUEOS
+-- ============================================
+-- Reemplaza dos puntos de contención de la migración 004:
+--   * La fila única de agregados_equipos serializaba todas las escrituras
+--     concurrentes sobre equipos. Ahora los totales se reparten en
+--     fragmentos_agregados() filas; cada sentencia suma su delta a una fila
+--     elegida al azar y el lector suma todas.
+--   * La reconciliación tomaba LOCK TABLE ... IN SHARE MODE. Ahora calcula la
+--     diferencia entre el recálculo y los contadores en una sola consulta (una
+--     misma foto de datos: cada transacción confirmada aporta a la vez sus filas
+--     y su delta) y aplica esa diferencia como un delta más, que se suma a los
+--     de las escrituras concurrentes en lugar de pisarlos.
+
+CREATE TABLE IF NOT EXISTS agregados_equipos_fragmentos (
+    fragmento SMALLINT PRIMARY KEY,
+    total_equipos BIGINT NOT NULL DEFAULT 0,
+    equipos_operativos BIGINT NOT NULL DEFAULT 0,
+    equipos_reparacion BIGINT NOT NULL DEFAULT 0,
+    valor_inventario DECIMAL(14,2) NOT NULL DEFAULT 0,
+    fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Cantidad de fragmentos (debe coincidir con las filas creadas abajo)
+CREATE OR REPLACE FUNCTION fragmentos_agregados()
+RETURNS SMALLINT AS $$
+    SELECT 16::SMALLINT;
+$$ LANGUAGE sql IMMUTABLE;
+
+INSERT INTO agregados_equipos_fragmentos (fragmento)
+SELECT generate_series(0, fragmentos_agregados() - 1)
+ON CONFLICT (fragmento) DO NOTHING;
+
+-- Los totales acumulados pasan al fragmento 0
+UPDATE agregados_equipos_fragmentos f SET
+    total_equipos = a.total_equipos,
+    equipos_operativos = a.equipos_operativos,
+    equipos_reparacion = a.equipos_reparacion,
+    valor_inventario = a.valor_inventario
+FROM agregados_equipos a
+WHERE a.id = 1 AND f.fragmento = 0;
+
+CREATE OR REPLACE FUNCTION aplicar_delta_agregados_equipos(
+    signo INTEGER, total BIGINT, operativos BIGINT, reparacion BIGINT, valor DECIMAL
+)
+RETURNS VOID AS $$
+    UPDATE agregados_equipos_fragmentos SET
+        total_equipos = total_equipos + signo * total,
+        equipos_operativos = equipos_operativos + signo * operativos,
+        equipos_reparacion = equipos_reparacion + signo * reparacion,
+        valor_inventario = valor_inventario + signo * valor,
+        fecha_actualizacion = CURRENT_TIMESTAMP
+    -- La subconsulta se evalúa una sola vez: se actualiza exactamente un fragmento
+    WHERE fragmento = (SELECT floor(random() * fragmentos_agregados())::SMALLINT);
+$$ LANGUAGE sql VOLATILE;
+
+DROP TABLE IF EXISTS agregados_equipos;
+
+-- ============================================
+-- RECONCILIACIÓN
+-- ============================================
+
+-- Compara los agregados contra un recálculo completo y, si corregir = TRUE,
+-- suma la diferencia encontrada. No bloquea las escrituras.
+CREATE OR REPLACE FUNCTION reconciliar_agregados_dashboard(corregir BOOLEAN DEFAULT TRUE)
+RETURNS JSONB AS $$
+DECLARE
+    diferencia RECORD;
+    dias_diferentes INTEGER;
+    equipos_consistente BOOLEAN;
+BEGIN
+    SELECT
+        e.total_equipos - a.total_equipos AS total_equipos,
+        e.equipos_operativos - a.equipos_operativos AS equipos_operativos,
+        e.equipos_reparacion - a.equipos_reparacion AS equipos_reparacion,
+        e.valor_inventario - a.valor_inventario AS valor_inventario
+    INTO diferencia
+    FROM (
+        SELECT
+            COUNT(*) AS total_equipos,
+            COUNT(*) FILTER (WHERE estado_operativo = 'operativo') AS equipos_operativos,
+            COUNT(*) FILTER (WHERE estado_operativo = 'en_reparacion') AS equipos_reparacion,
+            COALESCE(SUM(costo_compra), 0) AS valor_inventario
+        FROM equipos
+    ) e
+    CROSS JOIN (
+        SELECT
+            COALESCE(SUM(total_equipos), 0) AS total_equipos,
+            COALESCE(SUM(equipos_operativos), 0) AS equipos_operativos,
+            COALESCE(SUM(equipos_reparacion), 0) AS equipos_reparacion,
+            COALESCE(SUM(valor_inventario), 0) AS valor_inventario
+        FROM agregados_equipos_fragmentos
+    ) a;
+
+    equipos_consistente := diferencia.total_equipos = 0
+        AND diferencia.equipos_operativos = 0
+        AND diferencia.equipos_reparacion = 0
+        AND diferencia.valor_inventario = 0;
+
+    IF corregir AND NOT equipos_consistente THEN
+        PERFORM aplicar_delta_agregados_equipos(
+            1,
+            diferencia.total_equipos,
+            diferencia.equipos_operativos,
+            diferencia.equipos_reparacion,
+            diferencia.valor_inventario
+        );
+    END IF;
+
+    -- Días cuya diferencia se suma (o solo se cuenta) en una única sentencia
+    IF corregir THEN
+        INSERT INTO agregados_mantenimientos_diarios AS a (dia, cantidad, costo_total)
+        SELECT
+            COALESCE(r.dia, d.dia),
+            COALESCE(r.cantidad, 0) - COALESCE(d.cantidad, 0),
+            COALESCE(r.costo_total, 0) - COALESCE(d.costo_total, 0)
+        FROM (
+            SELECT fecha_programada AS dia, COUNT(*) AS cantidad, COALESCE(SUM(costo_total), 0) AS costo_total
+            FROM mantenimientos
+            WHERE fecha_programada IS NOT NULL
+            GROUP BY fecha_programada
+        ) r
+        FULL OUTER JOIN agregados_mantenimientos_diarios d ON d.dia = r.dia
+        WHERE COALESCE(r.cantidad, 0) <> COALESCE(d.cantidad, 0)
+           OR COALESCE(r.costo_total, 0) <> COALESCE(d.costo_total, 0)
+        ON CONFLICT (dia) DO UPDATE SET
+            cantidad = a.cantidad + EXCLUDED.cantidad,
+            costo_total = a.costo_total + EXCLUDED.costo_total;
+        GET DIAGNOSTICS dias_diferentes = ROW_COUNT;
+    ELSE
+        SELECT COUNT(*) INTO dias_diferentes
+        FROM (
+            SELECT fecha_programada AS dia, COUNT(*) AS cantidad, COALESCE(SUM(costo_total), 0) AS costo_total
+            FROM mantenimientos
+            WHERE fecha_programada IS NOT NULL
+            GROUP BY fecha_programada
+        ) r
+        FULL OUTER JOIN agregados_mantenimientos_diarios d ON d.dia = r.dia
+        WHERE COALESCE(r.cantidad, 0) <> COALESCE(d.cantidad, 0)
+           OR COALESCE(r.costo_total, 0) <> COALESCE(d.costo_total, 0);
+    END IF;
+
+    RETURN jsonb_build_object(
+        'equipos_consistente', equipos_consistente,
+        'dias_con_diferencias', dias_diferentes,
+        'corregido', corregir AND (NOT equipos_consistente OR dias_diferentes > 0),
+        'fecha', CURRENT_TIMESTAMP
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Corregir cualquier diferencia pendiente tras el cambio de esquema
+SELECT reconciliar_agregados_dashboard(TRUE);
@@ -0,0 +1,47 @@
+-- ============================================
+-- MIGRACIÓN 014: CAMBIOS DE DIMENSIONES
+-- ============================================
+-- El snapshot del servicio de reportes guarda los nombres de categoría,
+-- ubicación y proveedor de cada equipo. Para que un renombrado no quede
+-- desactualizado, las tablas de dimensiones también registran sus cambios;
+-- el snapshot vuelve a leer los equipos que las referencian.
+
+DROP TRIGGER IF EXISTS trigger_cambios_categorias_equipos ON categorias_equipos;
+CREATE TRIGGER trigger_cambios_categorias_equipos
+AFTER INSERT OR UPDATE OR DELETE ON categorias_equipos
+FOR EACH ROW
+EXECUTE FUNCTION registrar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_cambios_ubicaciones ON ubicaciones;
+CREATE TRIGGER trigger_cambios_ubicaciones
+AFTER INSERT OR UPDATE OR DELETE ON ubicaciones
+FOR EACH ROW
+EXECUTE FUNCTION registrar_cambio();
+
+DROP TRIGGER IF EXISTS trigger_cambios_proveedores ON proveedores;
+CREATE TRIGGER trigger_cambios_proveedores
+AFTER INSERT OR UPDATE OR DELETE ON proveedores
+FOR EACH ROW
+EXECUTE FUNCTION registrar_cambio();
+
+-- Cambios de varias tablas posteriores a un token (mismo horizonte que la migración 012)
+CREATE OR REPLACE FUNCTION leer_registro_cambios_tablas(p_tablas VARCHAR[], p_desde BIGINT, p_limite INTEGER)
+RETURNS TABLE (id BIGINT, tabla VARCHAR, registro_id INTEGER, operacion VARCHAR) AS $$
+DECLARE
+    v_horizonte TIMESTAMP := horizonte_registro_cambios();
+BEGIN
+    RETURN QUERY
+    WITH limite AS (
+        SELECT MIN(rc.id) AS id
+        FROM registro_cambios rc
+        WHERE rc.id > p_desde AND rc.fecha_cambio >= v_horizonte
+    )
+    SELECT rc.id, rc.tabla, rc.registro_id, rc.operacion
+    FROM registro_cambios rc, limite
+    WHERE rc.tabla = ANY(p_tablas)
+      AND rc.id > p_desde
+      AND (limite.id IS NULL OR rc.id < limite.id)
+    ORDER BY rc.id
+    LIMIT p_limite;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
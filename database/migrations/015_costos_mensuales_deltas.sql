@@ -0,0 +1,118 @@
+-- ============================================
+-- MIGRACIÓN 015: ROLLUP DE COSTOS POR DELTAS
+-- ============================================
+-- Los triggers de la migración 005 borraban y volvían a insertar los meses
+-- completos afectados por cada sentencia sobre mantenimientos. Ahora suman
+-- al rollup solo la diferencia que aportan las filas de las tablas de
+-- transición (restan las anteriores y suman las nuevas).
+-- recalcular_costos_mensuales queda para los casos que no se pueden expresar
+-- como delta y para reconciliar:
+--   * cambio de categoría de un equipo (trigger de la migración 005),
+--   * mantenimientos borrados en cascada junto con su equipo (la categoría
+--     ya no se puede leer),
+--   * SELECT recalcular_costos_mensuales(); como reconciliación manual.
+
+DO $$
+BEGIN
+    CREATE TYPE delta_costo_mensual AS (
+        mes DATE,
+        tipo VARCHAR(50),
+        categoria_id INTEGER,
+        cantidad BIGINT,
+        costo_total DECIMAL(14,2)
+    );
+EXCEPTION WHEN duplicate_object THEN
+    NULL;
+END $$;
+
+-- Suma los deltas agrupados por clave y elimina las filas que quedan en cero
+CREATE OR REPLACE FUNCTION aplicar_deltas_costos_mensuales(deltas delta_costo_mensual[])
+RETURNS VOID AS $$
+DECLARE
+    meses DATE[];
+BEGIN
+    WITH aplicados AS (
+        INSERT INTO costos_mantenimiento_mensuales AS c (mes, tipo, categoria_id, cantidad, costo_total)
+        SELECT d.mes, d.tipo, d.categoria_id, SUM(d.cantidad), SUM(d.costo_total)
+        FROM unnest(deltas) d
+        GROUP BY d.mes, d.tipo, d.categoria_id
+        HAVING SUM(d.cantidad) <> 0 OR SUM(d.costo_total) <> 0
+        ON CONFLICT (mes, tipo, categoria_id) DO UPDATE SET
+            cantidad = c.cantidad + EXCLUDED.cantidad,
+            costo_total = c.costo_total + EXCLUDED.costo_total
+        RETURNING c.mes
+    )
+    SELECT array_agg(DISTINCT mes) INTO meses FROM aplicados;
+
+    IF meses IS NOT NULL THEN
+        DELETE FROM costos_mantenimiento_mensuales
+        WHERE mes = ANY(meses) AND cantidad = 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION actualizar_costos_mensuales_mantenimientos()
+RETURNS TRIGGER AS $$
+DECLARE
+    deltas delta_costo_mensual[];
+    meses_sin_equipo DATE[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(ROW(
+            date_trunc('month', n.fecha_programada)::DATE, COALESCE(n.tipo, 'sin_tipo'),
+            COALESCE(e.categoria_id, 0), 1, n.costo_total
+        )::delta_costo_mensual) INTO deltas
+        FROM nuevos n
+        LEFT JOIN equipos e ON e.id = n.equipo_id
+        WHERE n.fecha_programada IS NOT NULL AND n.costo_total IS NOT NULL;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        -- Borrados en cascada: el equipo ya no existe y su categoría no se conoce
+        SELECT array_agg(DISTINCT date_trunc('month', a.fecha_programada)::DATE) INTO meses_sin_equipo
+        FROM anteriores a
+        WHERE a.fecha_programada IS NOT NULL AND a.costo_total IS NOT NULL
+          AND a.equipo_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM equipos e WHERE e.id = a.equipo_id);
+
+        SELECT array_agg(ROW(
+            date_trunc('month', a.fecha_programada)::DATE, COALESCE(a.tipo, 'sin_tipo'),
+            COALESCE(e.categoria_id, 0), -1, -a.costo_total
+        )::delta_costo_mensual) INTO deltas
+        FROM anteriores a
+        LEFT JOIN equipos e ON e.id = a.equipo_id
+        WHERE a.fecha_programada IS NOT NULL AND a.costo_total IS NOT NULL
+          AND (a.equipo_id IS NULL OR e.id IS NOT NULL);
+
+    ELSE
+        -- Solo las filas cuyo costo, tipo, fecha o equipo cambió
+        SELECT array_agg(x.delta) INTO deltas
+        FROM anteriores a
+        JOIN nuevos n ON n.id = a.id
+        LEFT JOIN equipos ea ON ea.id = a.equipo_id
+        LEFT JOIN equipos en ON en.id = n.equipo_id
+        CROSS JOIN LATERAL (VALUES
+            (CASE WHEN a.fecha_programada IS NOT NULL AND a.costo_total IS NOT NULL THEN ROW(
+                date_trunc('month', a.fecha_programada)::DATE, COALESCE(a.tipo, 'sin_tipo'),
+                COALESCE(ea.categoria_id, 0), -1, -a.costo_total
+            )::delta_costo_mensual END),
+            (CASE WHEN n.fecha_programada IS NOT NULL AND n.costo_total IS NOT NULL THEN ROW(
+                date_trunc('month', n.fecha_programada)::DATE, COALESCE(n.tipo, 'sin_tipo'),
+                COALESCE(en.categoria_id, 0), 1, n.costo_total
+            )::delta_costo_mensual END)
+        ) AS x(delta)
+        WHERE x.delta IS NOT NULL
+          AND (a.costo_total, a.tipo, a.fecha_programada, a.equipo_id)
+              IS DISTINCT FROM (n.costo_total, n.tipo, n.fecha_programada, n.equipo_id);
+    END IF;
+
+    IF deltas IS NOT NULL THEN
+        PERFORM aplicar_deltas_costos_mensuales(deltas);
+    END IF;
+
+    IF meses_sin_equipo IS NOT NULL THEN
+        PERFORM recalcular_costos_mensuales(meses_sin_equipo);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,34 @@
+-- ============================================
+-- MIGRACIÓN 016: TOKEN DEL REGISTRO DE CAMBIOS POR TABLAS
+-- ============================================
+-- token_registro_cambios() avanza con cualquier tabla registrada (también con
+-- notificaciones, que cambian en cada ejecución de los agentes). La caché de
+-- documentos del servicio de reportes se versiona solo con las tablas de las
+-- que leen los reportes.
+
+-- Último cambio de las tablas indicadas hasta el que todo ya es visible
+-- (mismo horizonte que la migración 012)
+CREATE OR REPLACE FUNCTION token_registro_cambios_tablas(p_tablas VARCHAR[])
+RETURNS BIGINT AS $$
+DECLARE
+    v_horizonte TIMESTAMP := horizonte_registro_cambios();
+    v_limite BIGINT;
+    v_token BIGINT;
+BEGIN
+    SELECT MIN(rc.id) INTO v_limite
+    FROM registro_cambios rc
+    WHERE rc.fecha_cambio >= v_horizonte;
+
+    -- Un MAX por tabla usa idx_registro_cambios_tabla (tabla, id)
+    SELECT COALESCE(MAX(ultimo), 0) INTO v_token
+    FROM unnest(p_tablas) AS t(tabla)
+    CROSS JOIN LATERAL (
+        SELECT MAX(rc.id) AS ultimo
+        FROM registro_cambios rc
+        WHERE rc.tabla = t.tabla
+          AND (v_limite IS NULL OR rc.id < v_limite)
+    ) m;
+
+    RETURN v_token;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
@@ -0,0 +1,39 @@
+-- ============================================
+-- MIGRACIÓN 017: WATERMARKS CON TOKEN DE FENCING
+-- ============================================
+-- insertar_notificaciones (migración 008) ya rechaza las escrituras de una
+-- réplica que perdió el lease. El watermark de cada agente se guarda con la
+-- misma verificación: una réplica con el lease vencido no puede adelantarlo
+-- ni atrasarlo después de que el nuevo titular lo escribió.
+
+CREATE OR REPLACE FUNCTION guardar_watermark_agente(
+    p_watermark JSONB,
+    p_lock VARCHAR DEFAULT NULL,
+    p_token BIGINT DEFAULT NULL
+)
+RETURNS VOID AS $$
+BEGIN
+    IF p_lock IS NOT NULL THEN
+        -- FOR SHARE: nadie puede tomar el lease hasta que termine esta escritura
+        PERFORM 1 FROM locks_agentes
+        WHERE nombre = p_lock AND token_fencing = p_token
+        FOR SHARE;
+
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Lock % perdido: token de fencing % obsoleto', p_lock, p_token;
+        END IF;
+    END IF;
+
+    INSERT INTO agentes_watermarks AS w (agente, token_cambios, umbral, fecha_escaneo_completo, actualizado)
+    SELECT p_watermark->>'agente',
+           (p_watermark->>'token_cambios')::BIGINT,
+           (p_watermark->>'umbral')::DATE,
+           (p_watermark->>'fecha_escaneo_completo')::TIMESTAMPTZ,
+           now()
+    ON CONFLICT (agente) DO UPDATE SET
+        token_cambios = EXCLUDED.token_cambios,
+        umbral = EXCLUDED.umbral,
+        fecha_escaneo_completo = EXCLUDED.fecha_escaneo_completo,
+        actualizado = EXCLUDED.actualizado;
+END;
+$$ LANGUAGE plpgsql;
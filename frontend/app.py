@@ -53,10 +53,24 @@ def get_dashboard_data():
         st.error(f"Error al obtener datos del dashboard: {e}")
         return None
 
-def get_notificaciones():
-    """Obtiene las notificaciones no leídas"""
+def get_conteo_notificaciones():
+    """Obtiene el número de notificaciones no leídas (contadores precalculados)"""
     try:
-        response = requests.get(f"{API_URL}/api/agents/notificaciones?leida=false", timeout=10)
+        response = requests.get(f"{API_URL}/api/agents/notificaciones/count", timeout=10)
+        if response.status_code == 200:
+            return response.json().get('no_leidas', 0)
+        return 0
+    except:
+        return 0
+
+def get_notificaciones(limit: int = 5):
+    """Obtiene las notificaciones no leídas más recientes"""
+    try:
+        response = requests.get(
+            f"{API_URL}/api/agents/notificaciones",
+            params={"leida": "false", "limit": limit, "con_equipo": "false"},
+            timeout=10
+        )
         if response.status_code == 200:
             return response.json()
         return []
@@ -76,11 +90,11 @@ with st.sidebar:
     
     st.markdown("---")
     st.markdown("### 🔔 Notificaciones")
-    notificaciones = get_notificaciones()
-    if notificaciones:
-        st.warning(f"**{len(notificaciones)}** notificaciones pendientes")
+    pendientes = get_conteo_notificaciones()
+    if pendientes:
+        st.warning(f"**{pendientes}** notificaciones pendientes")
         with st.expander("Ver notificaciones"):
-            for notif in notificaciones[:5]:
+            for notif in get_notificaciones(limit=5):
                 st.markdown(f"**{notif.get('titulo', 'Sin título')}**")
                 st.caption(notif.get('mensaje', '')[:100] + "...")
                 st.divider()
@@ -90,17 +104,32 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("### ⚙️ Sistema")
     if st.button("🔄 Ejecutar Agentes", use_container_width=True):
-        with st.spinner("Ejecutando agentes inteligentes..."):
-            try:
-                response = requests.post(f"{API_URL}/api/agents/run-all-agents", timeout=30)
-                if response.status_code == 200:
-                    result = response.json()
-                    st.success(f"✅ Agentes ejecutados: {result.get('total_notificaciones_creadas', 0)} notificaciones creadas")
+        try:
+            # La ejecución sigue en segundo plano; solo se guarda su id
+            response = requests.post(f"{API_URL}/api/agents/run-all-agents", timeout=10)
+            if response.status_code == 200:
+                st.session_state.ejecucion_agentes = response.json().get('run_id')
+            else:
+                st.error("❌ Error al ejecutar agentes")
+        except Exception as e:
+            st.error(f"❌ Error: {e}")
+    
+    if st.session_state.get('ejecucion_agentes'):
+        run_id = st.session_state.ejecucion_agentes
+        try:
+            ejecucion = requests.get(f"{API_URL}/api/agents/runs/{run_id}", timeout=5).json()
+            if ejecucion.get('estado') == 'completada':
+                st.success(f"✅ Ejecución #{run_id}: {ejecucion.get('total_notificaciones', 0)} notificaciones creadas")
+            elif ejecucion.get('estado') == 'omitida':
+                st.info(f"ℹ️ Ejecución #{run_id} omitida: otra instancia ya estaba ejecutando los agentes")
+            elif ejecucion.get('estado') == 'error':
+                st.error(f"❌ Ejecución #{run_id} con error: {ejecucion.get('error')}")
+            else:
+                st.info(f"⏳ Ejecución #{run_id} en curso...")
+                if st.button("Actualizar estado", use_container_width=True):
                     st.rerun()
-                else:
-                    st.error("❌ Error al ejecutar agentes")
-            except Exception as e:
-                st.error(f"❌ Error: {e}")
+        except Exception as e:
+            st.caption(f"No se pudo consultar la ejecución #{run_id}: {e}")
 
 # Dashboard principal
 dashboard_data = get_dashboard_data()
@@ -17,6 +17,34 @@ tab1, tab2, tab3 = st.tabs(["📋 Lista de Equipos", "➕ Nuevo Equipo", "📊 E
 with tab1:
     st.markdown("### 📋 Inventario de Equipos")
     
+    # Búsqueda rápida por texto (tolera errores de tipeo)
+    texto_busqueda = st.text_input("🔎 Búsqueda rápida", placeholder="Ej: Dell Latitude, SN123456789, PC-2024-001")
+    if len(texto_busqueda.strip()) >= 2:
+        try:
+            response = requests.get(
+                f"{API_URL}/api/equipos/search",
+                params={"q": texto_busqueda.strip(), "page_size": 20},
+                timeout=10
+            )
+            if response.status_code == 200:
+                busqueda = response.json()
+                if busqueda['resultados']:
+                    st.caption(f"{busqueda['total']} coincidencias (mostrando las {len(busqueda['resultados'])} más relevantes)")
+                    st.dataframe(pd.DataFrame([{
+                        "Código": r.get('codigo_inventario'),
+                        "Nombre": r.get('nombre'),
+                        "Marca": r.get('marca'),
+                        "Modelo": r.get('modelo'),
+                        "Serie": r.get('numero_serie'),
+                        "Estado": r.get('estado_operativo')
+                    } for r in busqueda['resultados']]), use_container_width=True)
+                else:
+                    st.info("Sin coincidencias")
+            else:
+                st.error("Error al buscar equipos")
+        except Exception as e:
+            st.error(f"Error: {e}")
+    
     # Filtros
     col1, col2, col3 = st.columns(3)
     
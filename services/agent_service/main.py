@@ -1,8 +1,20 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Header, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from supabase import create_client, Client
+import asyncio
+import base64
+import json
 import os
-from datetime import date, datetime, timedelta
-from typing import List, Dict
+import random
+import socket
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, List, Dict, Optional
+
+from comun import registro_cambios
 
 app = FastAPI(title="Agent Service", version="1.0.0")
 
@@ -18,49 +30,249 @@ supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 # Configuración de agentes
 AGENT_RUN_INTERVAL_HOURS = int(os.getenv("AGENT_RUN_INTERVAL_HOURS", "24"))
 AGENT_MAINTENANCE_CHECK_DAYS = int(os.getenv("AGENT_MAINTENANCE_CHECK_DAYS", "7"))
+# Fracción del costo de compra que, gastada en mantenimiento en un año, dispara la alerta
+AGENT_MAINTENANCE_COST_RATIO = float(os.getenv("AGENT_MAINTENANCE_COST_RATIO", "0.5"))
+
+# Planificador: intervalo <= 0 lo desactiva; el jitter reparte las ejecuciones de varias instancias
+AGENT_RUN_JITTER_SECONDS = int(os.getenv("AGENT_RUN_JITTER_SECONDS", "300"))
+AGENT_SCHEDULER_RETRY_SECONDS = int(os.getenv("AGENT_SCHEDULER_RETRY_SECONDS", "60"))
+
+# Lecturas y escrituras por lotes de los agentes
+AGENT_PAGE_SIZE = int(os.getenv("AGENT_PAGE_SIZE", "1000"))
+AGENT_INSERT_BATCH_SIZE = int(os.getenv("AGENT_INSERT_BATCH_SIZE", "500"))
+IN_CHUNK_SIZE = 200
+
+# Evaluación incremental: cada cuántos días se fuerza un escaneo completo (0 = siempre completo)
+AGENT_FULL_SCAN_DAYS = int(os.getenv("AGENT_FULL_SCAN_DAYS", "7"))
+
+# Agentes ejecutados en paralelo (en hilos, fuera del event loop)
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "4"))
+
+# Lease distribuido: solo una réplica ejecuta los agentes a la vez
+AGENT_LOCK_NAME = "agentes"
+AGENT_LOCK_TTL_SECONDS = int(os.getenv("AGENT_LOCK_TTL_SECONDS", "900"))
+INSTANCIA_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# Métricas del agente en ejecución (cada hilo de agente tiene su propio contexto)
+metricas_agente: ContextVar[Optional[dict]] = ContextVar("metricas_agente", default=None)
+
+# Token de fencing del lease de la ejecución en curso (lo heredan los hilos de los agentes)
+token_fencing: ContextVar[Optional[int]] = ContextVar("token_fencing", default=None)
+
+# Ejecución en curso (una sola a la vez por proceso; entre réplicas decide el lease) y tarea del planificador
+ejecucion_actual: Dict = {"registro": None, "tarea": None}
+ejecucion_lock = asyncio.Lock()
+tarea_planificador: Optional[asyncio.Task] = None
+
+# Configuración del registro de cambios (sincronización incremental)
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", "500"))
+
+# Stream SSE de notificaciones: un único lector por réplica reparte los cambios a todos los clientes
+SELECT_NOTIFICACIONES = "*, equipos(codigo_inventario, nombre)"
+# Sondeo de respaldo para cambios hechos por otras réplicas (mínimo 1 segundo)
+NOTIFICACIONES_STREAM_POLL_SECONDS = max(float(os.getenv("NOTIFICACIONES_STREAM_POLL_SECONDS", "30")), 1.0)
+NOTIFICACIONES_STREAM_HEARTBEAT_SECONDS = float(os.getenv("NOTIFICACIONES_STREAM_HEARTBEAT_SECONDS", "15"))
+NOTIFICACIONES_STREAM_QUEUE_SIZE = 100
+
+# Paginación de notificaciones por cursor (fecha_creacion, id)
+NOTIFICACIONES_MAX_LIMIT = int(os.getenv("NOTIFICACIONES_MAX_LIMIT", "200"))
+# Máximo de ids por operación masiva (viajan en la URL del filtro IN)
+NOTIFICACIONES_BULK_MAX_IDS = 1000
+
+# Retención: las leídas hace más de N días pasan a notificaciones_archivo (0 = no archivar)
+NOTIFICACIONES_RETENCION_DIAS = int(os.getenv("NOTIFICACIONES_RETENCION_DIAS", "90"))
+NOTIFICACIONES_ARCHIVO_LOTE = int(os.getenv("NOTIFICACIONES_ARCHIVO_LOTE", "5000"))
+
+suscriptores_stream: set = set()
+difusion: Dict = {"token": None, "despertar": asyncio.Event(), "tarea": None}
+
+# ============================================
+# MODELOS PYDANTIC
+# ============================================
+
+class SeleccionNotificaciones(BaseModel):
+    """Notificaciones afectadas por una operación masiva: ids y/o filtros (se combinan con AND)"""
+    ids: List[int] = []
+    tipo: Optional[str] = None
+    prioridad: Optional[str] = None
+    equipo_id: Optional[int] = None
+    antes_de: Optional[date] = None
+    leida: Optional[bool] = None
+
+# ============================================
+# FUNCIONES AUXILIARES
+# ============================================
+
+def registrar_consulta(filas: int = 0):
+    """Contar una consulta y las filas leídas en las métricas del agente actual"""
+    metricas = metricas_agente.get()
+    if metricas is not None:
+        metricas['consultas'] += 1
+        metricas['filas_examinadas'] += filas
+
+def leer_candidatos(tabla: str, select: str, filtrar: Callable) -> List[dict]:
+    """Leer todas las filas candidatas en páginas keyset por id (PostgREST limita las respuestas)"""
+    filas = []
+    ultimo_id = 0
+    while True:
+        data = filtrar(supabase.table(tabla).select(select)).gt(
+            "id", ultimo_id
+        ).order("id").limit(AGENT_PAGE_SIZE).execute().data
+        registrar_consulta(len(data))
+        filas.extend(data)
+        if len(data) < AGENT_PAGE_SIZE:
+            return filas
+        ultimo_id = data[-1]['id']
+
+def token_cambios_actual() -> int:
+    """Último token del registro de cambios hasta el que todo ya está confirmado"""
+    token = registro_cambios.token_actual(supabase)
+    registrar_consulta(1)
+    return token
+
+def leer_ids_cambiados(tabla: str, desde_token: int) -> tuple:
+    """Ids de una tabla modificados después de un token, y el token hasta el que se leyó"""
+    ids, token, consultas = registro_cambios.leer_ids_cambiados(supabase, tabla, desde_token, CHANGES_PAGE_SIZE)
+    metricas = metricas_agente.get()
+    if metricas is not None:
+        metricas['consultas'] += consultas
+        metricas['filas_examinadas'] += len(ids)
+    return ids, token
+
+def leer_watermark(agente: str) -> Optional[dict]:
+    """Watermark persistido de un agente (None si nunca se ejecutó)"""
+    data = supabase.table("agentes_watermarks").select("*").eq("agente", agente).execute().data
+    registrar_consulta(len(data))
+    return data[0] if data else None
+
+def guardar_watermark(watermark: dict):
+    """Persistir el watermark de un agente una vez creadas sus notificaciones"""
+    # Mismo fencing que insertar_notificaciones: falla si esta réplica perdió el lease
+    supabase.rpc("guardar_watermark_agente", {
+        "p_watermark": watermark,
+        "p_lock": AGENT_LOCK_NAME if token_fencing.get() is not None else None,
+        "p_token": token_fencing.get()
+    }).execute()
+    registrar_consulta()
+
+def requiere_escaneo_completo(watermark: Optional[dict]) -> bool:
+    """Sin watermark, o con el último escaneo completo vencido, se revisa toda la ventana"""
+    if watermark is None or AGENT_FULL_SCAN_DAYS <= 0:
+        return True
+    ultimo = datetime.fromisoformat(watermark['fecha_escaneo_completo'].replace("Z", "+00:00"))
+    return datetime.now(timezone.utc) - ultimo >= timedelta(days=AGENT_FULL_SCAN_DAYS)
+
+def leer_candidatos_agente(agente: str, tabla: str, select: str, filtrar: Callable,
+                           columna_fecha: str, umbral: date) -> tuple:
+    """Candidatos de un agente y su nuevo watermark.
+
+    filtrar aplica la condición completa del agente; umbral es el límite
+    (inclusive) de columna_fecha que esa condición acepta hoy. En modo
+    incremental solo se leen las filas cambiadas desde el último token y las
+    que cruzaron el umbral desde la ejecución anterior.
+    """
+    watermark = leer_watermark(agente)
+    
+    if requiere_escaneo_completo(watermark):
+        # El token se toma antes de leer: lo que cambie durante el escaneo se revisa en la próxima
+        token = token_cambios_actual()
+        filas = leer_candidatos(tabla, select, filtrar)
+        nuevo = {
+            "agente": agente,
+            "token_cambios": token,
+            "umbral": str(umbral),
+            "fecha_escaneo_completo": datetime.now(timezone.utc).isoformat()
+        }
+        return filas, nuevo, "completo"
+    
+    ids_cambiados, token = leer_ids_cambiados(tabla, watermark['token_cambios'])
+    
+    # Filas sin cambios que entraron en la ventana solo por el paso del tiempo
+    filas = {
+        fila['id']: fila
+        for fila in leer_candidatos(tabla, select, lambda q: filtrar(q).gt(columna_fecha, watermark['umbral']))
+    }
+    
+    # Filas cambiadas que cumplen la condición
+    pendientes = sorted(ids_cambiados - filas.keys())
+    for i in range(0, len(pendientes), IN_CHUNK_SIZE):
+        data = filtrar(supabase.table(tabla).select(select)).in_(
+            "id", pendientes[i:i + IN_CHUNK_SIZE]
+        ).execute().data
+        registrar_consulta(len(data))
+        filas.update((fila['id'], fila) for fila in data)
+    
+    nuevo = {
+        "agente": agente,
+        "token_cambios": token,
+        "umbral": str(max(umbral, date.fromisoformat(watermark['umbral']))),
+        "fecha_escaneo_completo": watermark['fecha_escaneo_completo']
+    }
+    return [filas[fila_id] for fila_id in sorted(filas)], nuevo, "incremental"
+
+def clave_dedup(notificacion: dict) -> str:
+    """Clave de deduplicación: tipo + mantenimiento o equipo relacionado (ver migración 008)"""
+    if notificacion.get('mantenimiento_relacionado_id') is not None:
+        return f"{notificacion['tipo']}:m{notificacion['mantenimiento_relacionado_id']}"
+    return f"{notificacion['tipo']}:e{notificacion['equipo_relacionado_id']}"
+
+def insertar_notificaciones(notificaciones: List[dict]) -> int:
+    """Insertar notificaciones en lotes; la base ignora las que ya tienen una pendiente sin leer"""
+    insertadas = 0
+    for i in range(0, len(notificaciones), AGENT_INSERT_BATCH_SIZE):
+        lote = [{**n, "clave_dedup": clave_dedup(n)} for n in notificaciones[i:i + AGENT_INSERT_BATCH_SIZE]]
+        # El token de fencing hace fallar la inserción si esta réplica perdió el lease
+        response = supabase.rpc("insertar_notificaciones", {
+            "p_notificaciones": lote,
+            "p_lock": AGENT_LOCK_NAME if token_fencing.get() is not None else None,
+            "p_token": token_fencing.get()
+        }).execute()
+        registrar_consulta()
+        insertadas += response.data or 0
+    return insertadas
 
 # ============================================
 # FUNCIONES DE AGENTES
 # ============================================
 
-async def agent_verificar_mantenimientos_pendientes():
+def agent_verificar_mantenimientos_pendientes():
     """Agente que verifica mantenimientos próximos a vencer"""
     try:
         hoy = date.today()
         fecha_limite = hoy + timedelta(days=AGENT_MAINTENANCE_CHECK_DAYS)
         
         # Buscar mantenimientos programados próximos
-        response = supabase.table("mantenimientos").select(
-            "*, equipos(codigo_inventario, nombre)"
-        ).eq("estado", "programado").gte("fecha_programada", str(hoy)).lte("fecha_programada", str(fecha_limite)).execute()
-        
-        notificaciones_creadas = 0
+        mantenimientos, watermark, modo = leer_candidatos_agente(
+            "verificar_mantenimientos_pendientes",
+            "mantenimientos",
+            "id, equipo_id, tipo, fecha_programada, equipos(codigo_inventario, nombre)",
+            lambda q: q.eq("estado", "programado").gte("fecha_programada", str(hoy)).lte("fecha_programada", str(fecha_limite)),
+            "fecha_programada", fecha_limite
+        )
         
-        for mant in response.data:
-            # Verificar si ya existe notificación para este mantenimiento
-            notif_existente = supabase.table("notificaciones").select("id").eq("mantenimiento_relacionado_id", mant['id']).eq("leida", False).execute()
+        notificaciones = []
+        for mant in mantenimientos:
+            equipo_nombre = mant['equipos']['nombre'] if mant.get('equipos') else 'Equipo desconocido'
+            fecha_prog = mant['fecha_programada']
             
-            if not notif_existente.data:
-                # Crear notificación
-                equipo_nombre = mant['equipos']['nombre'] if mant.get('equipos') else 'Equipo desconocido'
-                fecha_prog = mant['fecha_programada']
-                
-                notificacion = {
-                    "tipo": "mantenimiento",
-                    "titulo": "Mantenimiento Programado Próximo",
-                    "mensaje": f"El equipo '{equipo_nombre}' tiene un mantenimiento {mant['tipo']} programado para el {fecha_prog}",
-                    "prioridad": "media",
-                    "mantenimiento_relacionado_id": mant['id'],
-                    "equipo_relacionado_id": mant['equipo_id']
-                }
-                
-                supabase.table("notificaciones").insert(notificacion).execute()
-                notificaciones_creadas += 1
+            notificaciones.append({
+                "tipo": "mantenimiento",
+                "titulo": "Mantenimiento Programado Próximo",
+                "mensaje": f"El equipo '{equipo_nombre}' tiene un mantenimiento {mant['tipo']} programado para el {fecha_prog}",
+                "prioridad": "media",
+                "mantenimiento_relacionado_id": mant['id'],
+                "equipo_relacionado_id": mant['equipo_id']
+            })
+        
+        creadas = insertar_notificaciones(notificaciones)
+        guardar_watermark(watermark)
         
         return {
             "agente": "verificar_mantenimientos_pendientes",
             "ejecutado": True,
-            "notificaciones_creadas": notificaciones_creadas
+            "modo": modo,
+            "candidatos": len(mantenimientos),
+            "notificaciones_creadas": creadas
         }
     
     except Exception as e:
@@ -70,40 +282,43 @@ async def agent_verificar_mantenimientos_pendientes():
             "error": str(e)
         }
 
-async def agent_verificar_garantias():
+def agent_verificar_garantias():
     """Agente que verifica garantías próximas a vencer"""
     try:
         hoy = date.today()
         fecha_limite = hoy + timedelta(days=30)
         
         # Buscar equipos con garantía próxima a vencer
-        response = supabase.table("equipos").select("id, codigo_inventario, nombre, fecha_garantia_fin").not_.is_("fecha_garantia_fin", "null").gte("fecha_garantia_fin", str(hoy)).lte("fecha_garantia_fin", str(fecha_limite)).execute()
-        
-        notificaciones_creadas = 0
+        equipos, watermark, modo = leer_candidatos_agente(
+            "verificar_garantias",
+            "equipos",
+            "id, codigo_inventario, nombre, fecha_garantia_fin",
+            lambda q: q.not_.is_("fecha_garantia_fin", "null").gte("fecha_garantia_fin", str(hoy)).lte("fecha_garantia_fin", str(fecha_limite)),
+            "fecha_garantia_fin", fecha_limite
+        )
         
-        for equipo in response.data:
-            # Verificar si ya existe notificación
-            notif_existente = supabase.table("notificaciones").select("id").eq("equipo_relacionado_id", equipo['id']).eq("tipo", "garantia").eq("leida", False).execute()
+        notificaciones = []
+        for equipo in equipos:
+            fecha_fin = equipo['fecha_garantia_fin']
+            dias_restantes = (datetime.strptime(fecha_fin, '%Y-%m-%d').date() - hoy).days
             
-            if not notif_existente.data:
-                fecha_fin = equipo['fecha_garantia_fin']
-                dias_restantes = (datetime.strptime(fecha_fin, '%Y-%m-%d').date() - hoy).days
-                
-                notificacion = {
-                    "tipo": "garantia",
-                    "titulo": "Garantía Próxima a Vencer",
-                    "mensaje": f"La garantía del equipo '{equipo['nombre']}' ({equipo['codigo_inventario']}) vence en {dias_restantes} días (fecha: {fecha_fin})",
-                    "prioridad": "alta",
-                    "equipo_relacionado_id": equipo['id']
-                }
-                
-                supabase.table("notificaciones").insert(notificacion).execute()
-                notificaciones_creadas += 1
+            notificaciones.append({
+                "tipo": "garantia",
+                "titulo": "Garantía Próxima a Vencer",
+                "mensaje": f"La garantía del equipo '{equipo['nombre']}' ({equipo['codigo_inventario']}) vence en {dias_restantes} días (fecha: {fecha_fin})",
+                "prioridad": "alta",
+                "equipo_relacionado_id": equipo['id']
+            })
+        
+        creadas = insertar_notificaciones(notificaciones)
+        guardar_watermark(watermark)
         
         return {
             "agente": "verificar_garantias",
             "ejecutado": True,
-            "notificaciones_creadas": notificaciones_creadas
+            "modo": modo,
+            "candidatos": len(equipos),
+            "notificaciones_creadas": creadas
         }
     
     except Exception as e:
@@ -113,42 +328,43 @@ async def agent_verificar_garantias():
             "error": str(e)
         }
 
-async def agent_verificar_equipos_obsoletos():
+def agent_verificar_equipos_obsoletos():
     """Agente que identifica equipos obsoletos (más de 5 años)"""
     try:
         hoy = date.today()
         fecha_limite = hoy - timedelta(days=5*365)  # 5 años atrás
         
-        # Buscar equipos antiguos
-        response = supabase.table("equipos").select("id, codigo_inventario, nombre, fecha_compra, estado_operativo").not_.is_("fecha_compra", "null").lte("fecha_compra", str(fecha_limite)).execute()
-        
-        notificaciones_creadas = 0
-        
-        for equipo in response.data:
-            # Solo notificar si el equipo está operativo (podría necesitar reemplazo)
-            if equipo.get('estado_operativo') == 'operativo':
-                # Verificar si ya existe notificación
-                notif_existente = supabase.table("notificaciones").select("id").eq("equipo_relacionado_id", equipo['id']).eq("tipo", "obsolescencia").eq("leida", False).execute()
-                
-                if not notif_existente.data:
-                    fecha_compra = equipo['fecha_compra']
-                    antiguedad_anios = (hoy - datetime.strptime(fecha_compra, '%Y-%m-%d').date()).days / 365
-                    
-                    notificacion = {
-                        "tipo": "obsolescencia",
-                        "titulo": "Equipo Obsoleto Detectado",
-                        "mensaje": f"El equipo '{equipo['nombre']}' ({equipo['codigo_inventario']}) tiene {int(antiguedad_anios)} años de antigüedad. Considere su reemplazo.",
-                        "prioridad": "media",
-                        "equipo_relacionado_id": equipo['id']
-                    }
-                    
-                    supabase.table("notificaciones").insert(notificacion).execute()
-                    notificaciones_creadas += 1
+        # Buscar equipos antiguos; solo los operativos (podrían necesitar reemplazo)
+        equipos, watermark, modo = leer_candidatos_agente(
+            "verificar_equipos_obsoletos",
+            "equipos",
+            "id, codigo_inventario, nombre, fecha_compra",
+            lambda q: q.eq("estado_operativo", "operativo").not_.is_("fecha_compra", "null").lte("fecha_compra", str(fecha_limite)),
+            "fecha_compra", fecha_limite
+        )
+        
+        notificaciones = []
+        for equipo in equipos:
+            fecha_compra = equipo['fecha_compra']
+            antiguedad_anios = (hoy - datetime.strptime(fecha_compra, '%Y-%m-%d').date()).days / 365
+            
+            notificaciones.append({
+                "tipo": "obsolescencia",
+                "titulo": "Equipo Obsoleto Detectado",
+                "mensaje": f"El equipo '{equipo['nombre']}' ({equipo['codigo_inventario']}) tiene {int(antiguedad_anios)} años de antigüedad. Considere su reemplazo.",
+                "prioridad": "media",
+                "equipo_relacionado_id": equipo['id']
+            })
+        
+        creadas = insertar_notificaciones(notificaciones)
+        guardar_watermark(watermark)
         
         return {
             "agente": "verificar_equipos_obsoletos",
             "ejecutado": True,
-            "notificaciones_creadas": notificaciones_creadas
+            "modo": modo,
+            "candidatos": len(equipos),
+            "notificaciones_creadas": creadas
         }
     
     except Exception as e:
@@ -158,43 +374,44 @@ async def agent_verificar_equipos_obsoletos():
             "error": str(e)
         }
 
-async def agent_verificar_mantenimientos_atrasados():
+def agent_verificar_mantenimientos_atrasados():
     """Agente que detecta mantenimientos atrasados"""
     try:
         hoy = date.today()
         
         # Buscar mantenimientos programados con fecha pasada
-        response = supabase.table("mantenimientos").select(
-            "*, equipos(codigo_inventario, nombre)"
-        ).eq("estado", "programado").lt("fecha_programada", str(hoy)).execute()
+        mantenimientos, watermark, modo = leer_candidatos_agente(
+            "verificar_mantenimientos_atrasados",
+            "mantenimientos",
+            "id, equipo_id, tipo, fecha_programada, equipos(codigo_inventario, nombre)",
+            lambda q: q.eq("estado", "programado").lt("fecha_programada", str(hoy)),
+            "fecha_programada", hoy - timedelta(days=1)
+        )
         
-        notificaciones_creadas = 0
-        
-        for mant in response.data:
-            # Verificar si ya existe notificación
-            notif_existente = supabase.table("notificaciones").select("id").eq("mantenimiento_relacionado_id", mant['id']).eq("tipo", "mantenimiento_atrasado").eq("leida", False).execute()
+        notificaciones = []
+        for mant in mantenimientos:
+            equipo_nombre = mant['equipos']['nombre'] if mant.get('equipos') else 'Equipo desconocido'
+            fecha_prog = mant['fecha_programada']
+            dias_atraso = (hoy - datetime.strptime(fecha_prog, '%Y-%m-%d').date()).days
             
-            if not notif_existente.data:
-                equipo_nombre = mant['equipos']['nombre'] if mant.get('equipos') else 'Equipo desconocido'
-                fecha_prog = mant['fecha_programada']
-                dias_atraso = (hoy - datetime.strptime(fecha_prog, '%Y-%m-%d').date()).days
-                
-                notificacion = {
-                    "tipo": "mantenimiento_atrasado",
-                    "titulo": "Mantenimiento Atrasado",
-                    "mensaje": f"El mantenimiento {mant['tipo']} del equipo '{equipo_nombre}' está atrasado {dias_atraso} días (programado: {fecha_prog})",
-                    "prioridad": "alta",
-                    "mantenimiento_relacionado_id": mant['id'],
-                    "equipo_relacionado_id": mant['equipo_id']
-                }
-                
-                supabase.table("notificaciones").insert(notificacion).execute()
-                notificaciones_creadas += 1
+            notificaciones.append({
+                "tipo": "mantenimiento_atrasado",
+                "titulo": "Mantenimiento Atrasado",
+                "mensaje": f"El mantenimiento {mant['tipo']} del equipo '{equipo_nombre}' está atrasado {dias_atraso} días (programado: {fecha_prog})",
+                "prioridad": "alta",
+                "mantenimiento_relacionado_id": mant['id'],
+                "equipo_relacionado_id": mant['equipo_id']
+            })
+        
+        creadas = insertar_notificaciones(notificaciones)
+        guardar_watermark(watermark)
         
         return {
             "agente": "verificar_mantenimientos_atrasados",
             "ejecutado": True,
-            "notificaciones_creadas": notificaciones_creadas
+            "modo": modo,
+            "candidatos": len(mantenimientos),
+            "notificaciones_creadas": creadas
         }
     
     except Exception as e:
@@ -204,6 +421,452 @@ async def agent_verificar_mantenimientos_atrasados():
             "error": str(e)
         }
 
+def agent_analizar_costos_mantenimiento():
+    """Agente que detecta equipos con costos de mantenimiento altos respecto a su costo de compra"""
+    try:
+        desde = date.today() - timedelta(days=365)
+        
+        # Una sola consulta agregada en la base (ver migración 009)
+        equipos = supabase.rpc("analizar_costos_mantenimiento", {
+            "p_desde": str(desde),
+            "p_umbral": AGENT_MAINTENANCE_COST_RATIO
+        }).execute().data or []
+        registrar_consulta(len(equipos))
+        
+        notificaciones = []
+        for equipo in equipos:
+            costo = float(equipo['costo_mantenimiento'])
+            porcentaje = costo / float(equipo['costo_compra']) * 100
+            
+            notificaciones.append({
+                "tipo": "alto_costo_mantenimiento",
+                "titulo": "Equipo con Altos Costos de Mantenimiento",
+                "mensaje": f"El equipo '{equipo['nombre']}' ({equipo['codigo_inventario']}) ha generado S/. {costo:,.2f} en {equipo['num_mantenimientos']} mantenimientos durante el último año ({int(porcentaje)}% de su costo de compra). Se recomienda evaluar su reemplazo.",
+                "prioridad": "alta",
+                "equipo_relacionado_id": equipo['equipo_id']
+            })
+        
+        return {
+            "agente": "analizar_costos_mantenimiento",
+            "ejecutado": True,
+            "modo": "agregado",
+            "candidatos": len(equipos),
+            "notificaciones_creadas": insertar_notificaciones(notificaciones)
+        }
+    
+    except Exception as e:
+        return {
+            "agente": "analizar_costos_mantenimiento",
+            "ejecutado": False,
+            "error": str(e)
+        }
+
+def archivar_notificaciones(dias: int) -> int:
+    """Mover a notificaciones_archivo las leídas hace más de `dias` días, por lotes (ver migración 011)"""
+    total = 0
+    while True:
+        movidas = supabase.rpc("archivar_notificaciones", {
+            "p_dias": dias,
+            "p_lote": NOTIFICACIONES_ARCHIVO_LOTE
+        }).execute().data or 0
+        registrar_consulta(movidas)
+        total += movidas
+        if movidas < NOTIFICACIONES_ARCHIVO_LOTE:
+            return total
+
+def tarea_archivar_notificaciones():
+    """Retención de notificaciones; corre tras los agentes en las ejecuciones programadas"""
+    try:
+        return {
+            "agente": "archivar_notificaciones",
+            "ejecutado": True,
+            "archivadas": archivar_notificaciones(NOTIFICACIONES_RETENCION_DIAS)
+        }
+    
+    except Exception as e:
+        return {
+            "agente": "archivar_notificaciones",
+            "ejecutado": False,
+            "error": str(e)
+        }
+
+AGENTES = [
+    agent_verificar_mantenimientos_pendientes,
+    agent_verificar_garantias,
+    agent_verificar_equipos_obsoletos,
+    agent_verificar_mantenimientos_atrasados,
+    agent_analizar_costos_mantenimiento
+]
+
+def medir_agente(agente: Callable) -> dict:
+    """Ejecutar un agente midiendo tiempo, consultas y filas examinadas"""
+    metricas = {"consultas": 0, "filas_examinadas": 0}
+    metricas_agente.set(metricas)
+    inicio = time.perf_counter()
+    resultado = agente()
+    resultado.update(duracion_ms=round((time.perf_counter() - inicio) * 1000, 1), **metricas)
+    return resultado
+
+async def ejecutar_agentes() -> List[dict]:
+    """Ejecutar todos los agentes en paralelo acotado, fuera del event loop"""
+    semaforo = asyncio.Semaphore(AGENT_MAX_CONCURRENCY)
+    
+    async def ejecutar(agente: Callable) -> dict:
+        async with semaforo:
+            # to_thread copia el contexto: cada agente acumula sus propias métricas
+            return await asyncio.to_thread(medir_agente, agente)
+    
+    return await asyncio.gather(*(ejecutar(agente) for agente in AGENTES))
+
+# ============================================
+# EJECUCIONES Y PLANIFICADOR
+# ============================================
+
+def crear_registro_ejecucion(origen: str) -> dict:
+    """Registrar el inicio de una ejecución de agentes"""
+    return supabase.table("ejecuciones_agentes").insert({
+        "origen": origen,
+        "estado": "en_proceso",
+        "fecha_inicio": datetime.now(timezone.utc).isoformat()
+    }).execute().data[0]
+
+def registrar_ejecucion_omitida(origen: str, motivo: str) -> dict:
+    """Registrar una ejecución que no se lanzó (cuenta igual para el calendario del planificador)"""
+    ahora = datetime.now(timezone.utc).isoformat()
+    return supabase.table("ejecuciones_agentes").insert({
+        "origen": origen,
+        "estado": "omitida",
+        "fecha_inicio": ahora,
+        "fecha_fin": ahora,
+        "duracion_ms": 0,
+        "error": motivo
+    }).execute().data[0]
+
+def cerrar_registro_ejecucion(ejecucion_id: int, cambios: dict) -> dict:
+    """Guardar el resultado final de una ejecución de agentes"""
+    cambios["fecha_fin"] = datetime.now(timezone.utc).isoformat()
+    return supabase.table("ejecuciones_agentes").update(cambios).eq("id", ejecucion_id).execute().data[0]
+
+def adquirir_lock_agentes() -> Optional[int]:
+    """Tomar el lease de ejecución; devuelve el token de fencing o None si otra réplica lo tiene"""
+    return supabase.rpc("adquirir_lock", {
+        "p_nombre": AGENT_LOCK_NAME,
+        "p_propietario": INSTANCIA_ID,
+        "p_ttl_segundos": AGENT_LOCK_TTL_SECONDS
+    }).execute().data
+
+def renovar_lock_agentes(token: int) -> bool:
+    """Extender el lease; False si otra réplica ya tomó un token más nuevo"""
+    return bool(supabase.rpc("renovar_lock", {
+        "p_nombre": AGENT_LOCK_NAME,
+        "p_token": token,
+        "p_ttl_segundos": AGENT_LOCK_TTL_SECONDS
+    }).execute().data)
+
+def liberar_lock_agentes(token: int):
+    """Liberar el lease si todavía nos pertenece"""
+    supabase.rpc("liberar_lock", {"p_nombre": AGENT_LOCK_NAME, "p_token": token}).execute()
+
+async def mantener_lease(token: int):
+    """Renovar el lease cada tercio del TTL mientras dure la ejecución"""
+    while True:
+        await asyncio.sleep(AGENT_LOCK_TTL_SECONDS / 3)
+        try:
+            if not await asyncio.to_thread(renovar_lock_agentes, token):
+                # El fencing rechazará las inserciones que queden de esta ejecución
+                print(f"Lease de agentes perdido (token {token})")
+                return
+        except Exception as e:
+            print(f"Error al renovar el lease de agentes: {e}")
+
+async def completar_ejecucion(registro: dict) -> dict:
+    """Ejecutar los agentes bajo el lease distribuido y cerrar el registro de la ejecución"""
+    inicio = time.perf_counter()
+    token = None
+    renovacion = None
+    try:
+        token = await asyncio.to_thread(adquirir_lock_agentes)
+        if token is None:
+            cambios = {"estado": "omitida", "error": "Otra réplica está ejecutando los agentes"}
+        else:
+            renovacion = asyncio.create_task(mantener_lease(token))
+            # Se copia al contexto de cada hilo de agente (ver insertar_notificaciones)
+            token_fencing.set(token)
+            resultados = await ejecutar_agentes()
+            if registro['origen'] == "programada" and NOTIFICACIONES_RETENCION_DIAS > 0:
+                resultados.append(await asyncio.to_thread(medir_agente, tarea_archivar_notificaciones))
+            cambios = {
+                "estado": "completada",
+                "total_notificaciones": sum(r.get('notificaciones_creadas', 0) for r in resultados),
+                "resultados": resultados
+            }
+    except Exception as e:
+        cambios = {"estado": "error", "error": str(e)}
+    finally:
+        if renovacion is not None:
+            renovacion.cancel()
+        if token is not None:
+            try:
+                await asyncio.to_thread(liberar_lock_agentes, token)
+            except Exception as e:
+                print(f"Error al liberar el lease de agentes: {e}")
+    
+    if cambios.get("total_notificaciones") or any(r.get('archivadas') for r in cambios.get("resultados", [])):
+        avisar_cambio_notificaciones()
+    
+    cambios["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    final = await asyncio.to_thread(cerrar_registro_ejecucion, registro['id'], cambios)
+    ejecucion_actual["registro"] = final
+    return final
+
+async def iniciar_ejecucion(origen: str) -> dict:
+    """Lanzar una ejecución en segundo plano, o devolver la que ya está en curso"""
+    async with ejecucion_lock:
+        tarea = ejecucion_actual["tarea"]
+        if tarea is not None and not tarea.done():
+            return {**ejecucion_actual["registro"], "ya_en_curso": True}
+        
+        registro = await asyncio.to_thread(crear_registro_ejecucion, origen)
+        ejecucion_actual["registro"] = registro
+        ejecucion_actual["tarea"] = asyncio.create_task(completar_ejecucion(registro))
+        return {**registro, "ya_en_curso": False}
+
+def ultima_ejecucion() -> Optional[datetime]:
+    """Fecha de inicio de la última ejecución programada (persistida entre reinicios).
+    Las ejecuciones manuales no desplazan el calendario."""
+    response = supabase.table("ejecuciones_agentes").select("fecha_inicio").eq("origen", "programada").order(
+        "fecha_inicio", desc=True
+    ).limit(1).execute()
+    if not response.data:
+        return None
+    return datetime.fromisoformat(response.data[0]['fecha_inicio'].replace("Z", "+00:00"))
+
+def segundos_hasta_proxima_ejecucion() -> float:
+    """Segundos hasta la próxima ejecución; 0 si se perdió alguna (recuperación al arrancar)"""
+    ultima = ultima_ejecucion()
+    if ultima is None:
+        return 0
+    proxima = ultima + timedelta(hours=AGENT_RUN_INTERVAL_HOURS)
+    return max(0.0, (proxima - datetime.now(timezone.utc)).total_seconds())
+
+async def planificador_agentes():
+    """Ejecutar los agentes cada AGENT_RUN_INTERVAL_HOURS horas"""
+    while True:
+        try:
+            # Se recalcula desde la base: tras una caída se recupera una sola ejecución perdida
+            espera = await asyncio.to_thread(segundos_hasta_proxima_ejecucion)
+            await asyncio.sleep(espera + random.uniform(0, AGENT_RUN_JITTER_SECONDS))
+            
+            # Otra réplica pudo registrar la ejecución programada durante la espera
+            if await asyncio.to_thread(segundos_hasta_proxima_ejecucion) > 0:
+                continue
+            
+            registro = await iniciar_ejecucion("programada")
+            if registro['ya_en_curso']:
+                # Hay una manual en curso: cubre esta ejecución. Se registra la programada como
+                # omitida para que el intervalo cuente desde ahora, y se espera a que termine
+                await asyncio.to_thread(
+                    registrar_ejecucion_omitida,
+                    "programada",
+                    f"Se unió a la ejecución {registro['origen']} en curso (id {registro['id']})"
+                )
+            await asyncio.shield(ejecucion_actual["tarea"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error en el planificador de agentes: {e}")
+            await asyncio.sleep(AGENT_SCHEDULER_RETRY_SECONDS)
+
+@app.on_event("startup")
+async def iniciar_planificador():
+    """Arrancar el planificador si hay un intervalo configurado"""
+    global tarea_planificador
+    if AGENT_RUN_INTERVAL_HOURS > 0:
+        tarea_planificador = asyncio.create_task(planificador_agentes())
+
+@app.on_event("shutdown")
+async def detener_planificador():
+    """Detener el planificador y esperar la ejecución en curso"""
+    if tarea_planificador is not None:
+        tarea_planificador.cancel()
+    tarea = ejecucion_actual["tarea"]
+    if tarea is not None and not tarea.done():
+        await asyncio.wait([tarea])
+
+# ============================================
+# PAGINACIÓN Y CONTADORES DE NOTIFICACIONES
+# ============================================
+
+def codificar_cursor(fila: dict) -> str:
+    """Cursor opaco con la clave (fecha_creacion, id) de la última fila entregada"""
+    return base64.urlsafe_b64encode(json.dumps([fila['fecha_creacion'], fila['id']]).encode()).decode()
+
+def decodificar_cursor(cursor: str) -> tuple:
+    try:
+        fecha, notificacion_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(fecha).isoformat(), int(notificacion_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def resumir_contadores(filas: List[dict]) -> dict:
+    """Totales y no leídas; los desgloses por tipo y prioridad cuentan solo las no leídas"""
+    resumen = {"total": 0, "no_leidas": 0, "no_leidas_por_tipo": {}, "no_leidas_por_prioridad": {}}
+    for fila in filas:
+        resumen["total"] += fila['total']
+        resumen["no_leidas"] += fila['no_leidas']
+        for clave, valor in (("no_leidas_por_tipo", fila['tipo']), ("no_leidas_por_prioridad", fila['prioridad'])):
+            resumen[clave][valor] = resumen[clave].get(valor, 0) + fila['no_leidas']
+    return resumen
+
+def solo_ids(query):
+    """Devolver solo el id de las filas afectadas por un update/delete.
+    Con return=minimal PostgREST responde 204 sin cuerpo y el cliente informa count=0
+    sin leer Content-Range; con la representación reducida a ids el conteo llega bien."""
+    query.params = query.params.add("select", "id")
+    return query
+
+def filtrar_seleccion(query, seleccion: SeleccionNotificaciones):
+    """Aplicar ids y filtros de una operación masiva; exige al menos un criterio"""
+    filtros = [seleccion.tipo, seleccion.prioridad, seleccion.equipo_id, seleccion.antes_de]
+    if not seleccion.ids and all(f is None for f in filtros):
+        raise HTTPException(status_code=400, detail="Indique ids o al menos un filtro")
+    if len(seleccion.ids) > NOTIFICACIONES_BULK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Máximo {NOTIFICACIONES_BULK_MAX_IDS} ids por operación")
+    
+    if seleccion.ids:
+        query = query.in_("id", seleccion.ids)
+    if seleccion.tipo is not None:
+        query = query.eq("tipo", seleccion.tipo)
+    if seleccion.prioridad is not None:
+        query = query.eq("prioridad", seleccion.prioridad)
+    if seleccion.equipo_id is not None:
+        query = query.eq("equipo_relacionado_id", seleccion.equipo_id)
+    if seleccion.antes_de is not None:
+        query = query.lt("fecha_creacion", str(seleccion.antes_de))
+    if seleccion.leida is not None:
+        query = query.eq("leida", seleccion.leida)
+    return query
+
+# ============================================
+# DIFUSIÓN DE NOTIFICACIONES (SSE)
+# ============================================
+
+def avisar_cambio_notificaciones():
+    """Despertar al difusor tras crear, marcar o eliminar notificaciones en esta réplica"""
+    difusion["despertar"].set()
+
+def leer_eventos_notificaciones(desde: int) -> List[dict]:
+    """Cambios de notificaciones posteriores a un token, una página por evento"""
+    eventos = []
+    while True:
+        cambios = registro_cambios.obtener_cambios(supabase, "notificaciones", desde, CHANGES_PAGE_SIZE, SELECT_NOTIFICACIONES)
+        if cambios['siguiente_token'] == desde:
+            return eventos
+        eventos.append({
+            "id": cambios['siguiente_token'],
+            "actualizados": cambios['actualizados'],
+            "eliminados": cambios['eliminados']
+        })
+        desde = cambios['siguiente_token']
+        if not cambios['hay_mas']:
+            return eventos
+
+def formato_sse(evento: dict) -> str:
+    datos = {k: v for k, v in evento.items() if k != "id"}
+    return f"id: {evento['id']}\nevent: notificaciones\ndata: {json.dumps(datos, default=str)}\n\n"
+
+async def difusor_notificaciones():
+    """Leer los cambios una vez por aviso (o sondeo) y repartirlos a los clientes conectados"""
+    if difusion["token"] is None:
+        difusion["token"] = await asyncio.to_thread(registro_cambios.token_actual, supabase)
+    
+    while suscriptores_stream:
+        try:
+            await asyncio.wait_for(difusion["despertar"].wait(), timeout=NOTIFICACIONES_STREAM_POLL_SECONDS)
+            difusion["despertar"].clear()
+            # El horizonte del registro de cambios retiene el último instante (migración 012)
+            await asyncio.sleep(registro_cambios.MARGEN_HORIZONTE_SEGUNDOS)
+        except asyncio.TimeoutError:
+            pass
+        
+        if not suscriptores_stream:
+            break
+        try:
+            eventos = await asyncio.to_thread(leer_eventos_notificaciones, difusion["token"])
+        except Exception as e:
+            print(f"Error al leer cambios de notificaciones: {e}")
+            continue
+        
+        for evento in eventos:
+            difusion["token"] = evento['id']
+            for cola in list(suscriptores_stream):
+                try:
+                    cola.put_nowait(evento)
+                except asyncio.QueueFull:
+                    # Cliente lento: se le cierra el stream y reanuda con Last-Event-ID
+                    suscriptores_stream.discard(cola)
+    
+    # Sin clientes no se lee nada; al volver a arrancar se parte del token actual
+    difusion["token"] = None
+
+def cerrar_streams():
+    """Desuscribir a todos los clientes; cada stream termina al recibir None"""
+    for cola in list(suscriptores_stream):
+        suscriptores_stream.discard(cola)
+        try:
+            cola.put_nowait(None)
+        except asyncio.QueueFull:
+            # La cola llena se descarta igual: el stream termina en el próximo heartbeat
+            pass
+
+@app.on_event("shutdown")
+async def detener_difusion():
+    """Detener el difusor y cerrar los streams que sigan abiertos"""
+    cerrar_streams()
+    tarea = difusion["tarea"]
+    if tarea is not None and not tarea.done():
+        tarea.cancel()
+        await asyncio.gather(tarea, return_exceptions=True)
+
+async def eventos_stream(request: Request, ultimo_id: Optional[int]):
+    """Generador SSE de un cliente: recuperación desde Last-Event-ID y luego cambios en vivo"""
+    cola = asyncio.Queue(maxsize=NOTIFICACIONES_STREAM_QUEUE_SIZE)
+    # Suscribirse antes de recuperar: lo que se difunda mientras tanto queda en la cola
+    suscriptores_stream.add(cola)
+    if difusion["tarea"] is None or difusion["tarea"].done():
+        difusion["tarea"] = asyncio.create_task(difusor_notificaciones())
+    
+    try:
+        yield f"retry: {int(NOTIFICACIONES_STREAM_HEARTBEAT_SECONDS * 1000)}\n\n"
+        if ultimo_id is None:
+            token = await asyncio.to_thread(registro_cambios.token_actual, supabase)
+            yield formato_sse({"id": token, "actualizados": [], "eliminados": []})
+        else:
+            token = ultimo_id
+            for evento in await asyncio.to_thread(leer_eventos_notificaciones, token):
+                yield formato_sse(evento)
+                token = evento['id']
+        
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=NOTIFICACIONES_STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if cola not in suscriptores_stream or await request.is_disconnected():
+                    break
+                yield ": ping\n\n"
+                continue
+            
+            # Cierre del servicio
+            if evento is None:
+                break
+            # Ya entregado durante la recuperación
+            if evento['id'] <= token:
+                continue
+            yield formato_sse(evento)
+            token = evento['id']
+    finally:
+        suscriptores_stream.discard(cola)
+
 # ============================================
 # ENDPOINTS
 # ============================================
@@ -213,39 +876,190 @@ async def health_check():
     return {"status": "healthy", "service": "agents"}
 
 @app.post("/run-all-agents")
-async def run_all_agents():
-    """Ejecutar todos los agentes inteligentes"""
+async def run_all_agents(esperar: bool = False):
+    """Lanzar todos los agentes inteligentes en segundo plano y devolver el id de la ejecución"""
     try:
-        resultados = []
-        
-        # Ejecutar cada agente
-        resultados.append(await agent_verificar_mantenimientos_pendientes())
-        resultados.append(await agent_verificar_garantias())
-        resultados.append(await agent_verificar_equipos_obsoletos())
-        resultados.append(await agent_verificar_mantenimientos_atrasados())
+        ejecucion = await iniciar_ejecucion("manual")
         
-        total_notificaciones = sum([r.get('notificaciones_creadas', 0) for r in resultados])
+        if esperar:
+            tarea = ejecucion_actual["tarea"]
+            ejecucion = {**await asyncio.shield(tarea), "ya_en_curso": ejecucion["ya_en_curso"]}
         
         return {
-            "mensaje": "Agentes ejecutados correctamente",
-            "total_notificaciones_creadas": total_notificaciones,
-            "resultados": resultados
+            "run_id": ejecucion['id'],
+            "estado": ejecucion['estado'],
+            "ya_en_curso": ejecucion['ya_en_curso'],
+            "total_notificaciones_creadas": ejecucion.get('total_notificaciones'),
+            "duracion_ms": ejecucion.get('duracion_ms'),
+            "resultados": ejecucion.get('resultados')
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/runs")
+async def get_ejecuciones(limit: int = Query(20, ge=1, le=200)):
+    """Listar las últimas ejecuciones de agentes"""
+    try:
+        response = supabase.table("ejecuciones_agentes").select(
+            "id, origen, estado, fecha_inicio, fecha_fin, duracion_ms, total_notificaciones, error"
+        ).order("id", desc=True).limit(limit).execute()
+        return response.data
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/runs/{run_id}")
+async def get_ejecucion(run_id: int):
+    """Obtener el estado y el resultado de una ejecución de agentes"""
+    try:
+        response = supabase.table("ejecuciones_agentes").select("*").eq("id", run_id).execute()
+        
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Ejecución no encontrada")
+        
+        return response.data[0]
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/notificaciones")
-async def get_notificaciones(leida: str = "false"):
-    """Obtener notificaciones"""
+async def get_notificaciones(
+    response: Response,
+    leida: str = "false",
+    tipo: Optional[str] = None,
+    prioridad: Optional[str] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=NOTIFICACIONES_MAX_LIMIT),
+    con_equipo: bool = True
+):
+    """Obtener notificaciones, de la más reciente a la más antigua.
+
+    Si hay más resultados, la cabecera X-Siguiente-Cursor trae el cursor
+    para pedir la página siguiente.
+    """
     try:
         leida_bool = leida.lower() == "true"
         
-        response = supabase.table("notificaciones").select(
-            "*, equipos(codigo_inventario, nombre)"
-        ).eq("leida", leida_bool).order("fecha_creacion", desc=True).limit(50).execute()
+        query = supabase.table("notificaciones").select(
+            SELECT_NOTIFICACIONES if con_equipo else "*"
+        ).eq("leida", leida_bool)
         
-        return response.data
+        if tipo:
+            query = query.eq("tipo", tipo)
+        if prioridad:
+            query = query.eq("prioridad", prioridad)
+        if desde:
+            query = query.gte("fecha_creacion", str(desde))
+        if hasta:
+            query = query.lt("fecha_creacion", str(hasta + timedelta(days=1)))
+        if cursor:
+            fecha, ultimo_id = decodificar_cursor(cursor)
+            query = query.or_(f'fecha_creacion.lt."{fecha}",and(fecha_creacion.eq."{fecha}",id.lt.{ultimo_id})')
+        
+        # Se pide una fila de más para saber si hay otra página
+        data = query.order("fecha_creacion", desc=True).order("id", desc=True).limit(limit + 1).execute().data
+        
+        if len(data) > limit:
+            data = data[:limit]
+            response.headers["X-Siguiente-Cursor"] = codificar_cursor(data[-1])
+        
+        return data
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/notificaciones/count")
+async def contar_notificaciones(tipo: Optional[str] = None, prioridad: Optional[str] = None):
+    """Contar notificaciones desde los contadores mantenidos por triggers (ver migración 010)"""
+    try:
+        query = supabase.table("notificaciones_contadores").select("tipo, prioridad, total, no_leidas")
+        if tipo:
+            query = query.eq("tipo", tipo)
+        if prioridad:
+            query = query.eq("prioridad", prioridad)
+        
+        return resumir_contadores(query.execute().data)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/notificaciones/changes")
+async def get_cambios_notificaciones(since: Optional[int] = None, limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=5000)):
+    """Obtener notificaciones creadas, modificadas o eliminadas después de un token
+
+    Solo se entregan cambios ya confirmados: si una transacción abierta tiene un cambio
+    pendiente, los posteriores esperan a que confirme (el token nunca lo salta).
+    """
+    try:
+        return registro_cambios.obtener_cambios(supabase, "notificaciones", since, limit, SELECT_NOTIFICACIONES)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/notificaciones/stream")
+async def stream_notificaciones(
+    request: Request,
+    ultimo_id: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None)
+):
+    """Stream SSE de cambios de notificaciones; reanuda desde Last-Event-ID (o ultimo_id)"""
+    return StreamingResponse(
+        eventos_stream(request, last_event_id if last_event_id is not None else ultimo_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/notificaciones/marcar-leidas")
+async def marcar_notificaciones_leidas(seleccion: SeleccionNotificaciones):
+    """Marcar como leídas varias notificaciones en una sola sentencia"""
+    try:
+        query = supabase.table("notificaciones").update({
+            "leida": True,
+            "fecha_leida": datetime.now().isoformat()
+        }, count="exact")
+        # Solo las no leídas: no se pisa la fecha_leida de las ya leídas
+        response = solo_ids(filtrar_seleccion(query, seleccion).eq("leida", False)).execute()
+        
+        if response.count:
+            avisar_cambio_notificaciones()
+        return {"actualizadas": response.count or 0}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/notificaciones/eliminar")
+async def eliminar_notificaciones(seleccion: SeleccionNotificaciones):
+    """Eliminar varias notificaciones en una sola sentencia"""
+    try:
+        query = supabase.table("notificaciones").delete(count="exact")
+        response = solo_ids(filtrar_seleccion(query, seleccion)).execute()
+        
+        if response.count:
+            avisar_cambio_notificaciones()
+        return {"eliminadas": response.count or 0}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/notificaciones/archivar")
+async def archivar_notificaciones_leidas(dias: int = Query(NOTIFICACIONES_RETENCION_DIAS, ge=1)):
+    """Archivar ahora las notificaciones leídas hace más de `dias` días"""
+    try:
+        archivadas = await asyncio.to_thread(archivar_notificaciones, dias)
+        
+        if archivadas:
+            avisar_cambio_notificaciones()
+        return {"archivadas": archivadas, "dias": dias}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -262,6 +1076,7 @@ async def marcar_notificacion_leida(notificacion_id: int):
         if not response.data:
             raise HTTPException(status_code=404, detail="Notificación no encontrada")
         
+        avisar_cambio_notificaciones()
         return {"message": "Notificación marcada como leída"}
     
     except HTTPException:
@@ -278,6 +1093,7 @@ async def delete_notificacion(notificacion_id: int):
         if not response.data:
             raise HTTPException(status_code=404, detail="Notificación no encontrada")
         
+        avisar_cambio_notificaciones()
         return {"message": "Notificación eliminada"}
     
     except HTTPException:
@@ -287,4 +1103,4 @@ async def delete_notificacion(notificacion_id: int):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8005)
+    uvicorn.run(app, host="0.0.0.0", port=8005, timeout_graceful_shutdown=10)
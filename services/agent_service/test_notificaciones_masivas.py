@@ -0,0 +1,51 @@
+import os
+import sys
+
+import httpx
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "aaaa.bbbb.cccc")
+os.environ["AGENT_RUN_INTERVAL_HOURS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+AFECTADAS = 7
+solicitudes = []
+
+def responder(request: httpx.Request) -> httpx.Response:
+    """PostgREST simulado: 204 sin cuerpo con return=minimal, filas con representation"""
+    solicitudes.append(request)
+    rango = f"0-{AFECTADAS - 1}/{AFECTADAS}"
+    if "return=minimal" in request.headers.get("prefer", ""):
+        return httpx.Response(204, headers={"content-range": f"*/{AFECTADAS}"})
+    return httpx.Response(200, json=[{"id": i} for i in range(AFECTADAS)], headers={"content-range": rango})
+
+main.supabase.postgrest.session = httpx.Client(
+    base_url=main.supabase.rest_url,
+    transport=httpx.MockTransport(responder)
+)
+cliente = TestClient(main.app)
+
+def test_marcar_leidas_devuelve_conteo():
+    solicitudes.clear()
+    response = cliente.post("/notificaciones/marcar-leidas", json={"tipo": "alerta"})
+    assert response.status_code == 200
+    assert response.json() == {"actualizadas": AFECTADAS}
+    assert solicitudes[-1].method == "PATCH"
+    assert solicitudes[-1].url.params["select"] == "id"
+
+def test_eliminar_devuelve_conteo():
+    solicitudes.clear()
+    response = cliente.post("/notificaciones/eliminar", json={"ids": [1, 2, 3]})
+    assert response.status_code == 200
+    assert response.json() == {"eliminadas": AFECTADAS}
+    assert solicitudes[-1].method == "DELETE"
+    assert solicitudes[-1].url.params["select"] == "id"
+
+def test_operacion_masiva_avisa_al_difusor():
+    main.difusion["despertar"].clear()
+    cliente.post("/notificaciones/eliminar", json={"ids": [1]})
+    assert main.difusion["despertar"].is_set()
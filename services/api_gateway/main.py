@@ -1,9 +1,11 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 import os
 from typing import Optional
+from urllib.parse import quote
 
 app = FastAPI(
     title="API Gateway - Sistema de Gestión TI",
@@ -20,6 +22,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Timeout para operaciones masivas (importación/exportación)
+BULK_TIMEOUT_SECONDS = float(os.getenv("BULK_TIMEOUT_SECONDS", "600"))
+
 # URLs de los microservicios
 EQUIPOS_SERVICE_URL = os.getenv("EQUIPOS_SERVICE_URL", "http://equipos-service:8001")
 PROVEEDORES_SERVICE_URL = os.getenv("PROVEEDORES_SERVICE_URL", "http://proveedores-service:8002")
@@ -89,6 +94,33 @@ async def proxy_request(service_url: str, path: str, method: str = "GET", **kwar
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def proxy_stream(service_url: str, path: str, method: str = "GET", **kwargs):
+    """Reenviar la respuesta de un microservicio en streaming, sin acumularla en memoria"""
+    request = http_client.build_request(method, f"{service_url}{path}", **kwargs)
+    
+    try:
+        response = await http_client.send(request, stream=True)
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+    
+    if response.is_error:
+        await response.aread()
+        await response.aclose()
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    
+    headers = {
+        k: response.headers[k]
+        for k in ("content-disposition", "cache-control", "x-accel-buffering", "x-siguiente-cursor")
+        if k in response.headers
+    }
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type"),
+        headers=headers,
+        background=BackgroundTask(response.aclose)
+    )
+
 # ============================================
 # EQUIPOS ENDPOINTS
 # ============================================
@@ -106,6 +138,53 @@ async def get_equipos(categoria: Optional[str] = None, estado: Optional[str] = N
     
     return await proxy_request(EQUIPOS_SERVICE_URL, "/equipos", params=params)
 
+@app.post("/api/equipos/import")
+async def import_equipos(request: Request):
+    """Importar equipos masivamente (CSV o NDJSON, multipart/form-data)"""
+    # Reenviar el cuerpo en streaming sin cargar el archivo en memoria
+    headers = {"content-type": request.headers.get("content-type", "")}
+    return await proxy_request(
+        EQUIPOS_SERVICE_URL, "/equipos/import", method="POST",
+        content=request.stream(), headers=headers,
+        params=dict(request.query_params), timeout=BULK_TIMEOUT_SECONDS
+    )
+
+@app.get("/api/equipos/export")
+async def export_equipos(format: str = "ndjson"):
+    """Exportar el inventario completo en streaming (NDJSON o CSV)"""
+    return await proxy_stream(
+        EQUIPOS_SERVICE_URL, "/equipos/export",
+        params={"format": format}, timeout=BULK_TIMEOUT_SECONDS
+    )
+
+@app.get("/api/equipos/changes")
+async def get_cambios_equipos(since: Optional[int] = None, limit: Optional[int] = None):
+    """Obtener cambios de equipos desde un token (sincronización incremental)"""
+    params = {k: v for k, v in {"since": since, "limit": limit}.items() if v is not None}
+    return await proxy_request(EQUIPOS_SERVICE_URL, "/equipos/changes", params=params)
+
+@app.get("/api/equipos/search")
+async def search_equipos(q: str, page: int = 1, page_size: int = 20):
+    """Buscar equipos por texto"""
+    params = {"q": q, "page": page, "page_size": page_size}
+    return await proxy_request(EQUIPOS_SERVICE_URL, "/equipos/search", params=params)
+
+@app.get("/api/equipos/codigo/{codigo_inventario:path}")
+async def get_equipo_por_codigo(codigo_inventario: str):
+    """Obtener un equipo por su código de inventario"""
+    return await proxy_request(EQUIPOS_SERVICE_URL, f"/equipos/codigo/{quote(codigo_inventario, safe='')}")
+
+@app.get("/api/equipos/serie/{numero_serie:path}")
+async def get_equipo_por_serie(numero_serie: str):
+    """Obtener un equipo por su número de serie"""
+    return await proxy_request(EQUIPOS_SERVICE_URL, f"/equipos/serie/{quote(numero_serie, safe='')}")
+
+@app.post("/api/equipos/lookup")
+async def lookup_equipos(request: Request):
+    """Resolver en lote códigos de inventario y números de serie"""
+    data = await request.json()
+    return await proxy_request(EQUIPOS_SERVICE_URL, "/equipos/lookup", method="POST", json=data)
+
 @app.get("/api/equipos/{equipo_id}")
 async def get_equipo(equipo_id: int):
     """Obtener detalle de un equipo"""
@@ -213,6 +292,12 @@ async def get_estadisticas_mantenimientos():
     """Obtener estadísticas de mantenimientos"""
     return await proxy_request(MANTENIMIENTO_SERVICE_URL, "/estadisticas")
 
+@app.get("/api/mantenimientos/changes")
+async def get_cambios_mantenimientos(since: Optional[int] = None, limit: Optional[int] = None):
+    """Obtener cambios de mantenimientos desde un token (sincronización incremental)"""
+    params = {k: v for k, v in {"since": since, "limit": limit}.items() if v is not None}
+    return await proxy_request(MANTENIMIENTO_SERVICE_URL, "/mantenimientos/changes", params=params)
+
 @app.get("/api/mantenimientos/{mantenimiento_id}")
 async def get_mantenimiento(mantenimiento_id: int):
     """Obtener detalle de un mantenimiento"""
@@ -239,6 +324,17 @@ async def get_dashboard():
     """Obtener datos del dashboard principal"""
     return await proxy_request(REPORTES_SERVICE_URL, "/dashboard")
 
+@app.post("/api/reportes/dashboard/reconciliar")
+async def reconciliar_dashboard(corregir: bool = True):
+    """Verificar (y corregir) los agregados del dashboard"""
+    return await proxy_request(REPORTES_SERVICE_URL, "/dashboard/reconciliar", method="POST", params={"corregir": str(corregir).lower()})
+
+@app.get("/api/reportes/bundle")
+async def get_reportes_bundle(include: Optional[str] = None):
+    """Obtener varios reportes de equipos en una sola llamada"""
+    params = {"include": include} if include else {}
+    return await proxy_request(REPORTES_SERVICE_URL, "/bundle", params=params)
+
 @app.get("/api/reportes/equipos-por-ubicacion")
 async def get_equipos_por_ubicacion():
     """Obtener reporte de equipos por ubicación"""
@@ -250,37 +346,164 @@ async def get_equipos_por_estado():
     return await proxy_request(REPORTES_SERVICE_URL, "/equipos-por-estado")
 
 @app.get("/api/reportes/costos-mantenimiento")
-async def get_costos_mantenimiento():
+async def get_costos_mantenimiento(
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    por_categoria: bool = False
+):
     """Obtener reporte de costos de mantenimiento"""
-    return await proxy_request(REPORTES_SERVICE_URL, "/costos-mantenimiento")
+    params = {"por_categoria": str(por_categoria).lower()}
+    if desde:
+        params["desde"] = desde
+    if hasta:
+        params["hasta"] = hasta
+    return await proxy_request(REPORTES_SERVICE_URL, "/costos-mantenimiento", params=params)
 
 @app.get("/api/reportes/antiguedad-equipos")
 async def get_antiguedad_equipos():
     """Obtener reporte de antigüedad de equipos"""
     return await proxy_request(REPORTES_SERVICE_URL, "/antiguedad-equipos")
 
+@app.post("/api/reportes/pivot")
+async def pivot_reportes(request: Request):
+    """Consulta pivot ad-hoc sobre equipos y mantenimientos"""
+    data = await request.json()
+    return await proxy_request(REPORTES_SERVICE_URL, "/pivot", method="POST", json=data)
+
+@app.get("/api/reportes/pivot/catalogo")
+async def pivot_catalogo():
+    """Catálogo de dimensiones y medidas del pivot"""
+    return await proxy_request(REPORTES_SERVICE_URL, "/pivot/catalogo")
+
+@app.get("/api/reportes/export/excel")
+async def export_reporte_excel(tipo: str = "equipos"):
+    """Exportar un listado completo (equipos o mantenimientos) a Excel"""
+    return await proxy_stream(
+        REPORTES_SERVICE_URL, "/export/excel",
+        params={"tipo": tipo}, timeout=BULK_TIMEOUT_SECONDS
+    )
+
+@app.get("/api/reportes/export/pack")
+async def export_reporte_pack(formato: str = "pdf"):
+    """Paquete de gestión mensual en un solo PDF o XLSX"""
+    return await proxy_stream(
+        REPORTES_SERVICE_URL, "/export/pack",
+        params={"formato": formato}, timeout=BULK_TIMEOUT_SECONDS
+    )
+
+@app.post("/api/reportes/jobs")
+async def submit_reporte_job(request: Request):
+    """Encolar la generación de un reporte (PDF/XLSX)"""
+    data = await request.json()
+    return await proxy_request(REPORTES_SERVICE_URL, "/jobs", method="POST", json=data)
+
+@app.get("/api/reportes/jobs")
+async def list_reporte_jobs(limit: int = 50):
+    """Listar los jobs de reportes recientes"""
+    return await proxy_request(REPORTES_SERVICE_URL, "/jobs", params={"limit": limit})
+
+@app.get("/api/reportes/jobs/{job_id}")
+async def get_reporte_job(job_id: str, esperar: float = 0):
+    """Estado de un job de reportes (long-poll con esperar)"""
+    return await proxy_request(REPORTES_SERVICE_URL, f"/jobs/{quote(job_id)}", params={"esperar": esperar})
+
+@app.get("/api/reportes/jobs/{job_id}/download")
+async def download_reporte_job(job_id: str):
+    """Descargar el documento generado por un job"""
+    return await proxy_stream(REPORTES_SERVICE_URL, f"/jobs/{quote(job_id)}/download")
+
+@app.get("/api/reportes/snapshot")
+async def get_reportes_snapshot():
+    """Obtener el estado del snapshot de reportes"""
+    return await proxy_request(REPORTES_SERVICE_URL, "/snapshot")
+
+@app.post("/api/reportes/snapshot/refresh")
+async def refresh_reportes_snapshot(completo: bool = False):
+    """Forzar el refresco del snapshot de reportes"""
+    return await proxy_request(REPORTES_SERVICE_URL, "/snapshot/refresh", method="POST", params={"completo": str(completo).lower()})
+
 # ============================================
 # AGENTS ENDPOINTS
 # ============================================
 
 @app.post("/api/agents/run-all-agents")
-async def run_all_agents():
-    """Ejecutar todos los agentes inteligentes"""
-    return await proxy_request(AGENT_SERVICE_URL, "/run-all-agents", method="POST")
+async def run_all_agents(esperar: bool = False):
+    """Lanzar todos los agentes inteligentes (devuelve el id de la ejecución)"""
+    kwargs = {"timeout": BULK_TIMEOUT_SECONDS} if esperar else {}
+    return await proxy_request(AGENT_SERVICE_URL, "/run-all-agents", method="POST", params={"esperar": str(esperar).lower()}, **kwargs)
+
+@app.get("/api/agents/runs")
+async def get_ejecuciones_agentes(limit: Optional[int] = None):
+    """Listar las últimas ejecuciones de agentes"""
+    params = {"limit": limit} if limit is not None else {}
+    return await proxy_request(AGENT_SERVICE_URL, "/runs", params=params)
+
+@app.get("/api/agents/runs/{run_id}")
+async def get_ejecucion_agentes(run_id: int):
+    """Obtener el estado de una ejecución de agentes"""
+    return await proxy_request(AGENT_SERVICE_URL, f"/runs/{run_id}")
 
 @app.get("/api/agents/notificaciones")
-async def get_notificaciones(leida: Optional[bool] = None):
-    """Obtener notificaciones"""
-    params = {}
-    if leida is not None:
-        params["leida"] = str(leida).lower()
-    return await proxy_request(AGENT_SERVICE_URL, "/notificaciones", params=params)
+async def get_notificaciones(request: Request):
+    """Obtener notificaciones (filtros y cursor; la siguiente página viene en X-Siguiente-Cursor)"""
+    return await proxy_stream(AGENT_SERVICE_URL, "/notificaciones", params=dict(request.query_params))
+
+@app.get("/api/agents/notificaciones/count")
+async def contar_notificaciones(tipo: Optional[str] = None, prioridad: Optional[str] = None):
+    """Contar notificaciones por tipo y prioridad"""
+    params = {k: v for k, v in {"tipo": tipo, "prioridad": prioridad}.items() if v is not None}
+    return await proxy_request(AGENT_SERVICE_URL, "/notificaciones/count", params=params)
+
+@app.get("/api/agents/notificaciones/changes")
+async def get_cambios_notificaciones(since: Optional[int] = None, limit: Optional[int] = None):
+    """Obtener cambios de notificaciones desde un token (sincronización incremental)"""
+    params = {k: v for k, v in {"since": since, "limit": limit}.items() if v is not None}
+    return await proxy_request(AGENT_SERVICE_URL, "/notificaciones/changes", params=params)
+
+@app.get("/api/agents/notificaciones/stream")
+async def stream_notificaciones(request: Request, ultimo_id: Optional[int] = None):
+    """Stream SSE de notificaciones (reenvía Last-Event-ID para reanudar)"""
+    headers = {}
+    if "last-event-id" in request.headers:
+        headers["Last-Event-ID"] = request.headers["last-event-id"]
+    params = {"ultimo_id": ultimo_id} if ultimo_id is not None else {}
+    # Conexión de larga duración: sin timeout de lectura
+    return await proxy_stream(
+        AGENT_SERVICE_URL, "/notificaciones/stream",
+        params=params, headers=headers, timeout=httpx.Timeout(30.0, read=None)
+    )
+
+@app.post("/api/agents/notificaciones/marcar-leidas")
+async def marcar_notificaciones_leidas(request: Request):
+    """Marcar como leídas varias notificaciones (por ids o filtros)"""
+    data = await request.json()
+    return await proxy_request(AGENT_SERVICE_URL, "/notificaciones/marcar-leidas", method="POST", json=data)
+
+@app.post("/api/agents/notificaciones/eliminar")
+async def eliminar_notificaciones(request: Request):
+    """Eliminar varias notificaciones (por ids o filtros)"""
+    data = await request.json()
+    return await proxy_request(AGENT_SERVICE_URL, "/notificaciones/eliminar", method="POST", json=data)
+
+@app.post("/api/agents/notificaciones/archivar")
+async def archivar_notificaciones(dias: Optional[int] = None):
+    """Archivar las notificaciones leídas más antiguas que la retención"""
+    params = {"dias": dias} if dias is not None else {}
+    return await proxy_request(
+        AGENT_SERVICE_URL, "/notificaciones/archivar", method="POST",
+        params=params, timeout=BULK_TIMEOUT_SECONDS
+    )
 
 @app.put("/api/agents/notificaciones/{notificacion_id}/marcar-leida")
 async def marcar_notificacion_leida(notificacion_id: int):
     """Marcar notificación como leída"""
     return await proxy_request(AGENT_SERVICE_URL, f"/notificaciones/{notificacion_id}/marcar-leida", method="PUT")
 
+@app.delete("/api/agents/notificaciones/{notificacion_id}")
+async def delete_notificacion(notificacion_id: int):
+    """Eliminar notificación"""
+    return await proxy_request(AGENT_SERVICE_URL, f"/notificaciones/{notificacion_id}", method="DELETE")
+
 # ============================================
 # ERROR HANDLERS
 # ============================================
@@ -0,0 +1,77 @@
+"""Lectura del registro de cambios (sincronización incremental por token)
+
+Los tokens son ids de registro_cambios. Las funciones RPC de la migración 012
+solo entregan cambios por debajo del horizonte de visibilidad: el token nunca
+avanza por encima de un cambio de una transacción que sigue abierta, por larga
+que sea. Mientras esa transacción no confirme, los cambios posteriores quedan
+retenidos (hay_mas=False) y se entregan en la siguiente consulta.
+"""
+from typing import List, Optional, Tuple
+
+from supabase import Client
+
+# Margen que el horizonte deja sin entregar tras el instante actual (ver migración 012)
+MARGEN_HORIZONTE_SEGUNDOS = 1
+
+
+def token_actual(supabase: Client) -> int:
+    """Último token hasta el que todos los cambios ya son visibles"""
+    return supabase.rpc("token_registro_cambios", {}).execute().data or 0
+
+
+def token_actual_tablas(supabase: Client, tablas: List[str]) -> int:
+    """Último token de las tablas indicadas hasta el que todos sus cambios ya son visibles"""
+    return supabase.rpc("token_registro_cambios_tablas", {"p_tablas": tablas}).execute().data or 0
+
+
+def leer_cambios(supabase: Client, tabla: str, desde: int, limite: int) -> List[dict]:
+    """Cambios de una tabla posteriores a un token, ordenados por id"""
+    return supabase.rpc("leer_registro_cambios", {
+        "p_tabla": tabla,
+        "p_desde": desde,
+        "p_limite": limite
+    }).execute().data
+
+
+def leer_ids_cambiados(supabase: Client, tabla: str, desde: int, tam_pagina: int) -> Tuple[set, int, int]:
+    """Ids de una tabla modificados después de un token: (ids, token leído, consultas hechas)"""
+    ids = set()
+    token = desde
+    consultas = 0
+    while True:
+        cambios = leer_cambios(supabase, tabla, token, tam_pagina)
+        consultas += 1
+        ids.update(cambio['registro_id'] for cambio in cambios)
+        if cambios:
+            token = cambios[-1]['id']
+        if len(cambios) < tam_pagina:
+            return ids, token, consultas
+
+
+def obtener_cambios(supabase: Client, tabla: str, since: Optional[int], limit: int, select: str) -> dict:
+    """Leer los cambios de una tabla posteriores a un token del registro de cambios"""
+    # Sin token: devolver solo el token actual para iniciar la sincronización
+    if since is None:
+        return {"desde": None, "siguiente_token": token_actual(supabase), "hay_mas": False, "actualizados": [], "eliminados": []}
+    
+    cambios = leer_cambios(supabase, tabla, since, limit)
+    
+    # Consolidar: la última operación de cada registro prevalece
+    ultimas = {}
+    for cambio in cambios:
+        ultimas[cambio['registro_id']] = cambio['operacion']
+    
+    ids_vigentes = [registro_id for registro_id, operacion in ultimas.items() if operacion != 'DELETE']
+    filas = {}
+    if ids_vigentes:
+        response = supabase.table(tabla).select(select).in_("id", ids_vigentes).execute()
+        filas = {fila['id']: fila for fila in response.data}
+    
+    return {
+        "desde": since,
+        "siguiente_token": cambios[-1]['id'] if cambios else since,
+        "hay_mas": len(cambios) == limit,
+        "actualizados": [filas[registro_id] for registro_id in ultimas if registro_id in filas],
+        # Incluye registros eliminados después del cambio leído
+        "eliminados": [registro_id for registro_id in ultimas if registro_id not in filas]
+    }
@@ -1,10 +1,18 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Optional, List, Iterator
 from supabase import create_client, Client
 import os
 from datetime import date
 import json
+import csv
+import io
+import threading
+import time
+from collections import OrderedDict
+
+from comun.registro_cambios import obtener_cambios
 
 app = FastAPI(title="Equipos Service", version="1.0.0")
 
@@ -17,6 +25,36 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Configuración de importación masiva
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORES = int(os.getenv("IMPORT_MAX_ERRORES", "1000"))
+
+# Configuración de exportación (tamaño de página para consultas keyset)
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+EXPORT_COLUMNAS = [
+    "id", "codigo_inventario", "categoria_id", "nombre", "marca", "modelo",
+    "numero_serie", "especificaciones", "proveedor_id", "fecha_compra",
+    "costo_compra", "fecha_garantia_fin", "ubicacion_actual_id",
+    "estado_operativo", "estado_fisico", "asignado_a_id", "notas",
+    "imagen_url", "fecha_registro", "fecha_actualizacion"
+]
+
+# Configuración del registro de cambios (sincronización incremental)
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", "500"))
+
+# Configuración de búsqueda exacta (escaneo de códigos en auditorías)
+LOOKUP_CACHE_SIZE = int(os.getenv("LOOKUP_CACHE_SIZE", "10000"))
+LOOKUP_CACHE_TTL_SECONDS = int(os.getenv("LOOKUP_CACHE_TTL_SECONDS", "60"))
+LOOKUP_MAX_CODIGOS = 1000
+LOOKUP_CHUNK_SIZE = 200
+LOOKUP_SELECT = "*, categorias_equipos(nombre), ubicaciones(edificio, aula_oficina), proveedores(razon_social)"
+
+# Caché LRU en proceso: (campo, valor) -> (expira_en, equipo o None).
+# Cada réplica invalida solo sus propias escrituras; los cambios hechos por otra réplica
+# (o directamente en la base) pueden verse con hasta LOOKUP_CACHE_TTL_SECONDS de atraso.
+cache_lookup: "OrderedDict[tuple, tuple]" = OrderedDict()
+cache_lookup_lock = threading.Lock()
+
 # ============================================
 # MODELOS PYDANTIC
 # ============================================
@@ -51,6 +89,10 @@ class EquipoUpdate(BaseModel):
     asignado_a_id: Optional[int] = None
     notas: Optional[str] = None
 
+class LookupEquipos(BaseModel):
+    codigos_inventario: List[str] = []
+    numeros_serie: List[str] = []
+
 class MovimientoCreate(BaseModel):
     equipo_id: int
     ubicacion_destino_id: int
@@ -58,6 +100,181 @@ class MovimientoCreate(BaseModel):
     motivo: str
     observaciones: Optional[str] = None
 
+# ============================================
+# FUNCIONES AUXILIARES
+# ============================================
+
+def parsear_especificaciones(equipo: dict) -> dict:
+    """Convertir especificaciones guardadas como texto JSON a dict"""
+    if equipo.get('especificaciones') and isinstance(equipo['especificaciones'], str):
+        try:
+            equipo['especificaciones'] = json.loads(equipo['especificaciones'])
+        except ValueError:
+            pass
+    return equipo
+
+def preparar_equipo(equipo: EquipoCreate) -> dict:
+    """Convertir un EquipoCreate al formato de inserción de Supabase"""
+    equipo_dict = equipo.model_dump()
+    
+    # Convertir especificaciones a JSON string si existe
+    if equipo_dict.get('especificaciones'):
+        equipo_dict['especificaciones'] = json.dumps(equipo_dict['especificaciones'])
+    
+    # Convertir fechas a string
+    if equipo_dict.get('fecha_compra'):
+        equipo_dict['fecha_compra'] = str(equipo_dict['fecha_compra'])
+    if equipo_dict.get('fecha_garantia_fin'):
+        equipo_dict['fecha_garantia_fin'] = str(equipo_dict['fecha_garantia_fin'])
+    
+    return equipo_dict
+
+def leer_filas_csv(archivo) -> Iterator[tuple]:
+    """Leer un CSV fila por fila sin cargarlo completo en memoria.
+
+    Produce tuplas (fila, error) para que una fila inválida no detenga la lectura.
+    """
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    try:
+        for fila in csv.DictReader(texto):
+            # Las celdas vacías se interpretan como valores nulos
+            fila = {k.strip(): (v if v != "" else None) for k, v in fila.items() if k}
+            if isinstance(fila.get('especificaciones'), str):
+                try:
+                    fila['especificaciones'] = json.loads(fila['especificaciones'])
+                except ValueError as e:
+                    yield fila, f"especificaciones: JSON inválido ({e})"
+                    continue
+            yield fila, None
+    finally:
+        texto.detach()
+
+def leer_filas_ndjson(archivo) -> Iterator[tuple]:
+    """Leer un archivo JSON Lines (NDJSON) línea por línea, produciendo tuplas (fila, error)"""
+    for linea in archivo:
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield json.loads(linea), None
+        except ValueError as e:
+            yield {}, f"JSON inválido: {e}"
+
+def formatear_error_validacion(error: ValidationError) -> str:
+    """Resumir los errores de Pydantic en un mensaje corto por fila"""
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in error.errors()
+    )
+
+def insertar_lote(lote: List[tuple]) -> List[dict]:
+    """Insertar un lote de equipos; si falla, reintentar fila por fila para aislar errores"""
+    try:
+        supabase.table("equipos").insert([equipo_dict for _, equipo_dict in lote]).execute()
+        return []
+    except Exception:
+        errores = []
+        for numero_fila, equipo_dict in lote:
+            try:
+                supabase.table("equipos").insert(equipo_dict).execute()
+            except Exception as e:
+                errores.append({
+                    "fila": numero_fila,
+                    "codigo_inventario": equipo_dict.get('codigo_inventario'),
+                    "error": str(e)
+                })
+        return errores
+
+def iterar_paginas_equipos(page_size: int = EXPORT_PAGE_SIZE) -> Iterator[List[dict]]:
+    """Recorrer la tabla equipos por páginas usando keyset (id > último id)"""
+    ultimo_id = 0
+    while True:
+        response = supabase.table("equipos").select(",".join(EXPORT_COLUMNAS)).gt(
+            "id", ultimo_id
+        ).order("id").limit(page_size).execute()
+        
+        if not response.data:
+            return
+        
+        yield response.data
+        
+        if len(response.data) < page_size:
+            return
+        ultimo_id = response.data[-1]['id']
+
+def exportar_ndjson() -> Iterator[str]:
+    """Generar el inventario como JSON Lines, una página a la vez"""
+    for pagina in iterar_paginas_equipos():
+        yield "".join(json.dumps(equipo, ensure_ascii=False, default=str) + "\n" for equipo in pagina)
+
+def exportar_csv() -> Iterator[str]:
+    """Generar el inventario como CSV, una página a la vez"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNAS)
+    yield buffer.getvalue()
+    
+    for pagina in iterar_paginas_equipos():
+        buffer.seek(0)
+        buffer.truncate()
+        for equipo in pagina:
+            if isinstance(equipo.get('especificaciones'), (dict, list)):
+                equipo['especificaciones'] = json.dumps(equipo['especificaciones'], ensure_ascii=False)
+            writer.writerow([equipo.get(columna) for columna in EXPORT_COLUMNAS])
+        yield buffer.getvalue()
+
+def cache_obtener(clave: tuple):
+    """Obtener un equipo de la caché; devuelve (encontrado_en_cache, equipo)"""
+    with cache_lookup_lock:
+        entrada = cache_lookup.get(clave)
+        if entrada is None:
+            return False, None
+        expira_en, equipo = entrada
+        if expira_en < time.monotonic():
+            del cache_lookup[clave]
+            return False, None
+        cache_lookup.move_to_end(clave)
+        return True, equipo
+
+def cache_guardar(clave: tuple, equipo: Optional[dict]):
+    """Guardar un equipo (o su ausencia) en la caché, desalojando el menos usado"""
+    with cache_lookup_lock:
+        cache_lookup[clave] = (time.monotonic() + LOOKUP_CACHE_TTL_SECONDS, equipo)
+        cache_lookup.move_to_end(clave)
+        while len(cache_lookup) > LOOKUP_CACHE_SIZE:
+            cache_lookup.popitem(last=False)
+
+def cache_invalidar(equipo: Optional[dict] = None):
+    """Invalidar las claves de un equipo o, sin argumento, toda la caché"""
+    with cache_lookup_lock:
+        if equipo is None:
+            cache_lookup.clear()
+            return
+        for campo in ("codigo_inventario", "numero_serie"):
+            if equipo.get(campo):
+                cache_lookup.pop((campo, equipo[campo]), None)
+
+def buscar_por_campo(campo: str, valores: List[str]) -> dict:
+    """Resolver valores de un campo único usando la caché y una consulta IN por bloque"""
+    resultado = {}
+    pendientes = []
+    for valor in dict.fromkeys(valores):
+        en_cache, equipo = cache_obtener((campo, valor))
+        if en_cache:
+            resultado[valor] = equipo
+        else:
+            pendientes.append(valor)
+    
+    for i in range(0, len(pendientes), LOOKUP_CHUNK_SIZE):
+        bloque = pendientes[i:i + LOOKUP_CHUNK_SIZE]
+        response = supabase.table("equipos").select(LOOKUP_SELECT).in_(campo, bloque).execute()
+        encontrados = {equipo[campo]: parsear_especificaciones(equipo) for equipo in response.data}
+        for valor in bloque:
+            # También se cachean los códigos inexistentes (búsqueda negativa)
+            resultado[valor] = encontrados.get(valor)
+            cache_guardar((campo, valor), resultado[valor])
+    
+    return resultado
+
 # ============================================
 # ENDPOINTS
 # ============================================
@@ -101,6 +318,121 @@ async def get_equipos(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/equipos/export")
+def export_equipos(formato: str = Query("ndjson", alias="format")):
+    """Exportar el inventario completo en streaming (NDJSON o CSV)"""
+    if formato == "ndjson":
+        return StreamingResponse(
+            exportar_ndjson(),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": "attachment; filename=equipos.ndjson"}
+        )
+    if formato == "csv":
+        return StreamingResponse(
+            exportar_csv(),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": "attachment; filename=equipos.csv"}
+        )
+    raise HTTPException(status_code=400, detail="Formato no soportado (use ndjson o csv)")
+
+@app.get("/equipos/changes")
+async def get_cambios_equipos(since: Optional[int] = None, limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=5000)):
+    """Obtener equipos creados, modificados o eliminados después de un token
+
+    Solo se entregan cambios ya confirmados: si una transacción abierta tiene un cambio
+    pendiente, los posteriores esperan a que confirme (el token nunca lo salta).
+    """
+    try:
+        resultado = obtener_cambios(
+            supabase, "equipos", since, limit,
+            "*, categorias_equipos(nombre), ubicaciones(edificio, aula_oficina), proveedores(razon_social)"
+        )
+        resultado['actualizados'] = [parsear_especificaciones(e) for e in resultado['actualizados']]
+        return resultado
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/equipos/search")
+async def search_equipos(
+    q: str = Query(..., min_length=2),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    """Buscar equipos por texto (con tolerancia a errores de tipeo), paginado y con resaltado"""
+    try:
+        response = supabase.rpc("buscar_equipos", {
+            "termino": q,
+            "limite": page_size,
+            "desplazamiento": (page - 1) * page_size
+        }).execute()
+        
+        total = response.data[0]['total'] if response.data else 0
+        resultados = [{k: v for k, v in fila.items() if k != 'total'} for fila in response.data]
+        
+        return {
+            "q": q,
+            "page": page,
+            "page_size": page_size,
+            "total": total,
+            "resultados": resultados
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/equipos/codigo/{codigo_inventario:path}")
+async def get_equipo_por_codigo(codigo_inventario: str):
+    """Obtener un equipo por su código de inventario (caché con hasta LOOKUP_CACHE_TTL_SECONDS de atraso)"""
+    try:
+        equipo = buscar_por_campo("codigo_inventario", [codigo_inventario])[codigo_inventario]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if equipo is None:
+        raise HTTPException(status_code=404, detail="Equipo no encontrado")
+    return equipo
+
+@app.get("/equipos/serie/{numero_serie:path}")
+async def get_equipo_por_serie(numero_serie: str):
+    """Obtener un equipo por su número de serie (caché con hasta LOOKUP_CACHE_TTL_SECONDS de atraso)"""
+    try:
+        equipo = buscar_por_campo("numero_serie", [numero_serie])[numero_serie]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if equipo is None:
+        raise HTTPException(status_code=404, detail="Equipo no encontrado")
+    return equipo
+
+@app.post("/equipos/lookup")
+async def lookup_equipos(lookup: LookupEquipos):
+    """Resolver en lote códigos de inventario y/o números de serie (máx. 1000 por llamada)
+
+    Usa la misma caché que las búsquedas individuales: lo escrito por otra réplica puede
+    tardar hasta LOOKUP_CACHE_TTL_SECONDS en reflejarse.
+    """
+    if len(lookup.codigos_inventario) + len(lookup.numeros_serie) > LOOKUP_MAX_CODIGOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {LOOKUP_MAX_CODIGOS} códigos por llamada"
+        )
+    
+    try:
+        respuesta = {}
+        for clave, campo, valores in (
+            ("codigos_inventario", "codigo_inventario", lookup.codigos_inventario),
+            ("numeros_serie", "numero_serie", lookup.numeros_serie)
+        ):
+            encontrados = buscar_por_campo(campo, valores) if valores else {}
+            respuesta[clave] = {
+                "encontrados": [equipo for equipo in encontrados.values() if equipo is not None],
+                "no_encontrados": [valor for valor, equipo in encontrados.items() if equipo is None]
+            }
+        return respuesta
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/equipos/{equipo_id}")
 async def get_equipo(equipo_id: int):
     """Obtener detalle de un equipo específico"""
@@ -140,24 +472,93 @@ async def get_equipo(equipo_id: int):
 async def create_equipo(equipo: EquipoCreate):
     """Crear nuevo equipo"""
     try:
-        # Convertir especificaciones a JSON string si existe
-        equipo_dict = equipo.model_dump()
-        if equipo_dict.get('especificaciones'):
-            equipo_dict['especificaciones'] = json.dumps(equipo_dict['especificaciones'])
-        
-        # Convertir fechas a string
-        if equipo_dict.get('fecha_compra'):
-            equipo_dict['fecha_compra'] = str(equipo_dict['fecha_compra'])
-        if equipo_dict.get('fecha_garantia_fin'):
-            equipo_dict['fecha_garantia_fin'] = str(equipo_dict['fecha_garantia_fin'])
+        equipo_dict = preparar_equipo(equipo)
         
         response = supabase.table("equipos").insert(equipo_dict).execute()
+        cache_invalidar(response.data[0])
         
         return {"id": response.data[0]['id'], "message": "Equipo creado exitosamente"}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/equipos/import")
+def import_equipos(
+    archivo: UploadFile = File(...),
+    formato: Optional[str] = None,
+    batch_size: int = IMPORT_BATCH_SIZE
+):
+    """Importar equipos masivamente desde un archivo CSV o NDJSON"""
+    # Detectar formato por parámetro o por extensión del archivo
+    formato = (formato or os.path.splitext(archivo.filename or "")[1].lstrip(".")).lower()
+    if formato == "csv":
+        filas = leer_filas_csv(archivo.file)
+    elif formato in ("ndjson", "jsonl"):
+        filas = leer_filas_ndjson(archivo.file)
+    else:
+        raise HTTPException(status_code=400, detail="Formato no soportado (use csv o ndjson)")
+    
+    if batch_size < 1 or batch_size > 5000:
+        raise HTTPException(status_code=400, detail="batch_size debe estar entre 1 y 5000")
+    
+    procesadas = 0
+    insertadas = 0
+    total_errores = 0
+    errores = []
+    lote = []
+    
+    def registrar_errores(nuevos):
+        nonlocal total_errores
+        total_errores += len(nuevos)
+        # Limitar el detalle para que la respuesta no crezca con el archivo
+        errores.extend(nuevos[:max(IMPORT_MAX_ERRORES - len(errores), 0)])
+    
+    def procesar_lote():
+        nonlocal insertadas
+        errores_lote = insertar_lote(lote)
+        insertadas += len(lote) - len(errores_lote)
+        registrar_errores(errores_lote)
+        lote.clear()
+        # Los códigos importados pueden estar cacheados como inexistentes
+        cache_invalidar()
+    
+    try:
+        for numero_fila, (fila, error) in enumerate(filas, start=1):
+            procesadas += 1
+            codigo = fila.get('codigo_inventario') if isinstance(fila, dict) else None
+            
+            if error is None:
+                try:
+                    lote.append((numero_fila, preparar_equipo(EquipoCreate.model_validate(fila))))
+                except ValidationError as e:
+                    error = formatear_error_validacion(e)
+            
+            if error is not None:
+                registrar_errores([{"fila": numero_fila, "codigo_inventario": codigo, "error": error}])
+            
+            if len(lote) >= batch_size:
+                procesar_lote()
+        
+        if lote:
+            procesar_lote()
+        
+        return {
+            "message": "Importación finalizada",
+            "procesadas": procesadas,
+            "insertadas": insertadas,
+            "con_errores": total_errores,
+            "errores": errores,
+            "errores_omitidos": total_errores - len(errores)
+        }
+    
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Archivo mal formado después de {procesadas} filas ({insertadas} insertadas): {e}"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.put("/equipos/{equipo_id}")
 async def update_equipo(equipo_id: int, equipo: EquipoUpdate):
     """Actualizar equipo existente"""
@@ -177,6 +578,7 @@ async def update_equipo(equipo_id: int, equipo: EquipoUpdate):
         if not response.data:
             raise HTTPException(status_code=404, detail="Equipo no encontrado")
         
+        cache_invalidar(response.data[0])
         return {"message": "Equipo actualizado exitosamente"}
     
     except HTTPException:
@@ -193,6 +595,7 @@ async def delete_equipo(equipo_id: int):
         if not response.data:
             raise HTTPException(status_code=404, detail="Equipo no encontrado")
         
+        cache_invalidar(response.data[0])
         return {"message": "Equipo eliminado exitosamente"}
     
     except HTTPException:
@@ -219,9 +622,11 @@ async def create_movimiento(movimiento: MovimientoCreate):
         supabase.table("movimientos_equipos").insert(movimiento_dict).execute()
         
         # Actualizar ubicación del equipo
-        supabase.table("equipos").update({
+        equipo_actualizado = supabase.table("equipos").update({
             "ubicacion_actual_id": movimiento.ubicacion_destino_id
         }).eq("id", movimiento.equipo_id).execute()
+        for equipo in equipo_actualizado.data:
+            cache_invalidar(equipo)
         
         return {"message": "Movimiento registrado exitosamente"}
     
@@ -1,9 +1,11 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
 from typing import Optional
 from supabase import create_client, Client
 import os
-from datetime import date, datetime, timedelta
+from datetime import date
+
+from comun.registro_cambios import obtener_cambios
 
 app = FastAPI(title="Mantenimiento Service", version="1.0.0")
 
@@ -16,6 +18,9 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Configuración del registro de cambios (sincronización incremental)
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", "500"))
+
 # ============================================
 # MODELOS PYDANTIC
 # ============================================
@@ -73,6 +78,21 @@ async def get_mantenimientos(estado: Optional[str] = None, tipo: Optional[str] =
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/mantenimientos/changes")
+async def get_cambios_mantenimientos(since: Optional[int] = None, limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=5000)):
+    """Obtener mantenimientos creados, modificados o eliminados después de un token
+
+    Solo se entregan cambios ya confirmados: si una transacción abierta tiene un cambio
+    pendiente, los posteriores esperan a que confirme (el token nunca lo salta).
+    """
+    try:
+        return obtener_cambios(
+            supabase, "mantenimientos", since, limit,
+            "*, equipos(codigo_inventario, nombre), proveedores(razon_social)"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/mantenimientos/{mantenimiento_id}")
 async def get_mantenimiento(mantenimiento_id: int):
     """Obtener detalle de un mantenimiento"""
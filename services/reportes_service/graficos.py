@@ -0,0 +1,37 @@
+# Renderizado de gráficos de reportes a PNG.
+# Se ejecuta en los procesos del pool de gráficos del servicio de reportes, por
+# eso no importa nada del servicio: recibe la especificación del gráfico (un
+# dict serializable) y devuelve los bytes del PNG.
+from io import BytesIO
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+def renderizar_grafico(grafico: dict) -> bytes:
+    """Renderizar el gráfico a PNG con matplotlib"""
+    fig, ax = plt.subplots(figsize=(8, 5), dpi=150)
+    try:
+        etiquetas = grafico['etiquetas']
+        series = grafico['series']
+        if grafico['tipo'] == "pastel":
+            valores = next(iter(series.values()))
+            ax.pie(valores, labels=etiquetas, autopct='%1.1f%%', startangle=90)
+            ax.axis('equal')
+        elif grafico['tipo'] == "lineas":
+            for nombre, valores in series.items():
+                ax.plot(etiquetas, valores, marker='o', label=nombre.replace("costo_", "").capitalize())
+            ax.legend()
+            ax.tick_params(axis='x', rotation=45)
+        elif grafico['tipo'] == "barras_h":
+            ax.barh(etiquetas, next(iter(series.values())), color='#d62728')
+        else:
+            ax.bar(etiquetas, next(iter(series.values())), color='#1f77b4')
+            ax.tick_params(axis='x', rotation=45)
+        ax.set_title(grafico['titulo'])
+        fig.tight_layout()
+        
+        buffer = BytesIO()
+        fig.savefig(buffer, format="png")
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
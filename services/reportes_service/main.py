@@ -1,8 +1,34 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
 from supabase import create_client, Client
+import asyncio
+import hashlib
+import json
+import multiprocessing
 import os
-from datetime import date, datetime, timedelta
-from typing import Dict, List
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from io import BytesIO
+from typing import Callable, Dict, Iterator, List, Optional
+import pandas as pd
+from openpyxl import Workbook
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
+from graficos import renderizar_grafico
+
+from comun import registro_cambios
 
 app = FastAPI(title="Reportes Service", version="1.0.0")
 
@@ -15,6 +41,1080 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Tamaño de página para lecturas keyset (PostgREST limita las respuestas)
+REPORTES_PAGE_SIZE = int(os.getenv("REPORTES_PAGE_SIZE", "1000"))
+
+# Snapshot columnar en memoria (refresco incremental desde registro_cambios)
+SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "30"))
+SNAPSHOT_FULL_RELOAD_SECONDS = int(os.getenv("SNAPSHOT_FULL_RELOAD_SECONDS", "3600"))
+SNAPSHOT_MAX_CAMBIOS_INCREMENTAL = int(os.getenv("SNAPSHOT_MAX_CAMBIOS_INCREMENTAL", "50000"))
+IN_CHUNK_SIZE = 200
+
+SNAPSHOT_TABLAS = {
+    "equipos": {
+        "select": "id, estado_operativo, costo_compra, fecha_compra, categorias_equipos(nombre), "
+                  "ubicaciones(edificio, aula_oficina), proveedores(razon_social)",
+        "categoricas": ["estado", "ubicacion", "edificio", "categoria", "proveedor"],
+        "fechas": ["fecha_compra"],
+        "numericas": ["costo_compra"]
+    },
+    "mantenimientos": {
+        "select": "id, equipo_id, tipo, estado, fecha_programada, fecha_realizada, costo_total",
+        "categoricas": ["tipo", "estado"],
+        "fechas": ["fecha_programada", "fecha_realizada"],
+        "numericas": ["costo_total"]
+    }
+}
+# Dimensiones cuyos nombres se copian en equipos: tabla -> columna de equipos que la referencia
+SNAPSHOT_DIMENSIONES = {
+    "categorias_equipos": "categoria_id",
+    "ubicaciones": "ubicacion_actual_id",
+    "proveedores": "proveedor_id"
+}
+# Tablas de las que leen el snapshot y los reportes (su token versiona la caché de documentos)
+TABLAS_REPORTES = list(SNAPSHOT_TABLAS) + list(SNAPSHOT_DIMENSIONES)
+
+# Cada refresco publica un diccionario nuevo: quien ya tiene el anterior lo sigue viendo completo.
+# agrupaciones: resultados por (sección, día) calculados sobre esa versión
+snapshot = {"tablas": {}, "token": 0, "actualizado": None, "carga_completa": None, "agrupaciones": {}}
+# Un solo refresco a la vez; las lecturas no lo esperan si ya hay datos
+snapshot_lock = threading.Lock()
+
+# Caché de consultas pivot (firma de la consulta + token del snapshot)
+PIVOT_CACHE_SIZE = int(os.getenv("PIVOT_CACHE_SIZE", "256"))
+PIVOT_MAX_FILAS = int(os.getenv("PIVOT_MAX_FILAS", "10000"))
+
+cache_pivot: "OrderedDict[tuple, dict]" = OrderedDict()
+cache_pivot_lock = threading.Lock()
+hechos_cache = {"token": None, "carga_completa": None, "mantenimientos": None}
+
+# Cola de generación de reportes (PDF/XLSX) y caché en disco de resultados
+REPORT_JOBS_WORKERS = int(os.getenv("REPORT_JOBS_WORKERS", "2"))
+REPORT_JOBS_MAX_PENDIENTES = int(os.getenv("REPORT_JOBS_MAX_PENDIENTES", "20"))
+REPORT_JOBS_HISTORIAL = int(os.getenv("REPORT_JOBS_HISTORIAL", "200"))
+REPORT_JOBS_DIR = os.getenv("REPORT_JOBS_DIR", "/tmp/reportes")
+REPORT_JOBS_CACHE_TTL_HOURS = float(os.getenv("REPORT_JOBS_CACHE_TTL_HOURS", "24"))
+REPORT_JOBS_MAX_ESPERA_SECONDS = 25
+
+jobs: "OrderedDict[str, dict]" = OrderedDict()
+jobs_por_clave: Dict[str, str] = {}
+jobs_lock = threading.Lock()
+jobs_executor = ThreadPoolExecutor(max_workers=REPORT_JOBS_WORKERS, thread_name_prefix="reportes-job")
+
+# Pool persistente de procesos para renderizar gráficos y caché de PNG por contenido
+GRAFICOS_WORKERS = int(os.getenv("GRAFICOS_WORKERS", "2"))
+GRAFICOS_TIMEOUT_SECONDS = int(os.getenv("GRAFICOS_TIMEOUT_SECONDS", "60"))
+GRAFICOS_DIR = os.path.join(REPORT_JOBS_DIR, "graficos")
+
+pool_graficos: Optional[ProcessPoolExecutor] = None
+pool_graficos_lock = threading.Lock()
+
+RANGOS_ANTIGUEDAD = ["0-1 años", "1-3 años", "3-5 años", "5+ años"]
+
+# Intervalo del job de reconciliación de agregados del dashboard (0 = desactivado)
+DASHBOARD_RECONCILE_INTERVAL_MINUTES = int(os.getenv("DASHBOARD_RECONCILE_INTERVAL_MINUTES", "60"))
+
+# ============================================
+# LECTURA Y AGRUPACIÓN VECTORIZADA
+# ============================================
+
+def aplanar_equipo(equipo: dict) -> dict:
+    """Aplanar un equipo con sus relaciones embebidas a columnas analíticas"""
+    ubicacion = equipo.get('ubicaciones')
+    categoria = equipo.get('categorias_equipos')
+    proveedor = equipo.get('proveedores')
+    return {
+        "id": equipo['id'],
+        "estado": equipo.get('estado_operativo'),
+        "ubicacion": f"{ubicacion['edificio']} - {ubicacion['aula_oficina']}" if ubicacion else None,
+        "edificio": ubicacion['edificio'] if ubicacion else None,
+        "categoria": categoria['nombre'] if categoria else None,
+        "proveedor": proveedor['razon_social'] if proveedor else None,
+        "costo_compra": equipo.get('costo_compra'),
+        "fecha_compra": equipo.get('fecha_compra')
+    }
+
+def construir_df(tabla: str, filas: List[dict]) -> pd.DataFrame:
+    """Construir el DataFrame columnar de una tabla con tipos compactos"""
+    if tabla == "equipos":
+        filas = [aplanar_equipo(fila) for fila in filas]
+    config = SNAPSHOT_TABLAS[tabla]
+    columnas = ["id"] + config['categoricas'] + config['fechas'] + config['numericas']
+    if tabla == "mantenimientos":
+        columnas.append("equipo_id")
+    df = pd.DataFrame(filas, columns=columnas).set_index("id")
+    return aplicar_tipos(tabla, df)
+
+def aplicar_tipos(tabla: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Convertir columnas a category / datetime64 / float64"""
+    config = SNAPSHOT_TABLAS[tabla]
+    for columna in config['categoricas']:
+        df[columna] = df[columna].astype("category")
+    for columna in config['fechas']:
+        df[columna] = pd.to_datetime(df[columna], errors='coerce')
+    for columna in config['numericas']:
+        df[columna] = pd.to_numeric(df[columna], errors='coerce')
+    if "equipo_id" in df.columns:
+        df["equipo_id"] = pd.to_numeric(df["equipo_id"], errors='coerce').astype("Int64")
+    return df
+
+def leer_tabla(tabla: str) -> List[dict]:
+    """Leer una tabla completa en páginas keyset por id"""
+    return leer_paginado(lambda: supabase.table(tabla).select(SNAPSHOT_TABLAS[tabla]['select']))
+
+def leer_paginado(consulta: Callable) -> List[dict]:
+    """Leer todas las filas de una consulta en páginas keyset por id.
+
+    consulta construye la consulta base: el builder de PostgREST acumula los
+    filtros, así que cada página parte de uno nuevo.
+    """
+    filas = []
+    ultimo_id = 0
+    while True:
+        data = consulta().gt("id", ultimo_id).order("id").limit(REPORTES_PAGE_SIZE).execute().data
+        filas.extend(data)
+        if len(data) < REPORTES_PAGE_SIZE:
+            return filas
+        ultimo_id = data[-1]['id']
+
+def cargar_snapshot_completo() -> dict:
+    """Leer todas las tablas del snapshot"""
+    # El token se lee antes que los datos: los cambios concurrentes se reaplican después
+    token = registro_cambios.token_actual(supabase)
+    tablas = {tabla: construir_df(tabla, leer_tabla(tabla)) for tabla in SNAPSHOT_TABLAS}
+    ahora = time.time()
+    return {"tablas": tablas, "token": token, "actualizado": ahora, "carga_completa": ahora, "agrupaciones": {}}
+
+def leer_cambios_snapshot(token: int) -> Optional[tuple]:
+    """Filas vigentes de los registros cambiados después del token: ({tabla: (ids, filas)}, token)
+
+    Devuelve None si son tantos cambios que conviene recargar todo.
+    """
+    cambiados = {tabla: set() for tabla in TABLAS_REPORTES}
+    while True:
+        data = supabase.rpc("leer_registro_cambios_tablas", {
+            "p_tablas": TABLAS_REPORTES,
+            "p_desde": token,
+            "p_limite": REPORTES_PAGE_SIZE
+        }).execute().data
+        for cambio in data:
+            cambiados[cambio['tabla']].add(cambio['registro_id'])
+        if data:
+            token = data[-1]['id']
+        if sum(len(ids) for ids in cambiados.values()) > SNAPSHOT_MAX_CAMBIOS_INCREMENTAL:
+            return None
+        if len(data) < REPORTES_PAGE_SIZE:
+            break
+    
+    filas = {tabla: {} for tabla in SNAPSHOT_TABLAS}
+    for tabla in SNAPSHOT_TABLAS:
+        ids = list(cambiados[tabla])
+        for i in range(0, len(ids), IN_CHUNK_SIZE):
+            for fila in supabase.table(tabla).select(SNAPSHOT_TABLAS[tabla]['select']).in_(
+                "id", ids[i:i + IN_CHUNK_SIZE]
+            ).execute().data:
+                filas[tabla][fila['id']] = fila
+    
+    # Un renombrado de categoría, ubicación o proveedor cambia el nombre copiado en sus equipos
+    for dimension, columna in SNAPSHOT_DIMENSIONES.items():
+        ids = list(cambiados[dimension])
+        for i in range(0, len(ids), IN_CHUNK_SIZE):
+            lote = ids[i:i + IN_CHUNK_SIZE]
+            for fila in leer_paginado(lambda: supabase.table("equipos").select(
+                SNAPSHOT_TABLAS["equipos"]['select']
+            ).in_(columna, lote)):
+                cambiados["equipos"].add(fila['id'])
+                filas["equipos"][fila['id']] = fila
+        if len(cambiados["equipos"]) > SNAPSHOT_MAX_CAMBIOS_INCREMENTAL:
+            return None
+    
+    return {tabla: (cambiados[tabla], list(filas[tabla].values())) for tabla in SNAPSHOT_TABLAS}, token
+
+def unir_categoricas(tabla: str, base: pd.DataFrame, nuevas: pd.DataFrame) -> pd.DataFrame:
+    """Concatenar dos DataFrames del snapshot conservando las columnas categóricas"""
+    for columna in SNAPSHOT_TABLAS[tabla]['categoricas']:
+        categorias = base[columna].cat.categories.union(nuevas[columna].cat.categories)
+        base[columna] = base[columna].cat.set_categories(categorias)
+        nuevas[columna] = nuevas[columna].cat.set_categories(categorias)
+    df = pd.concat([base, nuevas]).sort_index()
+    # Los nombres que ya no usa ningún registro (p. ej. tras un renombrado) se descartan
+    for columna in SNAPSHOT_TABLAS[tabla]['categoricas']:
+        df[columna] = df[columna].cat.remove_unused_categories()
+    return df
+
+def aplicar_cambios_snapshot(actual: dict, cambios: dict, token: int) -> dict:
+    """Nueva versión del snapshot con las filas cambiadas reemplazadas"""
+    tablas = dict(actual['tablas'])
+    for tabla, (ids, filas) in cambios.items():
+        if not ids:
+            continue
+        # Los ids sin fila vigente fueron eliminados: se descartan sin reemplazo
+        df = tablas[tabla].drop(index=list(ids), errors="ignore")
+        if filas:
+            df = unir_categoricas(tabla, df, construir_df(tabla, filas))
+        tablas[tabla] = df
+    return {**actual, "tablas": tablas, "token": token, "actualizado": time.time(), "agrupaciones": {}}
+
+def obtener_snapshot(forzar: bool = False, completo: bool = False) -> dict:
+    """Devolver el snapshot, refrescándolo si está vencido"""
+    global snapshot
+    
+    def pendiente(actual: dict) -> Optional[str]:
+        ahora = time.time()
+        if completo or actual['carga_completa'] is None or ahora - actual['carga_completa'] > SNAPSHOT_FULL_RELOAD_SECONDS:
+            return "completo"
+        if forzar or ahora - actual['actualizado'] > SNAPSHOT_MAX_AGE_SECONDS:
+            return "incremental"
+        return None
+    
+    if pendiente(snapshot) is None:
+        return snapshot
+    # Con datos cargados y sin refresco pedido explícitamente, si otro hilo ya refresca
+    # se sirve la versión vigente en lugar de esperar su lectura
+    esperar = forzar or completo or snapshot['carga_completa'] is None
+    if not snapshot_lock.acquire(blocking=esperar):
+        return snapshot
+    try:
+        # Otro hilo pudo refrescar mientras se esperaba el lock
+        accion = pendiente(snapshot)
+        if accion == "incremental":
+            leidos = leer_cambios_snapshot(snapshot['token'])
+            snapshot = aplicar_cambios_snapshot(snapshot, *leidos) if leidos else cargar_snapshot_completo()
+        elif accion == "completo":
+            snapshot = cargar_snapshot_completo()
+        return snapshot
+    finally:
+        snapshot_lock.release()
+
+def info_snapshot() -> dict:
+    """Edad, tamaño y huella de memoria del snapshot"""
+    actual = snapshot
+    ahora = time.time()
+    return {
+        "token": actual['token'],
+        "edad_segundos": round(ahora - actual['actualizado'], 1) if actual['actualizado'] else None,
+        "segundos_desde_carga_completa": round(ahora - actual['carga_completa'], 1) if actual['carga_completa'] else None,
+        "filas": {tabla: len(df) for tabla, df in actual['tablas'].items()},
+        "memoria_bytes": {
+            tabla: int(df.memory_usage(deep=True).sum()) for tabla, df in actual['tablas'].items()
+        }
+    }
+
+def conteo_a_lista(serie: pd.Series, clave: str, valor: str) -> List[dict]:
+    """Convertir una serie agrupada en la lista [{clave, valor}] ordenada de mayor a menor"""
+    # Las columnas categóricas incluyen categorías sin filas
+    serie = serie[serie > 0].sort_values(ascending=False)
+    return [{clave: indice, valor: v} for indice, v in zip(serie.index.tolist(), serie.tolist())]
+
+def agrupar_estado(df: pd.DataFrame) -> List[dict]:
+    estados = df['estado'].astype(object).fillna('sin_estado')
+    return conteo_a_lista(estados.value_counts(), "estado", "cantidad")
+
+def agrupar_ubicacion(df: pd.DataFrame) -> List[dict]:
+    return conteo_a_lista(df['ubicacion'].value_counts(), "ubicacion", "cantidad")
+
+def agrupar_categoria(df: pd.DataFrame) -> List[dict]:
+    return conteo_a_lista(df['categoria'].value_counts(), "categoria", "cantidad")
+
+def agrupar_valor(df: pd.DataFrame) -> List[dict]:
+    # observed=True descarta categorías sin equipos pero conserva las de valor 0
+    valores = df['costo_compra'].fillna(0).groupby(df['categoria'], observed=True).sum()
+    valores = valores.sort_values(ascending=False)
+    return [{"categoria": k, "valor_total": v} for k, v in zip(valores.index.tolist(), valores.tolist())]
+
+def agrupar_antiguedad(df: pd.DataFrame) -> List[dict]:
+    anios = (pd.Timestamp(date.today()) - df['fecha_compra']).dt.days / 365
+    rangos = pd.cut(anios, bins=[float('-inf'), 1, 3, 5, float('inf')], right=False, labels=RANGOS_ANTIGUEDAD)
+    conteo = rangos.value_counts().reindex(RANGOS_ANTIGUEDAD, fill_value=0)
+    resultado = [{"rango": rango, "cantidad": int(cantidad)} for rango, cantidad in conteo.items()]
+    resultado.append({"rango": "sin_fecha", "cantidad": int(rangos.isna().sum())})
+    return resultado
+
+AGRUPACIONES = {
+    "estado": agrupar_estado,
+    "ubicacion": agrupar_ubicacion,
+    "categoria": agrupar_categoria,
+    "valor": agrupar_valor,
+    "antiguedad": agrupar_antiguedad
+}
+
+def agrupacion_snapshot(seccion: str) -> List[dict]:
+    """Agrupación de equipos calculada una sola vez por versión del snapshot (y por día, por la antigüedad)"""
+    actual = obtener_snapshot()
+    clave = (seccion, date.today())
+    if clave not in actual['agrupaciones']:
+        actual['agrupaciones'][clave] = AGRUPACIONES[seccion](actual['tablas']['equipos'])
+    return actual['agrupaciones'][clave]
+
+# ============================================
+# PIVOT / OLAP SOBRE EL SNAPSHOT
+# ============================================
+
+DIMENSIONES_EQUIPO = ["estado", "ubicacion", "edificio", "categoria", "proveedor"]
+
+# Hechos disponibles: dimensiones, columna de fecha para la granularidad y medidas
+# (columna, agregación). La dimensión "periodo" sale de la columna de fecha.
+HECHOS_PIVOT = {
+    "equipos": {
+        "dimensiones": DIMENSIONES_EQUIPO,
+        "fecha": "fecha_compra",
+        "medidas": {
+            "cantidad": ("costo_compra", "size"),
+            "valor_total": ("costo_compra", "sum"),
+            "valor_promedio": ("costo_compra", "mean"),
+            "disponibilidad": ("operativo", "mean")
+        }
+    },
+    "mantenimientos": {
+        "dimensiones": ["tipo", "estado", "estado_equipo", "ubicacion", "edificio", "categoria", "proveedor"],
+        "fecha": "fecha_programada",
+        "medidas": {
+            "cantidad": ("costo_total", "size"),
+            "costo_total": ("costo_total", "sum"),
+            "costo_promedio": ("costo_total", "mean"),
+            "tasa_completados": ("completado", "mean")
+        }
+    }
+}
+
+GRANULARIDADES = {"dia": "D", "mes": "M", "trimestre": "Q", "anio": "Y"}
+
+class ConsultaPivot(BaseModel):
+    hecho: str = "equipos"
+    dimensiones: List[str] = []
+    medidas: List[str] = ["cantidad"]
+    filtros: Dict[str, List[str]] = {}
+    granularidad: Optional[str] = None
+    desde: Optional[date] = None
+    hasta: Optional[date] = None
+    limite: Optional[int] = None
+
+def validar_consulta_pivot(consulta: ConsultaPivot):
+    """Validar dimensiones, medidas y filtros contra el catálogo del hecho"""
+    hecho = HECHOS_PIVOT.get(consulta.hecho)
+    if not hecho:
+        raise HTTPException(status_code=400, detail=f"Hecho no válido: {consulta.hecho} (disponibles: {', '.join(HECHOS_PIVOT)})")
+    
+    dimensiones = hecho['dimensiones'] + ["periodo"]
+    errores = []
+    errores += [f"dimensión '{d}'" for d in consulta.dimensiones if d not in dimensiones]
+    errores += [f"medida '{m}'" for m in consulta.medidas if m not in hecho['medidas']]
+    errores += [f"filtro '{f}'" for f in consulta.filtros if f not in hecho['dimensiones']]
+    if errores:
+        raise HTTPException(status_code=400, detail=f"No disponible para '{consulta.hecho}': {', '.join(errores)}")
+    if not consulta.medidas:
+        raise HTTPException(status_code=400, detail="Se requiere al menos una medida")
+    if "periodo" in consulta.dimensiones and not consulta.granularidad:
+        raise HTTPException(status_code=400, detail="La dimensión 'periodo' requiere 'granularidad'")
+    if consulta.granularidad and consulta.granularidad not in GRANULARIDADES:
+        raise HTTPException(status_code=400, detail=f"Granularidad no válida (disponibles: {', '.join(GRANULARIDADES)})")
+
+def obtener_hechos(hecho: str) -> pd.DataFrame:
+    """Devolver el conjunto de hechos pre-unido, reconstruido solo al cambiar el snapshot"""
+    datos = obtener_snapshot()
+    equipos = datos['tablas']['equipos']
+    if hecho == "equipos":
+        return equipos.assign(operativo=(equipos['estado'] == "operativo").astype(float))
+    
+    with cache_pivot_lock:
+        if hechos_cache['token'] != datos['token'] or hechos_cache['carga_completa'] != datos['carga_completa']:
+            mantenimientos = datos['tablas']['mantenimientos']
+            dimensiones = equipos[DIMENSIONES_EQUIPO].rename(columns={"estado": "estado_equipo"})
+            hechos_cache['mantenimientos'] = mantenimientos.join(dimensiones, on="equipo_id").assign(
+                completado=(mantenimientos['estado'] == "completado").astype(float)
+            )
+            hechos_cache['token'] = datos['token']
+            hechos_cache['carga_completa'] = datos['carga_completa']
+        return hechos_cache['mantenimientos']
+
+def ejecutar_pivot(consulta: ConsultaPivot) -> List[dict]:
+    """Filtrar, agrupar y agregar el hecho según la consulta"""
+    hecho = HECHOS_PIVOT[consulta.hecho]
+    df = obtener_hechos(consulta.hecho)
+    
+    mascara = pd.Series(True, index=df.index)
+    for dimension, valores in consulta.filtros.items():
+        mascara &= df[dimension].isin(valores)
+    fecha = df[hecho['fecha']]
+    if consulta.desde:
+        mascara &= fecha >= pd.Timestamp(consulta.desde)
+    if consulta.hasta:
+        mascara &= fecha <= pd.Timestamp(consulta.hasta)
+    df = df[mascara]
+    
+    if "periodo" in consulta.dimensiones:
+        df = df.assign(periodo=df[hecho['fecha']].dt.to_period(GRANULARIDADES[consulta.granularidad]).astype(str))
+        df.loc[df[hecho['fecha']].isna(), "periodo"] = None
+    
+    agregaciones = {medida: hecho['medidas'][medida] for medida in consulta.medidas}
+    if consulta.dimensiones:
+        resultado = df.groupby(consulta.dimensiones, observed=True, dropna=False).agg(**agregaciones).reset_index()
+        resultado = resultado.sort_values(consulta.dimensiones, na_position="last")
+    else:
+        resultado = pd.DataFrame([{
+            medida: df[columna].agg(funcion) if funcion != "size" else len(df)
+            for medida, (columna, funcion) in agregaciones.items()
+        }])
+    
+    # NaN no es JSON válido: se publica como null
+    resultado = resultado.astype(object).where(resultado.notna(), None)
+    return resultado.to_dict(orient="records")
+
+def consultar_pivot(consulta: ConsultaPivot) -> dict:
+    """Ejecutar la consulta pivot usando la caché por firma y versión del snapshot"""
+    datos = obtener_snapshot()
+    firma = json.dumps(consulta.model_dump(mode="json"), sort_keys=True)
+    clave = (firma, datos['token'], datos['carga_completa'])
+    
+    with cache_pivot_lock:
+        if clave in cache_pivot:
+            cache_pivot.move_to_end(clave)
+            return {**cache_pivot[clave], "cache": True}
+    
+    filas = ejecutar_pivot(consulta)
+    limite = min(consulta.limite or PIVOT_MAX_FILAS, PIVOT_MAX_FILAS)
+    resultado = {
+        "total_filas": len(filas),
+        "truncado": len(filas) > limite,
+        "filas": filas[:limite],
+        "snapshot_token": datos['token']
+    }
+    
+    with cache_pivot_lock:
+        cache_pivot[clave] = resultado
+        while len(cache_pivot) > PIVOT_CACHE_SIZE:
+            cache_pivot.popitem(last=False)
+    return {**resultado, "cache": False}
+
+# ============================================
+# DASHBOARD Y RECONCILIACIÓN DE AGREGADOS
+# ============================================
+
+def leer_dashboard() -> dict:
+    """Métricas del dashboard a partir de los agregados materializados"""
+    # Los totales de inventario están repartidos en fragmentos: se suman al leer
+    response = supabase.table("agregados_equipos_fragmentos").select(
+        "total_equipos, equipos_operativos, equipos_reparacion, valor_inventario"
+    ).execute()
+    equipos = {
+        campo: sum(int(fragmento[campo] or 0) for fragmento in response.data)
+        for campo in ("total_equipos", "equipos_operativos", "equipos_reparacion")
+    }
+    equipos['valor_inventario'] = round(sum(float(fragmento['valor_inventario'] or 0) for fragmento in response.data), 2)
+    
+    total_equipos = equipos['total_equipos']
+    equipos_operativos = equipos['equipos_operativos']
+    
+    # Calcular tasa de disponibilidad
+    tasa_disponibilidad = round((equipos_operativos / total_equipos * 100), 2) if total_equipos > 0 else 0
+    
+    # Mantenimientos del mes actual (como máximo 31 filas diarias)
+    hoy = date.today()
+    primer_dia_mes = hoy.replace(day=1)
+    
+    dias_response = supabase.table("agregados_mantenimientos_diarios").select(
+        "cantidad, costo_total"
+    ).gte("dia", str(primer_dia_mes)).lte("dia", str(hoy)).execute()
+    
+    return {
+        "total_equipos": total_equipos,
+        "equipos_operativos": equipos_operativos,
+        "equipos_reparacion": equipos['equipos_reparacion'],
+        "tasa_disponibilidad": tasa_disponibilidad,
+        "valor_inventario": equipos['valor_inventario'],
+        "mantenimientos_mes": sum(d['cantidad'] for d in dias_response.data),
+        "costo_mantenimiento_mes": sum(d['costo_total'] or 0 for d in dias_response.data)
+    }
+
+def reconciliar_agregados(corregir: bool = True) -> dict:
+    """Comparar los agregados del dashboard con un recálculo completo"""
+    response = supabase.rpc("reconciliar_agregados_dashboard", {"corregir": corregir}).execute()
+    return response.data
+
+async def job_reconciliacion():
+    """Job periódico que verifica (y corrige) los agregados del dashboard"""
+    while True:
+        await asyncio.sleep(DASHBOARD_RECONCILE_INTERVAL_MINUTES * 60)
+        try:
+            resultado = await asyncio.to_thread(reconciliar_agregados, True)
+            if resultado.get('corregido'):
+                print(f"⚠️ Agregados del dashboard corregidos: {resultado}")
+        except Exception as e:
+            print(f"Error en reconciliación de agregados: {e}")
+
+# ============================================
+# ROLLUP MENSUAL DE COSTOS
+# ============================================
+
+def parsear_mes(valor: str, parametro: str) -> date:
+    """Convertir 'YYYY-MM' en el primer día del mes"""
+    try:
+        return datetime.strptime(valor, '%Y-%m').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{parametro}' debe tener el formato YYYY-MM")
+
+def rango_meses(desde: Optional[str], hasta: Optional[str]) -> tuple:
+    """Rango de meses pedido; por defecto los últimos 12 meses"""
+    fin = parsear_mes(hasta, "hasta") if hasta else date.today().replace(day=1)
+    if desde:
+        inicio = parsear_mes(desde, "desde")
+    else:
+        # Ambos extremos son inclusivos: 11 meses antes de fin
+        meses = fin.year * 12 + fin.month - 12
+        inicio = date(meses // 12, meses % 12 + 1, 1)
+    if inicio > fin:
+        raise HTTPException(status_code=400, detail="'desde' no puede ser posterior a 'hasta'")
+    return inicio, fin
+
+def leer_costos_mensuales(desde: date, hasta: date) -> List[dict]:
+    """Leer las filas del rollup (mes, tipo, categoría) en el rango de meses"""
+    filas = []
+    inicio = 0
+    while True:
+        data = supabase.table("costos_mantenimiento_mensuales").select(
+            "mes, tipo, categoria_id, cantidad, costo_total"
+        ).gte("mes", str(desde)).lte("mes", str(hasta)).order("mes").order("tipo").order(
+            "categoria_id"
+        ).range(inicio, inicio + REPORTES_PAGE_SIZE - 1).execute().data
+        filas.extend(data)
+        if len(data) < REPORTES_PAGE_SIZE:
+            return filas
+        inicio += REPORTES_PAGE_SIZE
+
+def resumir_costos_mensuales(filas: List[dict], categorias: Optional[Dict[int, str]] = None) -> List[dict]:
+    """Sumar el rollup por mes; con categorias se desglosa además por categoría"""
+    meses = {}
+    for fila in filas:
+        mes = meses.setdefault(fila['mes'][:7], {
+            "mes": fila['mes'][:7],
+            "costo_preventivo": 0,
+            "costo_correctivo": 0,
+            "costo_otros": 0,
+            "costo_total": 0,
+            "cantidad": 0
+        })
+        costo = float(fila['costo_total'])
+        clave = f"costo_{fila['tipo']}" if fila['tipo'] in ("preventivo", "correctivo") else "costo_otros"
+        mes[clave] += costo
+        mes['costo_total'] += costo
+        mes['cantidad'] += fila['cantidad']
+        
+        if categorias is not None:
+            nombre = categorias.get(fila['categoria_id'], "Sin categoría")
+            desglose = mes.setdefault("categorias", {}).setdefault(nombre, {"costo_total": 0, "cantidad": 0})
+            desglose['costo_total'] += costo
+            desglose['cantidad'] += fila['cantidad']
+    
+    resultado = []
+    for mes in sorted(meses):
+        datos = meses[mes]
+        if categorias is not None:
+            datos['categorias'] = [
+                {"categoria": nombre, **valores}
+                for nombre, valores in sorted(datos['categorias'].items(), key=lambda x: -x[1]['costo_total'])
+            ]
+        resultado.append(datos)
+    return resultado
+
+# ============================================
+# GENERACIÓN DE DOCUMENTOS (PDF / XLSX)
+# ============================================
+
+# Secciones exportables: título, columnas clave/valor y tipo de gráfico
+SECCIONES_REPORTE = {
+    "ubicacion": {"titulo": "Equipos por Ubicacion", "etiqueta": "ubicacion", "series": ["cantidad"], "grafico": "barras"},
+    "estado": {"titulo": "Equipos por Estado Operativo", "etiqueta": "estado", "series": ["cantidad"], "grafico": "pastel"},
+    "antiguedad": {"titulo": "Antiguedad de Equipos", "etiqueta": "rango", "series": ["cantidad"], "grafico": "barras_h"},
+    "categoria": {"titulo": "Equipos por Categoria", "etiqueta": "categoria", "series": ["cantidad"], "grafico": "barras"},
+    "valor": {"titulo": "Valor por Categoria", "etiqueta": "categoria", "series": ["valor_total"], "grafico": "pastel"},
+    "costos": {
+        "titulo": "Costos de Mantenimiento",
+        "etiqueta": "mes",
+        "series": ["costo_preventivo", "costo_correctivo", "costo_otros"],
+        "grafico": "lineas"
+    }
+}
+
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+}
+
+def datos_seccion(seccion: str, parametros: dict) -> List[dict]:
+    """Filas de una sección de reporte (snapshot o rollup de costos)"""
+    if seccion == "costos":
+        inicio, fin = rango_meses(parametros.get("desde"), parametros.get("hasta"))
+        return resumir_costos_mensuales(leer_costos_mensuales(inicio, fin))
+    return agrupacion_snapshot(seccion)
+
+def especificacion_grafico(seccion: str, filas: List[dict]) -> dict:
+    """Descripción serializable del gráfico de una sección"""
+    config = SECCIONES_REPORTE[seccion]
+    return {
+        "tipo": config['grafico'],
+        "titulo": config['titulo'],
+        "etiquetas": [str(fila[config['etiqueta']]) for fila in filas],
+        "series": {serie: [fila[serie] or 0 for fila in filas] for serie in config['series']}
+    }
+
+def obtener_pool_graficos(descartar: Optional[ProcessPoolExecutor] = None) -> ProcessPoolExecutor:
+    """Pool de renderizado; se recrea si el pool indicado se rompió"""
+    global pool_graficos
+    with pool_graficos_lock:
+        if pool_graficos is not None and pool_graficos is descartar:
+            # Un pool roto ya falló todas sus tareas: se terminan sus procesos de inmediato
+            procesos = list((pool_graficos._processes or {}).values())
+            pool_graficos.shutdown(wait=False, cancel_futures=True)
+            for proceso in procesos:
+                proceso.terminate()
+            pool_graficos = None
+        if pool_graficos is None:
+            # spawn: workers nuevos que no heredan hilos, locks ni conexiones del servicio.
+            # Cada worker arranca un intérprete e importa el módulo de la función enviada
+            # (graficos.py) y el módulo principal del proceso padre (uvicorn, no main.py).
+            pool_graficos = ProcessPoolExecutor(
+                max_workers=GRAFICOS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return pool_graficos
+
+def retirar_pool_graficos(pool: ProcessPoolExecutor, colgado: Future):
+    """Dejar de usar un pool con un worker colgado sin cortar las tareas de otros jobs.
+
+    Los pedidos nuevos van a un pool nuevo; el retirado termina lo que ya tenía en
+    cola y recién entonces se terminan sus procesos (el colgado incluido).
+    """
+    global pool_graficos
+    with pool_graficos_lock:
+        if pool_graficos is not pool:
+            return
+        pool_graficos = None
+        # shutdown anula estas referencias: se toman antes
+        procesos = list((pool._processes or {}).values())
+        otros = [item.future for item in list(pool._pending_work_items.values()) if item.future is not colgado]
+        pool.shutdown(wait=False)
+    
+    def terminar():
+        # Cada tarea tiene su propio timeout en quien la espera: no se espera más que eso
+        wait(otros, timeout=GRAFICOS_TIMEOUT_SECONDS)
+        for proceso in procesos:
+            proceso.terminate()
+    
+    threading.Thread(target=terminar, name="retiro-pool-graficos", daemon=True).start()
+
+def hash_grafico(grafico: dict) -> str:
+    return hashlib.sha256(json.dumps(grafico, sort_keys=True, default=str).encode()).hexdigest()
+
+def guardar_png(ruta: str, png: bytes):
+    temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    with open(temporal, "wb") as archivo:
+        archivo.write(png)
+    os.replace(temporal, ruta)
+
+def renderizar_graficos(graficos: List[dict]) -> List[Optional[bytes]]:
+    """Renderizar varios gráficos en paralelo, reutilizando los PNG ya cacheados.
+    Un gráfico que excede GRAFICOS_TIMEOUT_SECONDS se devuelve como None (va sin imagen)."""
+    os.makedirs(GRAFICOS_DIR, exist_ok=True)
+    rutas = [os.path.join(GRAFICOS_DIR, f"{hash_grafico(grafico)}.png") for grafico in graficos]
+    pendientes = {ruta: grafico for ruta, grafico in zip(rutas, graficos) if not os.path.exists(ruta)}
+    vencidos = set()
+    
+    for intento in range(2):
+        pool = obtener_pool_graficos()
+        try:
+            futuros = {ruta: pool.submit(renderizar_grafico, grafico) for ruta, grafico in pendientes.items()}
+            for ruta, futuro in futuros.items():
+                try:
+                    png = futuro.result(timeout=GRAFICOS_TIMEOUT_SECONDS)
+                except TimeoutError:
+                    # Worker colgado: este gráfico va sin imagen y el resto sigue en el mismo pool
+                    print(f"Gráfico sin imagen: superó {GRAFICOS_TIMEOUT_SECONDS}s de renderizado")
+                    vencidos.add(ruta)
+                    retirar_pool_graficos(pool, futuro)
+                    continue
+                guardar_png(ruta, png)
+            break
+        except BrokenProcessPool:
+            # Un worker murió (p. ej. por memoria): se recrea el pool y se reintenta una vez
+            obtener_pool_graficos(descartar=pool)
+            pendientes = {
+                ruta: grafico for ruta, grafico in pendientes.items()
+                if ruta not in vencidos and not os.path.exists(ruta)
+            }
+            if intento:
+                raise
+    
+    resultado = []
+    for ruta in rutas:
+        if ruta in vencidos:
+            resultado.append(None)
+            continue
+        with open(ruta, "rb") as archivo:
+            resultado.append(archivo.read())
+    return resultado
+
+def estilos_pdf() -> dict:
+    styles = getSampleStyleSheet()
+    return {
+        "base": styles,
+        "titulo": ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            textColor=colors.HexColor('#1f77b4'),
+            spaceAfter=30,
+            alignment=TA_CENTER
+        ),
+        "fecha": ParagraphStyle('Fecha', parent=styles['Normal'], alignment=TA_CENTER, fontSize=10)
+    }
+
+def tabla_pdf(data: List[list], anchos: List[float]) -> Table:
+    table = Table(data, colWidths=anchos, repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f77b4')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('PADDING', (0, 0), (-1, -1), 6)
+    ]))
+    return table
+
+def elementos_seccion(estilos: dict, titulo: str, grafico_png: Optional[bytes], filas: List[dict]) -> list:
+    """Título, gráfico y tabla de datos de una sección"""
+    elements = [Paragraph(titulo, estilos['titulo'])]
+    
+    if grafico_png:
+        elements.append(Image(BytesIO(grafico_png), width=6.5*inch, height=4*inch))
+        elements.append(Spacer(1, 0.4*inch))
+    
+    if filas:
+        columnas = list(filas[0].keys())
+        elements.append(Paragraph("Datos del Reporte", estilos['base']['Heading2']))
+        elements.append(Spacer(1, 0.2*inch))
+        data = [columnas] + [[fila.get(columna, "") for columna in columnas] for fila in filas]
+        elements.append(tabla_pdf(data, [6.5*inch / len(columnas)] * len(columnas)))
+    
+    return elements
+
+def fecha_generacion(estilos: dict) -> list:
+    return [
+        Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", estilos['fecha']),
+        Spacer(1, 0.3*inch)
+    ]
+
+def construir_pdf(destino, titulo: str, grafico_png: Optional[bytes], filas: List[dict]):
+    """Documento PDF con título, gráfico y tabla de datos"""
+    estilos = estilos_pdf()
+    elements = elementos_seccion(estilos, titulo, grafico_png, filas)
+    elements[1:1] = fecha_generacion(estilos)
+    SimpleDocTemplate(destino, pagesize=letter).build(elements)
+
+def generar_reporte_seccion(formato: str, parametros: dict, destino: str):
+    """Generar el documento de una sección de reporte"""
+    seccion = parametros.get("seccion")
+    if seccion not in SECCIONES_REPORTE:
+        raise ValueError(f"Sección no válida: {seccion} (disponibles: {', '.join(SECCIONES_REPORTE)})")
+    
+    filas = datos_seccion(seccion, parametros)
+    if formato == "xlsx":
+        pd.DataFrame(filas).to_excel(destino, index=False, sheet_name=seccion)
+    else:
+        grafico = renderizar_graficos([especificacion_grafico(seccion, filas)])[0] if filas else None
+        construir_pdf(destino, SECCIONES_REPORTE[seccion]['titulo'], grafico, filas)
+
+# ============================================
+# PAQUETE DE GESTIÓN MENSUAL (UNA SOLA PASADA)
+# ============================================
+
+def formato_soles(valor) -> str:
+    return f"S/. {float(valor or 0):,.2f}"
+
+# Métricas de la portada: etiqueta, clave del dashboard y formato para el PDF
+METRICAS_DASHBOARD = [
+    ("Total Equipos", "total_equipos", str),
+    ("Equipos Operativos", "equipos_operativos", str),
+    ("Equipos en Reparacion", "equipos_reparacion", str),
+    ("Tasa de Disponibilidad", "tasa_disponibilidad", lambda v: f"{v}%"),
+    ("Valor Inventario", "valor_inventario", formato_soles),
+    ("Mantenimientos (Mes)", "mantenimientos_mes", str),
+    ("Costo Mantenimiento (Mes)", "costo_mantenimiento_mes", formato_soles)
+]
+
+def datos_pack() -> dict:
+    """Todas las secciones del paquete con una sola lectura del snapshot y del rollup"""
+    secciones = {seccion: datos_seccion(seccion, {}) for seccion in SECCIONES_REPORTE}
+    return {"dashboard": leer_dashboard(), "secciones": secciones}
+
+def metricas_dashboard(dashboard: dict) -> List[list]:
+    return [
+        [etiqueta, formatear(dashboard.get(clave, 0))]
+        for etiqueta, clave, formatear in METRICAS_DASHBOARD
+    ]
+
+def escribir_pack_pdf(datos: dict, destino: str):
+    """PDF con portada de métricas y una página por sección"""
+    secciones = [(seccion, filas) for seccion, filas in datos['secciones'].items() if filas]
+    # Todos los gráficos se renderizan en paralelo en el pool de procesos
+    graficos = renderizar_graficos([especificacion_grafico(seccion, filas) for seccion, filas in secciones])
+    
+    estilos = estilos_pdf()
+    elements = [Paragraph("Paquete de Gestion Mensual - Sistema de Gestion TI", estilos['titulo'])]
+    elements += fecha_generacion(estilos)
+    elements.append(Paragraph("Metricas Principales", estilos['base']['Heading2']))
+    elements.append(Spacer(1, 0.2*inch))
+    elements.append(tabla_pdf([['Metrica', 'Valor']] + metricas_dashboard(datos['dashboard']), [3.5*inch, 2.5*inch]))
+    
+    for (seccion, filas), grafico in zip(secciones, graficos):
+        elements.append(PageBreak())
+        elements += elementos_seccion(estilos, SECCIONES_REPORTE[seccion]['titulo'], grafico, filas)
+    
+    SimpleDocTemplate(destino, pagesize=letter).build(elements)
+
+def escribir_pack_excel(datos: dict, destino: str):
+    """Libro XLSX con una hoja de resumen y una hoja por sección"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title="resumen")
+    ws.append(["Metrica", "Valor"])
+    for etiqueta, clave, _ in METRICAS_DASHBOARD:
+        ws.append([etiqueta, datos['dashboard'].get(clave)])
+    
+    for seccion, filas in datos['secciones'].items():
+        ws = wb.create_sheet(title=seccion)
+        if filas:
+            columnas = list(filas[0].keys())
+            ws.append(columnas)
+            for fila in filas:
+                ws.append([fila.get(columna) for columna in columnas])
+    
+    wb.save(destino)
+
+def generar_pack(formato: str, parametros: dict, destino: str):
+    """Generador de jobs del paquete de gestión"""
+    datos = datos_pack()
+    if formato == "xlsx":
+        escribir_pack_excel(datos, destino)
+    else:
+        escribir_pack_pdf(datos, destino)
+
+# ============================================
+# EXPORTACIÓN EXCEL EN STREAMING
+# ============================================
+
+def ubicacion_texto(ubicacion: Optional[dict]) -> Optional[str]:
+    return f"{ubicacion['edificio']} - {ubicacion['aula_oficina']}" if ubicacion else None
+
+# Listados exportables: select de PostgREST y columnas (encabezado, extractor)
+LISTADOS_EXCEL = {
+    "equipos": {
+        "select": "id, codigo_inventario, nombre, marca, modelo, estado_operativo, fecha_compra, costo_compra, "
+                  "categorias_equipos(nombre), ubicaciones(edificio, aula_oficina)",
+        "columnas": [
+            ("Código", lambda f: f.get('codigo_inventario')),
+            ("Nombre", lambda f: f.get('nombre')),
+            ("Marca", lambda f: f.get('marca')),
+            ("Modelo", lambda f: f.get('modelo')),
+            ("Categoría", lambda f: (f.get('categorias_equipos') or {}).get('nombre')),
+            ("Estado", lambda f: f.get('estado_operativo')),
+            ("Ubicación", lambda f: ubicacion_texto(f.get('ubicaciones'))),
+            ("Fecha de compra", lambda f: f.get('fecha_compra')),
+            ("Costo de compra", lambda f: f.get('costo_compra'))
+        ]
+    },
+    "mantenimientos": {
+        "select": "id, tipo, fecha_programada, fecha_realizada, estado, costo_total, tecnico_responsable, "
+                  "diagnostico, equipos(codigo_inventario, nombre)",
+        "columnas": [
+            ("ID", lambda f: f['id']),
+            ("Tipo", lambda f: f.get('tipo')),
+            ("Fecha programada", lambda f: f.get('fecha_programada')),
+            ("Fecha realizada", lambda f: f.get('fecha_realizada')),
+            ("Código equipo", lambda f: (f.get('equipos') or {}).get('codigo_inventario')),
+            ("Equipo", lambda f: (f.get('equipos') or {}).get('nombre')),
+            ("Estado", lambda f: f.get('estado')),
+            ("Costo total", lambda f: f.get('costo_total')),
+            ("Técnico", lambda f: f.get('tecnico_responsable')),
+            ("Diagnóstico", lambda f: f.get('diagnostico'))
+        ]
+    }
+}
+
+def iterar_listado(tabla: str) -> Iterator[dict]:
+    """Recorrer un listado en páginas keyset: solo una página en memoria a la vez"""
+    ultimo_id = 0
+    while True:
+        data = supabase.table(tabla).select(LISTADOS_EXCEL[tabla]['select']).gt(
+            "id", ultimo_id
+        ).order("id").limit(REPORTES_PAGE_SIZE).execute().data
+        yield from data
+        if len(data) < REPORTES_PAGE_SIZE:
+            return
+        ultimo_id = data[-1]['id']
+
+def escribir_listado_excel(tabla: str, destino: str) -> int:
+    """Escribir el listado en un libro openpyxl write-only (memoria acotada); devuelve filas"""
+    columnas = LISTADOS_EXCEL[tabla]['columnas']
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=tabla)
+    ws.append([encabezado for encabezado, _ in columnas])
+    
+    filas = 0
+    for fila in iterar_listado(tabla):
+        ws.append([extraer(fila) for _, extraer in columnas])
+        filas += 1
+    
+    wb.save(destino)
+    return filas
+
+def generar_listado(formato: str, parametros: dict, destino: str):
+    """Generador de jobs para listados completos en XLSX"""
+    tabla = parametros.get("tabla", "equipos")
+    if tabla not in LISTADOS_EXCEL:
+        raise ValueError(f"Listado no válido: {tabla} (disponibles: {', '.join(LISTADOS_EXCEL)})")
+    escribir_listado_excel(tabla, destino)
+
+def eliminar_archivo(ruta: str):
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+# ============================================
+# COLA DE JOBS DE REPORTES
+# ============================================
+
+# Tipos de job: función generadora y formatos admitidos
+TIPOS_JOB = {
+    "seccion": {"generar": generar_reporte_seccion, "formatos": ["pdf", "xlsx"]},
+    "listado": {"generar": generar_listado, "formatos": ["xlsx"]},
+    "pack": {"generar": generar_pack, "formatos": ["pdf", "xlsx"]}
+}
+
+class JobCreate(BaseModel):
+    tipo: str = "seccion"
+    formato: str = "pdf"
+    parametros: Dict[str, str] = {}
+
+def publicar_job(job: dict) -> dict:
+    """Representación pública de un job (sin objetos internos)"""
+    return {clave: valor for clave, valor in job.items() if clave not in ("evento", "ruta", "clave", "token")}
+
+def clave_job(tipo: str, formato: str, parametros: dict, version: int) -> str:
+    """Clave de caché: parámetros normalizados + versión de los datos"""
+    firma = json.dumps({"tipo": tipo, "formato": formato, "parametros": parametros, "version": version}, sort_keys=True)
+    return hashlib.sha256(firma.encode()).hexdigest()
+
+def cache_vigente(ruta: str) -> bool:
+    return os.path.exists(ruta) and time.time() - os.path.getmtime(ruta) < REPORT_JOBS_CACHE_TTL_HOURS * 3600
+
+def limpiar_cache_reportes():
+    """Eliminar resultados y gráficos vencidos de los directorios de caché"""
+    for directorio in (REPORT_JOBS_DIR, GRAFICOS_DIR):
+        if not os.path.isdir(directorio):
+            continue
+        for nombre in os.listdir(directorio):
+            ruta = os.path.join(directorio, nombre)
+            temporal = nombre.startswith("tmp-") or nombre.endswith(".tmp")
+            if os.path.isfile(ruta) and not temporal and not cache_vigente(ruta):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+def ejecutar_job(job: dict):
+    """Ejecutar un job en el pool de workers y publicar el resultado en disco"""
+    job.update(estado="en_proceso", iniciado=datetime.now().isoformat())
+    temporal = os.path.join(REPORT_JOBS_DIR, f"tmp-{uuid.uuid4().hex}.{job['formato']}")
+    try:
+        # El documento se guarda con la clave del token: el snapshot debe incluir esos cambios
+        if snapshot['token'] < job['token']:
+            obtener_snapshot(forzar=True)
+        TIPOS_JOB[job['tipo']]['generar'](job['formato'], job['parametros'], temporal)
+        # Publicación atómica: nunca se sirve un archivo a medio escribir
+        os.replace(temporal, job['ruta'])
+        job.update(estado="completado", tamano_bytes=os.path.getsize(job['ruta']))
+        limpiar_cache_reportes()
+    except Exception as e:
+        job.update(estado="error", error=str(e))
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    finally:
+        job['finalizado'] = datetime.now().isoformat()
+        with jobs_lock:
+            jobs_por_clave.pop(job['clave'], None)
+        job['evento'].set()
+
+def crear_job(solicitud: JobCreate) -> dict:
+    """Registrar un job: servirlo desde caché, unirlo a uno idéntico en curso o encolarlo"""
+    tipo = TIPOS_JOB.get(solicitud.tipo)
+    if not tipo:
+        raise HTTPException(status_code=400, detail=f"Tipo de job no válido (disponibles: {', '.join(TIPOS_JOB)})")
+    if solicitud.formato not in tipo['formatos']:
+        raise HTTPException(status_code=400, detail=f"Formato no válido (disponibles: {', '.join(tipo['formatos'])})")
+    if solicitud.tipo == "seccion":
+        seccion = solicitud.parametros.get("seccion")
+        if seccion not in SECCIONES_REPORTE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Sección no válida: {seccion} (disponibles: {', '.join(SECCIONES_REPORTE)})"
+            )
+    
+    os.makedirs(REPORT_JOBS_DIR, exist_ok=True)
+    # Solo los cambios de las tablas de reportes invalidan la caché (no los de notificaciones)
+    token = registro_cambios.token_actual_tablas(supabase, TABLAS_REPORTES)
+    clave = clave_job(solicitud.tipo, solicitud.formato, solicitud.parametros, token)
+    ruta = os.path.join(REPORT_JOBS_DIR, f"{clave}.{solicitud.formato}")
+    
+    with jobs_lock:
+        if clave in jobs_por_clave:
+            return jobs[jobs_por_clave[clave]]
+        
+        job = {
+            "id": uuid.uuid4().hex,
+            "tipo": solicitud.tipo,
+            "formato": solicitud.formato,
+            "parametros": solicitud.parametros,
+            "estado": "pendiente",
+            "cache": False,
+            "creado": datetime.now().isoformat(),
+            "iniciado": None,
+            "finalizado": None,
+            "tamano_bytes": None,
+            "error": None,
+            "clave": clave,
+            "token": token,
+            "ruta": ruta,
+            "evento": threading.Event()
+        }
+        
+        if cache_vigente(ruta):
+            job.update(estado="completado", cache=True, finalizado=job['creado'], tamano_bytes=os.path.getsize(ruta))
+            job['evento'].set()
+        else:
+            pendientes = sum(1 for j in jobs.values() if j['estado'] in ("pendiente", "en_proceso"))
+            if pendientes >= REPORT_JOBS_MAX_PENDIENTES:
+                raise HTTPException(status_code=429, detail="Demasiados reportes en cola, intente más tarde")
+            jobs_por_clave[clave] = job['id']
+        
+        jobs[job['id']] = job
+        while len(jobs) > REPORT_JOBS_HISTORIAL:
+            antiguo = next(iter(jobs.values()))
+            if antiguo['estado'] in ("pendiente", "en_proceso"):
+                break
+            jobs.popitem(last=False)
+    
+    if job['estado'] == "pendiente":
+        jobs_executor.submit(ejecutar_job, job)
+    return job
+
+def obtener_job(job_id: str) -> dict:
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job
+
 # ============================================
 # ENDPOINTS
 # ============================================
@@ -24,220 +1124,249 @@ async def health_check():
     return {"status": "healthy", "service": "reportes"}
 
 @app.get("/dashboard")
-async def get_dashboard():
-    """Obtener datos del dashboard principal"""
+def get_dashboard():
+    """Obtener datos del dashboard principal (desde agregados materializados)"""
     try:
-        # Total de equipos
-        equipos_response = supabase.table("equipos").select("id, estado_operativo, costo_compra").execute()
-        equipos = equipos_response.data
-        
-        total_equipos = len(equipos)
-        equipos_operativos = len([e for e in equipos if e.get('estado_operativo') == 'operativo'])
-        equipos_reparacion = len([e for e in equipos if e.get('estado_operativo') == 'en_reparacion'])
-        
-        # Calcular tasa de disponibilidad
-        tasa_disponibilidad = round((equipos_operativos / total_equipos * 100), 2) if total_equipos > 0 else 0
-        
-        # Valor del inventario
-        valor_inventario = sum([e.get('costo_compra', 0) or 0 for e in equipos])
-        
-        # Mantenimientos del mes actual
-        hoy = date.today()
-        primer_dia_mes = hoy.replace(day=1)
-        
-        mantenimientos_response = supabase.table("mantenimientos").select("id, costo_total").gte("fecha_programada", str(primer_dia_mes)).lte("fecha_programada", str(hoy)).execute()
-        mantenimientos = mantenimientos_response.data
-        
-        mantenimientos_mes = len(mantenimientos)
-        costo_mantenimiento_mes = sum([m.get('costo_total', 0) or 0 for m in mantenimientos])
-        
-        return {
-            "total_equipos": total_equipos,
-            "equipos_operativos": equipos_operativos,
-            "equipos_reparacion": equipos_reparacion,
-            "tasa_disponibilidad": tasa_disponibilidad,
-            "valor_inventario": valor_inventario,
-            "mantenimientos_mes": mantenimientos_mes,
-            "costo_mantenimiento_mes": costo_mantenimiento_mes
-        }
+        return leer_dashboard()
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/dashboard/reconciliar")
+async def reconciliar_dashboard(corregir: bool = True):
+    """Verificar los agregados del dashboard contra un recálculo completo"""
+    try:
+        return reconciliar_agregados(corregir)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/bundle")
+def get_bundle(include: Optional[str] = None):
+    """Varios reportes de equipos a partir de las agrupaciones del snapshot en memoria"""
+    secciones = [x.strip() for x in include.split(",") if x.strip()] if include else list(AGRUPACIONES)
+    desconocidas = [x for x in secciones if x not in AGRUPACIONES]
+    if desconocidas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Secciones no válidas: {', '.join(desconocidas)} (disponibles: {', '.join(AGRUPACIONES)})"
+        )
+    
+    try:
+        return {seccion: agrupacion_snapshot(seccion) for seccion in secciones}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/equipos-por-ubicacion")
-async def get_equipos_por_ubicacion():
+def get_equipos_por_ubicacion():
     """Obtener reporte de equipos por ubicación"""
     try:
-        response = supabase.table("equipos").select("ubicacion_actual_id, ubicaciones(edificio, aula_oficina)").execute()
-        
-        # Agrupar por ubicación
-        ubicaciones_dict = {}
-        for equipo in response.data:
-            if equipo.get('ubicaciones'):
-                ubicacion_nombre = f"{equipo['ubicaciones']['edificio']} - {equipo['ubicaciones']['aula_oficina']}"
-                ubicaciones_dict[ubicacion_nombre] = ubicaciones_dict.get(ubicacion_nombre, 0) + 1
-        
-        # Convertir a lista
-        resultado = [{"ubicacion": k, "cantidad": v} for k, v in ubicaciones_dict.items()]
-        resultado.sort(key=lambda x: x['cantidad'], reverse=True)
-        
-        return resultado
+        return agrupacion_snapshot("ubicacion")
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/equipos-por-estado")
-async def get_equipos_por_estado():
+def get_equipos_por_estado():
     """Obtener reporte de equipos por estado operativo"""
     try:
-        response = supabase.table("equipos").select("estado_operativo").execute()
-        
-        # Agrupar por estado
-        estados_dict = {}
-        for equipo in response.data:
-            estado = equipo.get('estado_operativo', 'sin_estado')
-            estados_dict[estado] = estados_dict.get(estado, 0) + 1
-        
-        # Convertir a lista
-        resultado = [{"estado": k, "cantidad": v} for k, v in estados_dict.items()]
-        resultado.sort(key=lambda x: x['cantidad'], reverse=True)
-        
-        return resultado
+        return agrupacion_snapshot("estado")
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/costos-mantenimiento")
-async def get_costos_mantenimiento():
-    """Obtener reporte de costos de mantenimiento por mes"""
+def get_costos_mantenimiento(
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    por_categoria: bool = False
+):
+    """Obtener reporte de costos de mantenimiento por mes (rango YYYY-MM, por defecto 12 meses)"""
+    inicio, fin = rango_meses(desde, hasta)
+    
     try:
-        # Obtener mantenimientos de los últimos 12 meses
-        hoy = date.today()
-        hace_12_meses = hoy - timedelta(days=365)
-        
-        response = supabase.table("mantenimientos").select("fecha_programada, costo_total, tipo").gte("fecha_programada", str(hace_12_meses)).execute()
-        
-        # Agrupar por mes
-        meses_dict = {}
-        for mant in response.data:
-            if mant.get('fecha_programada') and mant.get('costo_total'):
-                try:
-                    fecha = datetime.strptime(mant['fecha_programada'], '%Y-%m-%d')
-                    mes_anio = fecha.strftime('%Y-%m')
-                    
-                    if mes_anio not in meses_dict:
-                        meses_dict[mes_anio] = {"preventivo": 0, "correctivo": 0}
-                    
-                    tipo = mant.get('tipo', 'correctivo')
-                    meses_dict[mes_anio][tipo] += mant['costo_total']
-                except:
-                    pass
+        filas = leer_costos_mensuales(inicio, fin)
         
-        # Convertir a lista
-        resultado = []
-        for mes, costos in sorted(meses_dict.items()):
-            resultado.append({
-                "mes": mes,
-                "costo_preventivo": costos['preventivo'],
-                "costo_correctivo": costos['correctivo'],
-                "costo_total": costos['preventivo'] + costos['correctivo']
-            })
+        categorias = None
+        if por_categoria:
+            response = supabase.table("categorias_equipos").select("id, nombre").execute()
+            categorias = {c['id']: c['nombre'] for c in response.data}
         
-        return resultado
+        return resumir_costos_mensuales(filas, categorias)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/antiguedad-equipos")
-async def get_antiguedad_equipos():
+def get_antiguedad_equipos():
     """Obtener reporte de antigüedad de equipos"""
     try:
-        response = supabase.table("equipos").select("id, codigo_inventario, nombre, fecha_compra").execute()
-        
-        hoy = date.today()
-        
-        # Clasificar por antigüedad
-        antiguedad_dict = {
-            "0-1 años": 0,
-            "1-3 años": 0,
-            "3-5 años": 0,
-            "5+ años": 0,
-            "sin_fecha": 0
-        }
-        
-        for equipo in response.data:
-            if equipo.get('fecha_compra'):
-                try:
-                    fecha_compra = datetime.strptime(equipo['fecha_compra'], '%Y-%m-%d').date()
-                    antiguedad_dias = (hoy - fecha_compra).days
-                    antiguedad_anios = antiguedad_dias / 365
-                    
-                    if antiguedad_anios < 1:
-                        antiguedad_dict["0-1 años"] += 1
-                    elif antiguedad_anios < 3:
-                        antiguedad_dict["1-3 años"] += 1
-                    elif antiguedad_anios < 5:
-                        antiguedad_dict["3-5 años"] += 1
-                    else:
-                        antiguedad_dict["5+ años"] += 1
-                except:
-                    antiguedad_dict["sin_fecha"] += 1
-            else:
-                antiguedad_dict["sin_fecha"] += 1
-        
-        # Convertir a lista
-        resultado = [{"rango": k, "cantidad": v} for k, v in antiguedad_dict.items()]
-        
-        return resultado
+        return agrupacion_snapshot("antiguedad")
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/equipos-por-categoria")
-async def get_equipos_por_categoria():
+def get_equipos_por_categoria():
     """Obtener reporte de equipos por categoría"""
     try:
-        response = supabase.table("equipos").select("*, categorias_equipos(nombre)").execute()
-        
-        # Agrupar por categoría
-        categorias_dict = {}
-        for equipo in response.data:
-            if equipo.get('categorias_equipos'):
-                categoria = equipo['categorias_equipos']['nombre']
-                categorias_dict[categoria] = categorias_dict.get(categoria, 0) + 1
-        
-        # Convertir a lista
-        resultado = [{"categoria": k, "cantidad": v} for k, v in categorias_dict.items()]
-        resultado.sort(key=lambda x: x['cantidad'], reverse=True)
-        
-        return resultado
+        return agrupacion_snapshot("categoria")
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/valor-por-categoria")
-async def get_valor_por_categoria():
+def get_valor_por_categoria():
     """Obtener valor de inventario por categoría"""
     try:
-        response = supabase.table("equipos").select("*, categorias_equipos(nombre)").execute()
-        
-        # Agrupar por categoría
-        categorias_dict = {}
-        for equipo in response.data:
-            if equipo.get('categorias_equipos'):
-                categoria = equipo['categorias_equipos']['nombre']
-                costo = equipo.get('costo_compra', 0) or 0
-                categorias_dict[categoria] = categorias_dict.get(categoria, 0) + costo
-        
-        # Convertir a lista
-        resultado = [{"categoria": k, "valor_total": v} for k, v in categorias_dict.items()]
-        resultado.sort(key=lambda x: x['valor_total'], reverse=True)
-        
-        return resultado
+        return agrupacion_snapshot("valor")
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/pivot")
+def pivot(consulta: ConsultaPivot):
+    """Consulta ad-hoc: dimensiones, medidas, filtros y granularidad temporal sobre los hechos"""
+    validar_consulta_pivot(consulta)
+    try:
+        return consultar_pivot(consulta)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/pivot/catalogo")
+def pivot_catalogo():
+    """Dimensiones, medidas y granularidades disponibles por hecho"""
+    return {
+        "hechos": {
+            nombre: {
+                "dimensiones": hecho['dimensiones'] + ["periodo"],
+                "medidas": list(hecho['medidas']),
+                "columna_fecha": hecho['fecha']
+            }
+            for nombre, hecho in HECHOS_PIVOT.items()
+        },
+        "granularidades": list(GRANULARIDADES)
+    }
+
+@app.get("/export/pack")
+def export_pack(formato: str = "pdf"):
+    """Paquete de gestión mensual (todas las secciones) en un solo PDF o XLSX"""
+    if formato not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Formato no válido (disponibles: {', '.join(MEDIA_TYPES)})")
+    
+    descriptor, ruta = tempfile.mkstemp(suffix=f".{formato}")
+    os.close(descriptor)
+    try:
+        generar_pack(formato, {}, ruta)
+    except Exception as e:
+        eliminar_archivo(ruta)
+        raise HTTPException(status_code=500, detail=f"Error al exportar: {str(e)}")
+    
+    return FileResponse(
+        ruta,
+        media_type=MEDIA_TYPES[formato],
+        filename=f"paquete_gestion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}",
+        background=BackgroundTask(eliminar_archivo, ruta)
+    )
+
+@app.post("/jobs")
+def submit_job(solicitud: JobCreate):
+    """Encolar la generación de un reporte; devuelve el id del job"""
+    try:
+        return publicar_job(crear_job(solicitud))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs")
+def list_jobs(limit: int = 50):
+    """Listar los jobs más recientes"""
+    return [publicar_job(job) for job in list(jobs.values())[-limit:][::-1]]
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, esperar: float = 0):
+    """Estado de un job; con esperar>0 espera (long-poll) hasta que termine"""
+    job = obtener_job(job_id)
+    if esperar > 0:
+        job['evento'].wait(min(esperar, REPORT_JOBS_MAX_ESPERA_SECONDS))
+    return publicar_job(job)
+
+@app.get("/jobs/{job_id}/download")
+def download_job(job_id: str):
+    """Descargar el documento generado por un job"""
+    job = obtener_job(job_id)
+    if job['estado'] != "completado":
+        raise HTTPException(status_code=409, detail=f"El job no está completado (estado: {job['estado']})")
+    if not os.path.exists(job['ruta']):
+        raise HTTPException(status_code=410, detail="El resultado ya no está disponible, vuelva a solicitar el reporte")
+    
+    nombre = job['parametros'].get("seccion") or job['parametros'].get("tabla") or job['tipo']
+    return FileResponse(
+        job['ruta'],
+        media_type=MEDIA_TYPES[job['formato']],
+        filename=f"reporte_{nombre}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{job['formato']}"
+    )
+
+@app.get("/export/excel")
+def export_excel(tipo: str = "equipos"):
+    """Exportar un listado completo a XLSX en memoria acotada y enviarlo como descarga"""
+    if tipo not in LISTADOS_EXCEL:
+        raise HTTPException(status_code=400, detail=f"Tipo de reporte no válido (disponibles: {', '.join(LISTADOS_EXCEL)})")
+    
+    descriptor, ruta = tempfile.mkstemp(suffix=".xlsx")
+    os.close(descriptor)
+    try:
+        escribir_listado_excel(tipo, ruta)
+    except Exception as e:
+        eliminar_archivo(ruta)
+        raise HTTPException(status_code=500, detail=f"Error al exportar: {str(e)}")
+    
+    # El archivo temporal se envía por bloques y se elimina al terminar la respuesta
+    return FileResponse(
+        ruta,
+        media_type=MEDIA_TYPES["xlsx"],
+        filename=f"{tipo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+        background=BackgroundTask(eliminar_archivo, ruta)
+    )
+
+@app.get("/snapshot")
+def get_snapshot():
+    """Estado del snapshot columnar: edad, filas y memoria"""
+    try:
+        obtener_snapshot()
+        return info_snapshot()
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/snapshot/refresh")
+def refresh_snapshot(completo: bool = False):
+    """Forzar el refresco del snapshot (incremental o recarga completa)"""
+    try:
+        obtener_snapshot(forzar=True, completo=completo)
+        return info_snapshot()
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============================================
+# STARTUP EVENTS
+# ============================================
+
+@app.on_event("startup")
+async def startup_event():
+    if DASHBOARD_RECONCILE_INTERVAL_MINUTES > 0:
+        asyncio.create_task(job_reconciliacion())
+
+@app.on_event("shutdown")
+def shutdown_event():
+    jobs_executor.shutdown(wait=False, cancel_futures=True)
+    if pool_graficos is not None:
+        pool_graficos.shutdown(wait=False, cancel_futures=True)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8004)